@@ -0,0 +1,243 @@
+"""Captures the screen straight into memory"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+from mss import mss
+
+from src.clock import get_clock
+from src.helper import Coordinates
+from src.listener import input_epoch
+
+
+class CaptureBackend(ABC):
+    """Captures the monitor screen or a region of it as BGR images"""
+
+    @abstractmethod
+    def grab(self, region: Optional[Coordinates] = None) -> np.ndarray:
+        """
+        Captures the monitor screen or only a region of it.
+
+        :param region: The region to capture, in monitor coordinates.
+            Captures the whole monitor when omitted.
+        :return: The BGR screen image
+        """
+
+    def close(self):
+        """Releases the capture resources"""
+
+
+class ScreenCapture(CaptureBackend):
+    """
+    Grabs the screen into a BGR array using a single long-lived mss
+    instance. No image is encoded or decoded on the way.
+
+    Every capture returns a new frame, the BGRA to BGR conversion writes it
+    straight from the mss buffer, so frames kept by the frame cache, the
+    frame ring or the callers are never overwritten.
+
+    :param int monitor: The mss monitor to capture
+    :param str debug_path: Also write every capture to this png file.
+    """
+
+    def __init__(self, monitor: int = 1, debug_path: Optional[str] = None):
+        self._mss = None
+        self._monitor = monitor
+        self.debug_path = debug_path
+
+    @property
+    def sct(self):
+        """Returns the mss instance, created on first use"""
+        if self._mss is None:
+            self._mss = mss()
+        return self._mss
+
+    def grab(self, region: Optional[Coordinates] = None) -> np.ndarray:
+        monitor = self.sct.monitors[self._monitor]
+        if region is not None:
+            monitor = {
+                "left": monitor["left"] + region.start_x,
+                "top": monitor["top"] + region.start_y,
+                "width": region.end_x - region.start_x,
+                "height": region.end_y - region.start_y,
+            }
+        shot = self.sct.grab(monitor)
+        # view the raw BGRA pixels without copying them
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8). \
+            reshape(shot.height, shot.width, 4)
+        frame = cv.cvtColor(bgra, cv.COLOR_BGRA2BGR)
+        if self.debug_path:
+            cv.imwrite(self.debug_path, frame)
+        return frame
+
+    def close(self):
+        if self._mss is not None:
+            self._mss.close()
+            self._mss = None
+
+
+class FrameCache:
+    """
+    Keeps the last captured frame for a short time, so consecutive reads of
+    the screen with no mouse or keyboard action in between reuse it.
+
+    :param float ttl: How long a frame stays valid in seconds. 0 disables
+        the cache.
+    """
+
+    def __init__(self, ttl: float = 0.3):
+        self.ttl = ttl
+        self._frame: Optional[np.ndarray] = None
+        self._region: Optional[Coordinates] = None
+        self._captured_at = 0.0
+        self._epoch = None
+
+    def invalidate(self):
+        """Drops the cached frame"""
+        self._frame = None
+
+    def _is_valid(self) -> bool:
+        """Checks if the cached frame still shows the current screen"""
+        return self._frame is not None and \
+            self._epoch == input_epoch() and \
+            get_clock().now() - self._captured_at <= self.ttl
+
+    def get(self, region: Optional[Coordinates]) -> Optional[np.ndarray]:
+        """
+        Returns the region from the cached frame if the frame is still
+        valid and covers it.
+
+        :param region: The region of the monitor, None for all of it.
+        :return: The cached image of the region or None.
+        """
+        if not self._is_valid():
+            return None
+        cached = self._region
+        if region == cached:
+            return self._frame
+        if region is None or cached is None:
+            return None
+        if region.start_x < cached.start_x or \
+                region.start_y < cached.start_y or \
+                region.end_x > cached.end_x or \
+                region.end_y > cached.end_y:
+            return None
+        return self._frame[region.start_y - cached.start_y:
+                           region.end_y - cached.start_y,
+                           region.start_x - cached.start_x:
+                           region.end_x - cached.start_x]
+
+    def put(self, region: Optional[Coordinates], frame: np.ndarray):
+        """Stores a freshly captured frame of a region"""
+        if not self.ttl:
+            return
+        self._frame = frame
+        self._region = region
+        self._captured_at = get_clock().now()
+        self._epoch = input_epoch()
+
+
+class FrameRing:
+    """
+    A fixed-size ring buffer of timestamped frames. The frame slots are
+    allocated once and overwritten in turn.
+
+    :param int capacity: The number of frames kept
+    """
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self._slots: List[Optional[np.ndarray]] = [None] * capacity
+        self._timestamps = [0.0] * capacity
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def write(self, timestamp: float, frame: np.ndarray):
+        """Copies a frame into the next slot of the ring"""
+        with self._lock:
+            index = self._count % self.capacity
+            slot = self._slots[index]
+            if slot is None or slot.shape != frame.shape:
+                slot = np.empty_like(frame)
+                self._slots[index] = slot
+            np.copyto(slot, frame)
+            self._timestamps[index] = timestamp
+            self._count += 1
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        """Returns a copy of the newest frame and its timestamp"""
+        with self._lock:
+            if not self._count:
+                return None
+            index = (self._count - 1) % self.capacity
+            return self._timestamps[index], self._slots[index].copy()
+
+    def frames_since(self, timestamp: float) -> List[Tuple[float, np.ndarray]]:
+        """
+        Returns copies of all the frames captured after a point in time.
+
+        :param timestamp: A time.monotonic timestamp
+        :return: The (timestamp, frame) pairs, oldest first.
+        """
+        with self._lock:
+            first = max(0, self._count - self.capacity)
+            frames = []
+            for count in range(first, self._count):
+                index = count % self.capacity
+                if self._timestamps[index] > timestamp:
+                    frames.append((self._timestamps[index],
+                                   self._slots[index].copy()))
+            return frames
+
+
+class CaptureStream(threading.Thread):
+    """
+    A background thread capturing a region of the screen at a fixed frame
+    rate into a ring buffer, so callers can look at the recent frames
+    without waiting for a capture.
+
+    :param Coordinates region: The region of the monitor to capture
+    :param float fps: The number of frames captured per second
+    :param int capacity: The number of recent frames kept
+    :param capture_factory: Creates the capture backend of the thread
+    """
+
+    def __init__(self, region: Coordinates, fps: float = 10,
+                 capacity: int = 32,
+                 capture_factory: Callable[[], CaptureBackend] = ScreenCapture):
+        super().__init__(name="CaptureStreamThread", daemon=True)
+        self.region = region
+        self.capture_factory = capture_factory
+        self.interval = 1.0 / fps
+        self.ring = FrameRing(capacity)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # mss handles can only be used from the thread that created them
+        capture = self.capture_factory()
+        try:
+            while not self._stop_event.is_set():
+                started_at = time.monotonic()
+                self.ring.write(started_at, capture.grab(self.region))
+                self._stop_event.wait(
+                    max(0.0, self.interval -
+                        (time.monotonic() - started_at)))
+        finally:
+            capture.close()
+
+    def stop(self):
+        """Stops capturing and waits for the thread to finish"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        """Returns the newest frame and its timestamp"""
+        return self.ring.latest()
+
+    def frames_since(self, timestamp: float) -> List[Tuple[float, np.ndarray]]:
+        """Returns all the frames captured after a time.monotonic timestamp"""
+        return self.ring.frames_since(timestamp)
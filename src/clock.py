@@ -0,0 +1,67 @@
+"""The clock all the waiting of the bot goes through"""
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class Clock(ABC):
+    """Tells the time in seconds and waits for a while"""
+
+    @abstractmethod
+    def now(self) -> float:
+        """Returns the current time in seconds"""
+
+    @abstractmethod
+    def sleep(self, seconds: float):
+        """Waits for a number of seconds"""
+
+    def sleep_until(self, deadline: float):
+        """Waits until the clock reaches a time"""
+        self.sleep(deadline - self.now())
+
+
+class SystemClock(Clock):
+    """The monotonic wall clock"""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    A clock that only moves when slept on, so hours of waiting take no
+    time at all.
+
+    :param float start: The time the clock starts at
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self._now += seconds
+
+
+_clock: Optional[Clock] = None
+
+
+def get_clock() -> Clock:
+    """Returns the clock shared by the game activities"""
+    global _clock
+    if _clock is None:
+        _clock = SystemClock()
+    return _clock
+
+
+def set_clock(clock: Clock):
+    """Replaces the clock shared by the game activities"""
+    global _clock
+    _clock = clock
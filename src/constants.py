@@ -12,6 +12,12 @@ RIGHT_IMAGE = 3
 
 ZOMBIE_MENU = 6
 
+# Screen states told apart by the ScreenClassifier
+SCREEN_HOME_INSIDE = "home-inside"
+SCREEN_HOME_OUTSIDE = "home-outside"
+SCREEN_EXIT_DIALOG = "exit-dialog"
+SCREEN_CONFIRM_POPUP = "confirm-popup"
+
 # Farming type constants
 FARM_FOOD = 1
 FARM_OIL = 2
@@ -0,0 +1,86 @@
+"""Persistent store of the UI element coordinates found in the game"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from src.helper import Coordinates
+
+
+class CoordinateStore:
+    """
+    Keeps the coordinates of the game UI elements in a versioned json file,
+    keyed by the emulator resolution and the element name. The coordinates
+    are stored relative to the emulator window, so they stay valid when the
+    window moves.
+
+    :param str path: The json file of the store
+    """
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._elements: Dict[str, Dict[str, list]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, list]]:
+        """Reads the store file, ignoring it if unreadable or outdated"""
+        try:
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {}
+        return data.get("resolutions", {})
+
+    def save(self):
+        """Writes the store file"""
+        with self._lock:
+            data = {"version": self.VERSION, "resolutions": self._elements}
+            temp_path = self.path.with_suffix('.tmp')
+            with open(temp_path, 'w') as file:
+                json.dump(data, file, indent=2, sort_keys=True)
+            # replace the file at once so a crash never leaves half of it
+            os.replace(temp_path, self.path)
+
+    @staticmethod
+    def _resolution_key(resolution: Tuple[int, int]) -> str:
+        return f"{resolution[0]}x{resolution[1]}"
+
+    def get(self, resolution: Tuple[int, int],
+            element: str) -> Optional[Coordinates]:
+        """
+        Returns the stored coordinates of an element.
+
+        :param resolution: The emulator window width and height
+        :param element: The element name
+        :return: The coordinates relative to the emulator window or None.
+        """
+        cords = self._elements.get(
+            self._resolution_key(resolution), {}).get(element)
+        return Coordinates(*cords) if cords else None
+
+    def put(self, resolution: Tuple[int, int], element: str,
+            cords: Coordinates):
+        """Stores the coordinates of an element relative to the window"""
+        with self._lock:
+            self._elements.setdefault(
+                self._resolution_key(resolution), {})[element] = \
+                [int(value) for value in cords]
+        self.save()
+
+    def discard(self, resolution: Tuple[int, int], element: str):
+        """Removes the stored coordinates of an element"""
+        with self._lock:
+            removed = self._elements.get(
+                self._resolution_key(resolution), {}).pop(element, None)
+        if removed is not None:
+            self.save()
+
+    def clear(self):
+        """Removes all the stored coordinates"""
+        with self._lock:
+            self._elements = {}
+        self.save()
@@ -27,4 +27,10 @@ class FarmingException(Exception):
 class ProfileException(Exception):
     """
     Exception class for Profile relating activities
-    """
\ No newline at end of file
+    """
+
+
+class SessionException(Exception):
+    """
+    Exception class for recording and replaying sessions
+    """
@@ -5,6 +5,7 @@ from typing import Tuple, Optional
 import cv2
 import numpy as np
 
+from src.clock import get_clock
 from src.constants import INSIDE_VIEW, OUTSIDE_VIEW, BOTTOM_IMAGE, TOP_IMAGE, \
     RIGHT_IMAGE, LEFT_IMAGE
 from src.exceptions import FarmingException, RadarException
@@ -69,6 +70,17 @@ class Farm:
             self.get_fleet_count()
         return self._current_fleet
 
+    @property
+    def fleets_out(self) -> Optional[int]:
+        """
+        Returns the fleets out read from the garage, None when the
+        garage was not found and the fleets are not known
+        :return: Fleets out
+        """
+        if self._default_garage_used:
+            return None
+        return self.current_fleet
+
     def find_garage(self) -> Coordinates:
         """
         Finds the garage location in the city and return the center position.
@@ -92,10 +104,10 @@ class Farm:
         # Drag the mouse left three times
         for i in range(count):
             self.launcher.mouse.drag(200, 0)
-            time.sleep(0.5)
+            get_clock().sleep(0.5)
             self.launcher.mouse.set_position(center_position.x,
                                              center_position.y)
-            time.sleep(0.3)
+            get_clock().sleep(0.3)
         self.launcher.mouse.drag(0, -150)
         # Now we should be in the garage view.
         garage_image, garage_area_cords_relative = \
@@ -259,7 +271,7 @@ class Farm:
                                          garage_cords.start_y)
         self.launcher.mouse.move(garage_center)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
         # now find the fleet army button
         garage_image, garage_area_cords_relative = \
             self.launcher.get_screen_section(50, BOTTOM_IMAGE)
@@ -279,7 +291,7 @@ class Farm:
                                          cords_relative.start_y)
         self.launcher.mouse.move(fleet_center)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
 
         # now we should have the fleet screen.
         fleet_wounded_data, units_data = self.extract_fleet_values()
@@ -290,6 +302,31 @@ class Farm:
         # reset view back
         self.launcher.keyboard.back()
 
+    def _get_gather_area(self, source: np.ndarray = None) -> \
+            Tuple[np.ndarray, Coordinates]:
+        """
+        Returns the area of the game screen where the gather button shows.
+
+        :param source: A game screen frame. Captures the screen if omitted.
+        """
+        gather_area_image, area_cords_relative = \
+            self.launcher.get_screen_section(60, TOP_IMAGE, source)
+        gather_area_image, area_cords_relative = \
+            self.launcher.get_screen_section(45, BOTTOM_IMAGE,
+                                             gather_area_image,
+                                             area_cords_relative)
+        # the screen frame is shared with the frame cache
+        return gather_area_image.copy(), area_cords_relative
+
+    @staticmethod
+    def _get_button_area(gather_area_image: np.ndarray) -> np.ndarray:
+        """Blanks out everything but the right side of the gather area"""
+        zeros = np.zeros_like(gather_area_image)
+        t_h, t_w, _ = gather_area_image.shape
+        zeros[:, int(0.5 * t_w):int(0.9 * t_w)] = \
+            gather_area_image[:, int(0.5 * t_w):int(0.9 * t_w)]
+        return zeros
+
     @retry(exception=FarmingException,
            message="No farm gather button found",
            attempts=4)
@@ -304,45 +341,41 @@ class Farm:
         self.launcher.mouse.set_position(button.start_x, button.start_y)
         center = GameHelper.get_center(button)
         self.launcher.mouse.move(*center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
         self.launcher.mouse.click()
-        time.sleep(2)
-
-        # take 3 different snapshots
-        snapshot_data = []
-        gather_area_image = None
-        for i in range(3):
-            gather_area_image, area_cords_relative = \
-                self.launcher.get_screen_section(60, TOP_IMAGE)
-            gather_area_image, area_cords_relative = \
-                self.launcher.get_screen_section(45, BOTTOM_IMAGE,
-                                                 gather_area_image,
-                                                 area_cords_relative)
-            gather_data = (gather_area_image, area_cords_relative)
-            snapshot_data.append(gather_data)
-            time.sleep(0.5)
-        zeros = np.zeros_like(gather_area_image)
-        t_h, t_w, _ = gather_area_image.shape
-        # now iterate through and find the best match
-        for gather_image, area_cords in snapshot_data:
-            target_area = gather_image[:,
-                          int(0.5 * t_w):int(0.9 * t_w)
-                          ]
-            zeros[:, int(0.5 * t_w):int(0.9 * t_w)] = target_area
-            self.launcher.log_message(
-                '-------- Finding the farm gather button --------')
-            cords = self.launcher.find_target(
-                zeros,
-                self.launcher.target_templates('farming'),
-                threshold=0.2
-            )
-            if cords:
-                break
+        clicked_at = time.monotonic()
+        get_clock().sleep(2)
+
+        stream = self.launcher.capture_stream
+        if stream:
+            # scan all the frames streamed since the click instead
+            snapshot_data = [self._get_gather_area(frame) for _, frame in
+                             stream.frames_since(clicked_at)]
         else:
-            cv2.imwrite('../farming-gather-error.png', zeros)
+            # take 3 different snapshots
+            snapshot_data = []
+            for i in range(3):
+                snapshot_data.append(self._get_gather_area())
+                get_clock().sleep(0.5)
+
+        self.launcher.log_message(
+            '-------- Finding the farm gather button --------')
+        gather_templates = self.launcher.target_templates('farming')
+        found = self.launcher.scan_images(
+            snapshot_data,
+            lambda gather_data: self.launcher.find_target(
+                self._get_button_area(gather_data[0]),
+                gather_templates,
+                threshold=0.2
+            ))
+        if not found:
+            if snapshot_data:
+                cv2.imwrite('../farming-gather-error.png',
+                            self._get_button_area(snapshot_data[-1][0]))
             raise FarmingException("No farm gather button found")
+        (_, area_cords), cords = found
 
         cords_relative = GameHelper. \
             get_relative_coordinates(area_cords, cords)
@@ -351,9 +384,9 @@ class Farm:
         center = GameHelper.get_center(cords_relative)
         self.launcher.mouse.move(center)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
         self.launcher.mouse.click()
-        time.sleep(4)
+        get_clock().sleep(4)
 
         # We check for potential conflict
         # if conflict - cancel my fleet action.
@@ -423,11 +456,11 @@ class Farm:
             self.launcher.keyboard.back()
             raise FarmingException("Out of troops")
 
-    def all_out_farming(self):
+    def all_out_farming(self) -> int:
         """
         Sends all the available troops to go farm
 
-        :return:
+        :return: The number of fleets sent out
         """
         # get current and max fleet
         self.get_fleet_count()
@@ -440,7 +473,7 @@ class Farm:
 
         min_time = 2
 
-        def commence_farming():
+        def commence_farming() -> int:
             current_fleet = self.current_fleet
             while True:
                 if current_fleet < self.max_fleet:
@@ -455,17 +488,20 @@ class Farm:
                         raise error
                 else:
                     break
-                time.sleep(min_time)
+                get_clock().sleep(min_time)
+            return current_fleet - self.current_fleet
 
+        deployed = 0
         # Go farming only when we have available troops in the first place
         if self._idle_units and self._idle_units > 2000:
             self.launcher.log_message(
                 f"------ City has a total of {self._idle_units} idle units "
                 f"----------")
-            commence_farming()
+            deployed = commence_farming()
         # go farming if idle units not available
         elif self._idle_units is None:
-            commence_farming()
+            deployed = commence_farming()
 
         self.launcher.log_message(
             '------ All troops deployed for farming -------')
+        return deployed
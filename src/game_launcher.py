@@ -1,22 +1,31 @@
 import subprocess
-import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import cached_property
 from pathlib import Path
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Tuple, Callable, Any, \
+    Deque
 
 import cv2 as cv
-import imutils
 import numpy as np
-from mss import mss
 from numpy import ndarray
 
+from src.capture import CaptureBackend, ScreenCapture, FrameCache, \
+    CaptureStream
+from src.clock import get_clock
+from src.coordinate_store import CoordinateStore
 from src.constants import BOTTOM_IMAGE, TOP_IMAGE, LEFT_IMAGE, INSIDE_VIEW, \
-    OUTSIDE_VIEW
+    OUTSIDE_VIEW, SCREEN_HOME_INSIDE, \
+    SCREEN_HOME_OUTSIDE, SCREEN_EXIT_DIALOG, SCREEN_CONFIRM_POPUP
 from src.exceptions import LauncherException
 from src.helper import Coordinates, GameHelper, retry, click_on_target
 from src.listener import MouseController, KeyboardController
+from src.matching import Matcher, ParallelMatcher
 from src.ocr import get_box_from_image
+from src.screen_state import ScreenClassifier
+from src.templates import TemplateRegistry, TemplateSet
 
 
 class GameLauncher:
@@ -30,6 +39,9 @@ class GameLauncher:
     cwd = Path(__file__).cwd()
 
     cache_file = cwd.joinpath("data", "game_cache.txt")
+    calibration_file = cwd.joinpath("data", "game_calibration.txt")
+    screen_states_file = cwd.joinpath("data", "screen_states.npz")
+    coordinates_file = cwd.joinpath("data", "ui_coordinates.json")
 
     _templates_path = {
         "app": str(cwd.joinpath("data", "app")),
@@ -70,17 +82,49 @@ class GameLauncher:
         "elite_zombie_skip": str(cwd.joinpath("data", "game",
                                               "elite_zombie_skip")),
     }
+    # targets matched against the android screen and not the game screen
+    _uncalibrated_targets = ("app", "game")
+    # swept over the home screen to calibrate the templates, one of them
+    # is always shown there and the view is switched to find the other
+    calibration_targets = ("city-icon", "outside-icon")
+    # how far apart the scales of the calibration targets may be, in parts
+    # of the larger one
+    calibration_tolerance = 0.05
     IMG_COLOR = cv.IMREAD_COLOR
+    # the reference scales searched by the full multi-scale sweep
+    sweep_scales = np.linspace(0.05, 1.0, 20)[::-1]
+    # how far around a remembered scale the first search goes
+    scale_band = 0.1
+    # recent hits searched first per target key and reference size
+    hit_history = 4
+    # padding of the recent hit windows, in parts of the hit size
+    hit_padding = 0.5
 
     location_finder_btn = None
-    location_cords_relative = None
 
     def __init__(self, mouse: MouseController,
                  keyboard: KeyboardController,
-                 enable_debug=True, cache: bool = False):
+                 enable_debug=True, cache: bool = False,
+                 reload_templates: bool = False,
+                 debug_capture: bool = False,
+                 frame_ttl: float = 0.3,
+                 capture_fps: float = None,
+                 match_workers: int = None,
+                 capture_factory: Callable[[], CaptureBackend] = None):
         self._app_templates = None
+        self._templates = TemplateRegistry()
+        self._templates.reload_on_mtime = reload_templates
         self.app_pid = None
-        self._mss = mss()
+        # creates the capture backends, the monitor screen by default
+        self._capture_factory = capture_factory
+        self._capture = capture_factory() if capture_factory else \
+            ScreenCapture(debug_path=self.screen_image_path
+                          if debug_capture else None)
+        # reuses frames between inputs, kept below the 0.5 secs the
+        # snapshot loops wait between captures
+        self._frame_cache = FrameCache(frame_ttl)
+        self._capture_fps = capture_fps
+        self._capture_stream: Optional[CaptureStream] = None
         self._debug = enable_debug
         self._app_coordinates: Optional[Coordinates] = None
         self._game_coordinates: Optional[Coordinates] = None
@@ -88,6 +132,22 @@ class GameLauncher:
         self._mouse = mouse
         self._keyboard = keyboard
         self._cache = cache
+        # factor between the emulator game screen and the templates
+        self._template_scale: Optional[float] = None
+        # winning scale per target key and reference size
+        self._scale_memory: Dict[Tuple[str, Tuple[int, int]], float] = {}
+        # most recent hit rectangles per target key and reference size
+        self._recent_hits: Dict[Tuple[str, Tuple[int, int]],
+                                Deque[Coordinates]] = {}
+        # find_target runs concurrently in scan_images
+        self._match_lock = threading.Lock()
+        # matching engine per template folder, the parallel sweep by
+        # default with a pool of match_workers threads
+        self._matchers: Dict[str, Matcher] = {}
+        self._default_matcher = ParallelMatcher(workers=match_workers)
+        self._screen_classifier = ScreenClassifier(
+            str(self.screen_states_file))
+        self._element_store = CoordinateStore(str(self.coordinates_file))
 
     @property
     def mouse(self):
@@ -120,24 +180,160 @@ class GameLauncher:
         """Clear the cache data"""
         with open(self.cache_file, 'w') as file:
             file.write("")
+        with open(self.calibration_file, 'w') as file:
+            file.write("")
+        self._element_store.clear()
+
+    def _load_cache_calibration(self) -> bool:
+        """Loads the saved template calibration and returns True or False"""
+        try:
+            with open(self.calibration_file, 'r') as file:
+                cache_data = file.readlines()
+                calibration_data = cache_data[0].strip().split(':')[-1]. \
+                    split(',')
+                scale = float(calibration_data[0])
+                width, height = int(calibration_data[1]), \
+                    int(calibration_data[2])
+        except Exception:
+            return False
+        start_x, start_y, end_x, end_y = self._app_coordinates
+        # only valid for the emulator size it was calibrated at
+        if (width, height) != (end_x - start_x, end_y - start_y):
+            return False
+        self._template_scale = scale
+        return True
+
+    def calibrate(self):
+        """
+        Works out the scale factor between the emulator game screen and the
+        game templates, so the templates can be pre-rescaled once and matched
+        at a single scale. The smallest template of the view icon shown on
+        the home screen is swept over it at all the scales, then the view is
+        switched to measure the other view icon and switched back. The
+        templates stay unscaled and no calibration is saved unless both
+        icons are found and agree within the calibration tolerance.
+        """
+        if self._cache and self._load_cache_calibration():
+            self.log_message(
+                "############## Using cached template calibration "
+                "##############")
+            return
+        self._template_scale = None
+        scales = {}
+        for shown in self.calibration_targets:
+            measured = self._measure_template_scale(
+                self.get_game_screen(), shown)
+            if measured:
+                break
+        else:
+            self.log_message("Calibration templates not found, the "
+                             "templates stay unscaled")
+            return
+        scales[shown], cords = measured
+        other, = set(self.calibration_targets) - {shown}
+        # the view icon switches the view, the other icon shows then
+        click_on_target(cords, self._app_coordinates, self._mouse,
+                        center=True)
+        measured = self.wait_until(
+            lambda: self._measure_template_scale(self.get_game_screen(),
+                                                 other),
+            timeout=10, interval=1)
+        if measured:
+            scales[other], cords = measured
+            click_on_target(cords, self._app_coordinates, self._mouse,
+                            center=True)
+            self.wait_until(
+                lambda: self._locate_target(
+                    self.get_game_screen(),
+                    self._calibration_template(shown), 0.55,
+                    np.array([1 / scales[shown]]), None),
+                timeout=10, interval=1)
+        # the frames grabbed while calibrating are not reused
+        self.invalidate_frame()
+        self.log_message(f"Calibration scales - {scales}")
+        if len(scales) < len(self.calibration_targets):
+            self.log_message(f"Calibration template {other} not found, the "
+                             "templates stay unscaled")
+            return
+        low, high = min(scales.values()), max(scales.values())
+        if high - low > self.calibration_tolerance * high:
+            self.log_message("Calibration templates disagree, the "
+                             "templates stay unscaled")
+            return
+        self._template_scale = (low + high) / 2
+        self.log_message(f"Template scale - {self._template_scale}")
+        start_x, start_y, end_x, end_y = self._app_coordinates
+
+        # save the calibration next to the cached coordinates
+        with open(self.calibration_file, 'w') as file:
+            file.write(f"Scale:{self._template_scale},"
+                       f"{end_x - start_x},{end_y - start_y}\n")
+
+    def _calibration_template(self, target: str) -> List[np.ndarray]:
+        """
+        Returns the smallest template of a calibration target. The templates
+        of a folder were cut at different sizes, the best scoring one would
+        measure the scale to its own size.
+        """
+        templates = self._templates.get(self._templates_path[target])
+        return [min(templates,
+                    key=lambda template: template.shape[0] *
+                    template.shape[1])]
 
-    def start_game(self):
+    def _measure_template_scale(self, game_screen: np.ndarray, target: str) \
+            -> Optional[Tuple[float, Coordinates]]:
+        """
+        Sweeps the smallest template of a calibration target over the game
+        screen at all the scales, then refines between the neighbouring
+        sweep scales.
+
+        :return: The scale of the template on the screen and where it was
+            found, or None when it is not found.
+        """
+        template = self._calibration_template(target)
+        t_h, t_w = template[0].shape[:2]
+        cords = self._locate_target(game_screen, template, 0.55,
+                                    self.sweep_scales, None)
+        if not cords:
+            return None
+        step = abs(self.sweep_scales[0] - self.sweep_scales[1])
+        fine = np.clip(t_w / (cords.end_x - cords.start_x) +
+                       np.linspace(-step, step, 11), 0.05, 1.0)
+        cords = self._locate_target(game_screen, template, 0.55,
+                                    np.unique(fine)[::-1], None) or cords
+        return ((cords.end_x - cords.start_x) / t_w +
+                (cords.end_y - cords.start_y) / t_h) / 2, cords
+
+    def start_game(self, app_coordinates: Coordinates = None):
         """
         Starts and prep the AoZ game app
+
+        :param app_coordinates: The emulator screen on the monitor, when
+            it is already known, e.g. for a synthetic game. The emulator is
+            then neither launched nor searched for.
         :return:
         """
-        self.log_message(
-            "############## Launching Bluestack App now ##############")
-        self.launch_app()
-
-        if self._cache and self._load_cache_coordinates():
+        self.preload_templates()
+        if app_coordinates:
+            self._app_coordinates = app_coordinates
+            self.log_message(f"App Coordinates - {self._app_coordinates}")
+        else:
             self.log_message(
-                "############## Using cached coordinates for app "
+                "############## Launching Bluestack App now "
                 "##############")
-        else:
-            self.log_message("############## Finding the app screen "
-                             "##############")
-            self.find_app()
+            self.launch_app()
+
+            if self._cache and self._load_cache_coordinates():
+                self.log_message(
+                    "############## Using cached coordinates for app "
+                    "##############")
+            else:
+                self.log_message("############## Finding the app screen "
+                                 "##############")
+                self.find_app()
+
+        if self._capture_fps:
+            self.start_capture_stream(self._capture_fps)
 
         # check if the game app is loaded or not.
         self.log_message(
@@ -147,6 +343,10 @@ class GameLauncher:
         self.log_message("############# Launching game now ##############")
         self.launch_aoz()
 
+        self.log_message(
+            "############# Calibrating the templates ##############")
+        self.calibrate()
+
     def launch_app(self):
         """Launches the main android bluestack app"""
         self.app_pid = GameHelper.is_app_running()
@@ -158,8 +358,10 @@ class GameLauncher:
                 self.app_pid = pid
             else:
                 raise LauncherException("Error launching bluestack app")
-            # wait for the app to be ready.
-            time.sleep(20)
+            # wait for the android screen with the app to show up
+            self.wait_until(lambda: self.find_target(
+                self.get_screenshot(), self.target_templates('app')),
+                timeout=20, interval=1)
 
     def reset_to_home(self):
         """Use for resetting the game screen back to city home"""
@@ -168,29 +370,33 @@ class GameLauncher:
         self.mouse.set_position(self._app_coordinates.start_x + 50,
                                 self._app_coordinates.start_y + 50)
         self.mouse.click()
-        time.sleep(2)
+        self.wait_until_stable(timeout=2)
 
         self.check_special_case_reset()
 
         while attempts:
             # go back one view
             self.keyboard.back()
-            time.sleep(2)
-            exit_area_image, area_cords_relative = \
-                self.get_screen_section(60, BOTTOM_IMAGE)
-            exit_area_image, area_cords_relative = \
-                self.get_screen_section(30, TOP_IMAGE,
-                                        exit_area_image,
-                                        area_cords_relative)
-            # search for target
-            custom_config = r'--oem 3 --psm 3'
-            white_min = (193, 193, 193)
-            white_max = (255, 255, 255)
-            white_channel = cv.inRange(exit_area_image, white_min,
-                                       white_max)
-            location = self.find_ocr_target("Exit", white_channel,
-                                            custom_config)
-            if location:
+            self.wait_until_stable(timeout=2)
+            game_screen = self.get_game_screen().copy()
+            screen_state = self.classify_screen(game_screen)
+            if screen_state != SCREEN_EXIT_DIALOG:
+                # only a known exit dialog skips the search for its text,
+                # it sits over the home screen and can be taken for it
+                exit_area_image, _ = \
+                    self.get_screen_section(60, BOTTOM_IMAGE, game_screen)
+                exit_area_image, _ = \
+                    self.get_screen_section(30, TOP_IMAGE, exit_area_image)
+                custom_config = r'--oem 3 --psm 3'
+                white_min = (193, 193, 193)
+                white_max = (255, 255, 255)
+                white_channel = cv.inRange(exit_area_image, white_min,
+                                           white_max)
+                if self.find_ocr_target("Exit", white_channel,
+                                        custom_config):
+                    screen_state = SCREEN_EXIT_DIALOG
+                    self.learn_screen(screen_state, game_screen)
+            if screen_state == SCREEN_EXIT_DIALOG:
                 # now in exit view
                 self.keyboard.back()
                 self.log_message(
@@ -200,7 +406,9 @@ class GameLauncher:
 
     def check_special_case_reset(self):
         # First we check for a case were either the Confirm or Cancel popup
-        # shows blocking the use of 'esc' keyword
+        # shows blocking the use of 'esc' keyword. The popups sit over the
+        # home screen, so a home screen label does not rule them out.
+        game_screen = self.get_game_screen().copy()
         confirm_area_image, area_cords_relative = self.get_confirm_view()
         # find the target and click on it.
         custom_config = r'--oem 3 --psm 6'
@@ -210,10 +418,11 @@ class GameLauncher:
         special_case = self.find_ocr_target("Cancel", white_channel,
                                             custom_config)
         if special_case:
+            self.learn_screen(SCREEN_CONFIRM_POPUP, game_screen)
             click_on_target(special_case,
                             area_cords_relative,
                             self.mouse)
-            time.sleep(3)
+            self.wait_until_stable(timeout=3)
 
         # special case two --check for the presence of okay
         okay_area_image, okay_cords_relative = \
@@ -226,7 +435,7 @@ class GameLauncher:
             # click on the okay button
             click_on_target(okay_btn, okay_cords_relative,
                             self.mouse, True)
-            time.sleep(2)
+            self.wait_until_stable(timeout=2)
 
     def get_rewards(self):
         """Get the rewards that shows on the home screen"""
@@ -246,10 +455,29 @@ class GameLauncher:
             click_on_target(rewards_location,
                             area_cords_relative,
                             self.mouse)
-            time.sleep(1)
+            get_clock().sleep(1)
             # click again to remove the notification of the rewards collected
             self._mouse.click()
-            time.sleep(5)
+            self.wait_until_stable(timeout=5)
+
+    def is_game_loaded(self) -> bool:
+        """
+        Checks if the game has loaded, either the home view icon is on the
+        bottom menu or the rewards shown when the game starts are.
+        """
+        bottom_image, _, _ = self.bottom_menu()
+        # the view icon is the first menu
+        view_image = bottom_image[:, :int(0.20 * bottom_image.shape[1])]
+        if self.find_target(view_image, self.target_templates('city-icon'),
+                            threshold=0.2) or \
+                self.find_target(view_image,
+                                 self.target_templates('outside-icon')):
+            return True
+        rewards_area_image, _ = self.get_screen_section(35, BOTTOM_IMAGE)
+        white_channel = cv.inRange(rewards_area_image, (128, 128, 128),
+                                   (255, 255, 255))
+        return bool(self.find_ocr_target("Claim", white_channel,
+                                         r'--oem 3 --psm 6'))
 
     def launch_aoz(self):
         """Launch the AOZ app if not already launched"""
@@ -262,7 +490,7 @@ class GameLauncher:
             self._mouse.move(center_x, center_y)
             self._mouse.click()
             # wait for the game to load
-            time.sleep(45)
+            self.wait_until(self.is_game_loaded, timeout=45, interval=1)
             # now we click on the reward that popups on the game screen.
             self.get_rewards()
             # Reset the game scree and reset any displayed offers
@@ -272,20 +500,176 @@ class GameLauncher:
             self.log_message("Game now active")
             # shake to collect available resources
             self._keyboard.shake()
-            time.sleep(5)
+            get_clock().sleep(5)
 
     @property
     def screen_image_path(self) -> str:
         """Returns te path for the screenshot"""
         return str(self.cwd.joinpath("data", "screenshot.png"))
 
-    def get_screenshot(self) -> np.ndarray:
-        """Takes a screenshot of the current monitor screen"""
-        self._mss.shot(mon=1, output=self.screen_image_path)
-        self._mss.close()
-        screen_image = cv.imread(self.screen_image_path, self.IMG_COLOR)
+    def get_screenshot(self, region: Coordinates = None,
+                       cached: bool = True) -> np.ndarray:
+        """
+        Takes a screenshot of the current monitor screen. The image is
+        shared with the later reads served from the frame cache, copy it
+        before changing it.
+
+        A frame captured shortly before with no mouse or keyboard action
+        since is reused when it covers the region.
+
+        :param region: Only capture this region of the monitor.
+        :param cached: Allow reusing the recent frame.
+        """
+        if cached:
+            screen_image = self._frame_cache.get(region)
+            if screen_image is not None:
+                return screen_image
+        screen_image = self._capture.grab(region)
+        self._frame_cache.put(region, screen_image)
         return screen_image
 
+    def wait_until(self, predicate: Callable[[], Any],
+                   timeout: float, interval: float = 0.5) -> Any:
+        """
+        Waits until a condition is met, e.g. an expected element appeared.
+
+        :param predicate: Checks the condition, returns a truthy value when
+            it is met.
+        :param timeout: The maximum time to wait for in secs.
+        :param interval: The time between two checks in secs.
+        :return: The last value returned by the predicate.
+        """
+        clock = get_clock()
+        deadline = clock.now() + timeout
+        while True:
+            result = predicate()
+            if result or clock.now() >= deadline:
+                return result
+            clock.sleep(min(interval, max(0.0, deadline - clock.now())))
+
+    def wait_until_stable(self, region: Coordinates = None,
+                          timeout: float = 10, settle: float = 0.6,
+                          threshold: float = 2.0,
+                          interval: float = 0.2) -> bool:
+        """
+        Waits until the screen stops changing, e.g. after a click opened a
+        new view. Frames are compared as small grayscale thumbnails.
+
+        :param region: The region of the monitor to watch. Defaults to the
+            game screen or the whole monitor if the game is not found yet.
+        :param timeout: The maximum time to wait for in secs.
+        :param settle: How long the screen has to stay unchanged in secs.
+        :param threshold: The mean pixel difference still seen as unchanged.
+        :param interval: The time between two captures in secs.
+        :return: True if the screen settled before the timeout.
+        """
+        region = region if region else self._app_coordinates
+        clock = get_clock()
+        deadline = clock.now() + timeout
+        previous, stable_since = None, None
+        # give the screen a moment to react to the last action
+        clock.sleep(interval)
+        while True:
+            frame = cv.cvtColor(self.get_screenshot(region, cached=False),
+                                cv.COLOR_BGR2GRAY)
+            t_h, t_w = frame.shape
+            thumbnail = cv.resize(frame, (64, max(1, int(64 * t_h / t_w))),
+                                  interpolation=cv.INTER_AREA)
+            now = clock.now()
+            if previous is not None and \
+                    cv.absdiff(thumbnail, previous).mean() <= threshold:
+                stable_since = stable_since if stable_since else now
+                if now - stable_since >= settle:
+                    return True
+            else:
+                stable_since = None
+            previous = thumbnail
+            if now >= deadline:
+                self.log_message("Screen did not settle before timeout")
+                return False
+            clock.sleep(interval)
+
+    def invalidate_frame(self):
+        """Forces the next screenshot to capture the screen again"""
+        self._frame_cache.invalidate()
+
+    @property
+    def capture_stream(self) -> Optional[CaptureStream]:
+        """Returns the background capture stream if it is running"""
+        return self._capture_stream
+
+    def start_capture_stream(self, fps: float = 10, capacity: int = 32):
+        """
+        Starts capturing the game screen in the background into a ring
+        buffer of recent frames.
+
+        :param fps: The number of frames captured per second
+        :param capacity: The number of recent frames kept
+        """
+        self.stop_capture_stream()
+        self._capture_stream = CaptureStream(
+            self._app_coordinates, fps, capacity,
+            capture_factory=self._capture_factory or ScreenCapture)
+        self._capture_stream.start()
+
+    def stop_capture_stream(self):
+        """Stops the background capture stream"""
+        if self._capture_stream:
+            self._capture_stream.stop()
+            self._capture_stream = None
+
+    def close(self):
+        """
+        Stops the capture stream and releases the screen capture and the
+        worker threads of the matching engines. The launcher is not used
+        afterwards.
+        """
+        self.stop_capture_stream()
+        self._capture.close()
+        for matcher in {self._default_matcher, *self._matchers.values()}:
+            matcher.close()
+
+    @staticmethod
+    def scan_images(images: List[Any],
+                    detect: Callable[[Any], Optional[Any]],
+                    workers: int = 4) -> Optional[Tuple[Any, Any]]:
+        """
+        Runs a detection over a series of images in parallel. The
+        detections run concurrently, so they may only share state that is
+        locked, like the scale memory and the recent hits of find_target.
+
+        :param images: The images to scan, oldest first.
+        :param detect: Returns the detection for an image or None.
+        :param workers: The number of images scanned at the same time.
+        :return: The newest image with a detection and its detection.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            detections = list(executor.map(detect, images))
+        for image, detection in zip(reversed(images), reversed(detections)):
+            if detection:
+                return image, detection
+        return None
+
+    def classify_screen(self, frame: np.ndarray = None) -> Optional[str]:
+        """
+        Tells which screen the game shows.
+
+        :param frame: The game screen. Captured when omitted.
+        :return: One of the SCREEN_ labels or None if the screen is not
+            recognized.
+        """
+        if frame is None:
+            frame = self.get_game_screen()
+        label, similarity = self._screen_classifier.classify(frame)
+        if label:
+            self.log_message(f"Screen state - {label} ({similarity:.3f})")
+        return label
+
+    def learn_screen(self, label: str, frame: np.ndarray):
+        """Remembers a game screen a probe identified as the given label"""
+        if self._screen_classifier.learn(label, frame):
+            self.log_message(f"Learned screen state - {label}")
+
     def get_game_screen(self) -> np.ndarray:
         """
         Returns the current game screen. Used when the game screen has
@@ -293,67 +677,84 @@ class GameLauncher:
 
         :returns: The current game screen.
         """
-        screen_image = self.get_screenshot()
-        start_x, start_y, end_x, end_y = self._app_coordinates
-        game_screen = screen_image[start_y:end_y, start_x:end_x]
-        return game_screen
+        return self.get_screenshot(self._app_coordinates)
 
-    def get_screen_section(self,
-                           percentage: float,
-                           position: int,
-                           source: np.ndarray = None,
-                           reference_coords: Coordinates = None) \
-            -> tuple[np.ndarray, Coordinates]:
-        """
-        Gets a percentage of the game screen and return that section only.
-
-        :param reference_coords: An alternate reference coordinates
-        :param source: Input image to extract section from.
-        :param percentage: Percentage of the screen
-        :param position: Whether it's top - 0, bottom - 1, left - 2 or right
-            - 3 of the screen.
-        :return: Returns an image section
-        """
-        screen = self.get_game_screen() if source is None else source
-        t_h, t_w, _ = screen.shape
+    @staticmethod
+    def _section_coordinates(t_h: int, t_w: int,
+                             percentage: float,
+                             position: int) -> Coordinates:
+        """Returns the coordinates of a percentage section of an image"""
         new_th = int((percentage / 100) * t_h)
         new_tw = int((percentage / 100) * t_w)
         if position == TOP_IMAGE:
-            section_coordinates = Coordinates(
+            return Coordinates(
                 start_x=0,
                 start_y=0,
                 end_x=t_w,
                 end_y=new_th
             )
-        elif position == BOTTOM_IMAGE:
-            section_coordinates = Coordinates(
+        if position == BOTTOM_IMAGE:
+            return Coordinates(
                 start_x=0,
                 start_y=t_h - new_th,
                 end_x=t_w,
                 end_y=t_h
             )
-        elif position == LEFT_IMAGE:
-            section_coordinates = Coordinates(
+        if position == LEFT_IMAGE:
+            return Coordinates(
                 start_x=0,
                 start_y=0,
                 end_x=new_tw,
                 end_y=t_h
             )
+        return Coordinates(
+            start_x=t_w - new_tw,
+            start_y=0,
+            end_x=t_w,
+            end_y=t_h
+        )
+
+    def get_screen_section(self,
+                           percentage: float,
+                           position: int,
+                           source: np.ndarray = None,
+                           reference_coords: Coordinates = None) \
+            -> tuple[np.ndarray, Coordinates]:
+        """
+        Gets a percentage of the game screen and return that section only.
+        Without a source image only that section of the screen is captured.
+
+        :param reference_coords: An alternate reference coordinates
+        :param source: Input image to extract section from.
+        :param percentage: Percentage of the screen
+        :param position: Whether it's top - 0, bottom - 1, left - 2 or right
+            - 3 of the screen.
+        :return: Returns an image section
+        """
+        if source is None:
+            start_x, start_y, end_x, end_y = self._app_coordinates
+            section_coordinates = self._section_coordinates(
+                end_y - start_y, end_x - start_x, percentage, position)
         else:
-            section_coordinates = Coordinates(
-                start_x=t_w - new_tw,
-                start_y=0,
-                end_x=t_w,
-                end_y=t_h
-            )
+            t_h, t_w, _ = source.shape
+            section_coordinates = self._section_coordinates(
+                t_h, t_w, percentage, position)
 
         section_coordinates_relative = GameHelper. \
             get_relative_coordinates(
             self._app_coordinates if not reference_coords else reference_coords,
             section_coordinates)
-        section_image = screen[
-                        section_coordinates.start_y:section_coordinates.end_y,
-                        section_coordinates.start_x:section_coordinates.end_x]
+        if source is None:
+            # capture only the section of the game screen
+            section_image = self.get_screenshot(
+                GameHelper.get_relative_coordinates(self._app_coordinates,
+                                                    section_coordinates))
+        else:
+            section_image = source[
+                            section_coordinates.start_y:
+                            section_coordinates.end_y,
+                            section_coordinates.start_x:
+                            section_coordinates.end_x]
         return section_image, section_coordinates_relative
 
     def bottom_menu(self) -> tuple[np.ndarray, dict[int, Coordinates],
@@ -398,12 +799,26 @@ class GameLauncher:
         Possible values are - 1 for inside city and 2 for outside city.
         :return: None
         """
+        game_screen = self.get_game_screen().copy()
+        screen_state = self.classify_screen(game_screen)
+        if view == INSIDE_VIEW and screen_state == SCREEN_HOME_INSIDE:
+            self.log_message(
+                "------ Now in city view mode ------")
+            return
+        if view == OUTSIDE_VIEW and screen_state == SCREEN_HOME_OUTSIDE:
+            self.log_message(
+                "------ Now in outside city view mode ------")
+            return
+
         bottom_image, _, coordinates = self.bottom_menu()
         cords = self.find_target(
             bottom_image,
             self.target_templates('city-icon'),
             threshold=0.2
         )
+        if cords:
+            # the city icon only shows inside the city
+            self.learn_screen(SCREEN_HOME_INSIDE, game_screen)
         if view == INSIDE_VIEW:
             # go to inside city view
             if cords:
@@ -416,12 +831,13 @@ class GameLauncher:
             if not cords:
                 raise LauncherException(
                     "View changing could not be completed.")
+            self.learn_screen(SCREEN_HOME_OUTSIDE, game_screen)
             center = GameHelper.get_center(cords)
             self._mouse.set_position(coordinates.start_x,
                                      coordinates.start_y)
             self._mouse.move(center)
             self._mouse.click()
-            time.sleep(10)
+            self.wait_until_stable(timeout=10, settle=1.5)
             self.log_message(
                 "------ Now in city view mode ------")
             return
@@ -436,7 +852,7 @@ class GameLauncher:
                                      coordinates.start_y)
             self._mouse.move(*center)
             self._mouse.click()
-            time.sleep(15)
+            self.wait_until_stable(timeout=15, settle=1.5)
             self.log_message(
                 "------ Now in outside city view mode ------")
             return
@@ -466,7 +882,7 @@ class GameLauncher:
             # extract the coordinates in reference to the main screen
             self._game_coordinates = GameHelper.get_relative_coordinates(
                 self._app_coordinates, location)
-            time.sleep(1)
+            get_clock().sleep(1)
             return
 
         # otherwise, check if the game has already launched
@@ -476,7 +892,7 @@ class GameLauncher:
         if not game_launched:
             # set back to home screen
             self.keyboard.home()
-            time.sleep(1)
+            get_clock().sleep(1)
             raise LauncherException(
                 "Game app not detected. Bot can't proceed")
 
@@ -494,7 +910,7 @@ class GameLauncher:
         """
         # go home first
         self.keyboard.home()
-        time.sleep(2)
+        get_clock().sleep(2)
         # take the screenshot
         screen_image = self.get_screenshot()
         location = self.find_target(screen_image,
@@ -513,46 +929,186 @@ class GameLauncher:
                          f"{self._app_coordinates.end_y}\n"
             file.write(cords_data)
 
+    def find_element(self, element: str, target: str,
+                     search: Callable[[], Optional[Coordinates]],
+                     threshold: float = None,
+                     padding: int = 10) -> Optional[Coordinates]:
+        """
+        Returns the screen coordinates of a game UI element. The position
+        stored by an earlier run is checked first by matching the target
+        templates in a small window around it. The full search only runs
+        when nothing is stored or the element moved, and its result is
+        stored for the next runs.
+
+        :param element: The element name in the coordinate store
+        :param target: The templates key of the element
+        :param search: The full search, returns the screen coordinates of
+            the element or None
+        :param threshold: The target threshold for detection.
+        :param padding: How far around the stored position is searched
+        :return: The screen coordinates of the element or None.
+        """
+        start_x, start_y, end_x, end_y = self._app_coordinates
+        resolution = (end_x - start_x, end_y - start_y)
+        stored = self._element_store.get(resolution, element) \
+            if self._cache else None
+        if stored:
+            window = Coordinates(
+                start_x=max(0, stored.start_x - padding),
+                start_y=max(0, stored.start_y - padding),
+                end_x=min(resolution[0], stored.end_x + padding),
+                end_y=min(resolution[1], stored.end_y + padding))
+            window_screen = GameHelper.get_relative_coordinates(
+                self._app_coordinates, window)
+            cords = self.find_target(self.get_screenshot(window_screen),
+                                     self.target_templates(target),
+                                     threshold, key=f"element-{element}")
+            if cords:
+                cords = GameHelper.get_relative_coordinates(window, cords)
+                if cords != stored:
+                    self._element_store.put(resolution, element, cords)
+                return GameHelper.get_relative_coordinates(
+                    self._app_coordinates, cords)
+            self.log_message(f"Stored {element} position is outdated")
+
+        cords = search()
+        if cords:
+            self._element_store.put(resolution, element, Coordinates(
+                cords.start_x - start_x, cords.start_y - start_y,
+                cords.end_x - start_x, cords.end_y - start_y))
+        else:
+            self._element_store.discard(resolution, element)
+        return cords
+
     def find_target(self, reference: np.ndarray,
                     target: List[np.ndarray],
-                    threshold: float = None) \
+                    threshold: float = None,
+                    key: str = None) \
             -> Optional[Coordinates]:
         """
         Helper function for finding the coordinates of the
         of a given target in a reference image. It returns the bounding box
         location of the game app.
 
+        The last hits of a target key in a reference of the same size are
+        searched first, in a padded window around each of them. Otherwise
+        calibrated templates are matched at a single scale first. The
+        winning scale is remembered per target key and reference size,
+        later lookups search a narrow band around it first and only sweep
+        all the scales again when that fails.
+
         :param reference: The reference input image.
         :param target: The template target.
         :param threshold: The target threshold for detection.
+        :param key: The target key used for remembering the scale and the
+            recent hits. Defaults to the template folder of the target.
         :returns: Returns the coordinates of the target.
         """
-        rgb_channel = True if len(reference.shape) == 3 else False
-        # track matching history
-        found = None
-        # loop over for the best template match from a series of templates
-        for template in target:
-            for scale in np.linspace(0.05, 1.0, 20)[::-1]:
-                # resize the image according to the scale, and keep track
-                # of the ratio of the resizing
-                resized = imutils.resize(
-                    reference.copy(),
-                    width=int(reference.shape[1] * scale))
-                # if the resized image is smaller than the template, then break
-                # from the loop
-                t_w, t_h = template.shape[1], template.shape[0]
-
-                if resized.shape[0] < t_h or resized.shape[1] < t_w:
-                    break
-                # Apply template Matching
-                res = cv.matchTemplate(resized, template,
-                                       method=cv.TM_SQDIFF_NORMED)
-                min_val, _, min_loc, _ = cv.minMaxLoc(res)
-                if found is None or min_val < found[1]:
-                    r = reference.shape[1] / float(resized.shape[1])
-                    found = (template, min_val, min_loc, r)
-
-        (template, min_val, min_loc, r) = found
+        threshold = threshold if threshold else 0.55
+        key = key if key else getattr(target, "directory", None)
+        template_scale = getattr(target, "scale", 1.0)
+        memory_key = (key, reference.shape[:2], template_scale) \
+            if key else None
+        calibrated = getattr(target, "calibrated", False)
+
+        if memory_key:
+            with self._match_lock:
+                window_scale = self._scale_memory.get(
+                    memory_key, 1.0 if calibrated else None)
+                history = self._recent_hits.setdefault(
+                    memory_key, deque(maxlen=self.hit_history))
+                # other scans update the history while this one searches
+                recent_hits = list(history)
+            cords = self._search_recent_hits(
+                reference, target, threshold, recent_hits, window_scale)
+            if cords is None:
+                cords = self._search_target(reference, target, threshold,
+                                            memory_key, calibrated)
+            if cords:
+                with self._match_lock:
+                    if cords in history:
+                        history.remove(cords)
+                    history.appendleft(cords)
+            return cords
+        return self._search_target(reference, target, threshold,
+                                   memory_key, calibrated)
+
+    def _search_recent_hits(self, reference: np.ndarray,
+                            target: List[np.ndarray],
+                            threshold: float,
+                            recent_hits: List[Coordinates],
+                            scale: Optional[float]) -> Optional[Coordinates]:
+        """
+        Matches the target in a padded window around each recent hit, at
+        the scale the target was last found at.
+
+        :param recent_hits: The recent hits, newest first
+        """
+        if scale is None:
+            return None
+        t_h, t_w = reference.shape[:2]
+        for hit in recent_hits:
+            pad_x = int((hit.end_x - hit.start_x) * self.hit_padding) + 1
+            pad_y = int((hit.end_y - hit.start_y) * self.hit_padding) + 1
+            window = Coordinates(
+                start_x=max(0, hit.start_x - pad_x),
+                start_y=max(0, hit.start_y - pad_y),
+                end_x=min(t_w, hit.end_x + pad_x),
+                end_y=min(t_h, hit.end_y + pad_y))
+            cords = self._locate_target(
+                reference[window.start_y:window.end_y,
+                          window.start_x:window.end_x],
+                target, threshold, np.array([scale]), None)
+            if cords:
+                self.log_message("Target found next to a recent hit")
+                return GameHelper.get_relative_coordinates(window, cords)
+        return None
+
+    def _search_target(self, reference: np.ndarray,
+                       target: List[np.ndarray],
+                       threshold: float,
+                       memory_key: Optional[tuple],
+                       calibrated: bool) -> Optional[Coordinates]:
+        """
+        Searches the whole reference, narrowest scale range first. The
+        calibrated templates are only matched at their own scale, the
+        remembered band and the full sweep search the unscaled templates,
+        as the bundled templates were not all cut at the same size.
+        """
+        searches = []
+        if calibrated:
+            # calibrated templates are already at the emulator size
+            searches.append((target, np.array([1.0]), memory_key))
+            target = self._templates.get(target.directory)
+            if memory_key:
+                memory_key = memory_key[:2] + (1.0,)
+        with self._match_lock:
+            remembered_scale = self._scale_memory.get(memory_key)
+        if remembered_scale is not None:
+            band = np.clip(remembered_scale + np.linspace(
+                -self.scale_band, self.scale_band, 5), 0.05, 1.0)
+            searches.append((target, np.unique(band)[::-1], memory_key))
+        for templates, scales, scale_key in searches:
+            cords = self._locate_target(reference, templates, threshold,
+                                        scales, scale_key)
+            if cords:
+                return cords
+        if searches:
+            self.log_message("Falling back to the full scale sweep")
+        return self._locate_target(reference, target, threshold,
+                                   self.sweep_scales, memory_key)
+
+    def _locate_target(self, reference: np.ndarray,
+                       target: List[np.ndarray],
+                       threshold: float,
+                       scales: np.ndarray,
+                       memory_key: Optional[tuple]) -> Optional[Coordinates]:
+        """Matches the target over the given scales and verifies the match"""
+        found = self.matcher_for(target).match(reference, target, scales)
+        if found is None:
+            self.log_message("Target image not found")
+            return None
+        template, min_val, min_loc, r = found
         self.log_message(f'Matching min value: {min_val}')
         if min_val == 1:
             self.log_message("Target image not found")
@@ -564,44 +1120,76 @@ class GameLauncher:
         start_x, start_y = (int(min_loc[0] * r), int(min_loc[1] * r))
         end_x, end_y = (int((min_loc[0] + t_w) * r),
                         int((min_loc[1] + t_h) * r))
-        found_template = reference[start_y:end_y, start_x:end_x]
-        resize_found_template = cv.resize(found_template, (t_h, t_w))
-
-        # calculate the HOG vector representation
-        feature_vec_template, _ = GameHelper.calculate_hog(
-            template,
-            rgb_channel)
-        feature_vec_match, _ = GameHelper.calculate_hog(
-            resize_found_template,
-            rgb_channel)
-
-        # calculate Cosine Similarity python
-        cosine_score = GameHelper.cosine_similarity(
-            feature_vec_template, feature_vec_match)
+        cosine_score = self._verify_match(
+            target, template, reference[start_y:end_y, start_x:end_x],
+            len(reference.shape) == 3)
         self.log_message(f"Cosine score: {cosine_score}")
 
-        threshold = threshold if threshold else 0.55
         if min_val < threshold and cosine_score > 0.50:
             self.log_message(
                 f"Region is TopLeft: ({start_x}, {start_y}) and "
                 f"bottomLeft: ({end_x}, {end_y})")
+            if memory_key:
+                with self._match_lock:
+                    self._scale_memory[memory_key] = 1 / r
             return Coordinates(start_x, start_y, end_x, end_y)
-        else:
-            self.log_message("Target image not found")
+        self.log_message("Target image not found")
         return None
 
-    def _load_all_templates(self, templates_dir: str) -> List[np.ndarray]:
-        """Loads all the target template files found in the path folder"""
-        templates_path = Path(templates_dir)
-        if not templates_path.is_dir():
-            raise Exception("Only directory are allowed")
-        template_images = []
-        for image_path in templates_path.glob('template_*.png'):
-            template_images.append(cv.imread(str(image_path),
-                                             self.IMG_COLOR))
-        if not template_images:
-            raise Exception("No template image found.")
-        return template_images
+    @staticmethod
+    def _verify_match(target: List[np.ndarray], template: np.ndarray,
+                      found_template: np.ndarray,
+                      rgb_channel: bool) -> float:
+        """Returns the HOG cosine similarity of the template and the match"""
+        t_w, t_h = template.shape[1], template.shape[0]
+        resize_found_template = cv.resize(found_template, (t_h, t_w))
+
+        # calculate the HOG vector representation, the template ones are
+        # kept with the loaded templates
+        if isinstance(target, TemplateSet):
+            feature_vec_template = target.descriptor(template, rgb_channel)
+        else:
+            feature_vec_template = GameHelper.calculate_hog(template,
+                                                            rgb_channel)
+        feature_vec_match = GameHelper.calculate_hog(resize_found_template,
+                                                     rgb_channel)
+
+        # calculate Cosine Similarity python
+        return GameHelper.cosine_similarity(
+            feature_vec_template, feature_vec_match)
+
+    def preload_templates(self):
+        """Loads all the target templates into memory upfront"""
+        self._templates.preload(self._templates_path.values())
+
+    def invalidate_templates(self, target: str = None):
+        """
+        Drops the in-memory templates so they are read from disk again.
+
+        :param target: The target to drop. Drops all targets when omitted.
+        """
+        if target is None:
+            self._templates.invalidate()
+            return
+        self._templates.invalidate(self._templates_path[target.lower()])
+
+    def set_matching_engine(self, target: str, matcher: Matcher):
+        """
+        Chooses the template matching engine of a target.
+
+        :param target: The templates key, e.g. 'radar'
+        :param matcher: The engine, e.g. PyramidMatcher()
+        """
+        try:
+            directory = self._templates_path[target.lower()]
+        except KeyError:
+            raise Exception(f"Target {target} is not recognized")
+        self._matchers[directory] = matcher
+
+    def matcher_for(self, target: List[np.ndarray]) -> Matcher:
+        """Returns the template matching engine of a target"""
+        return self._matchers.get(getattr(target, "directory", None),
+                                  self._default_matcher)
 
     def target_templates(self, target: str) -> List[np.ndarray]:
         """Return all the target specified templates"""
@@ -609,7 +1197,11 @@ class GameLauncher:
             directory = self._templates_path[target.lower()]
         except KeyError:
             raise Exception(f"Target {target} is not recognized")
-        return self._load_all_templates(directory)
+        if self._template_scale and \
+                target.lower() not in self._uncalibrated_targets:
+            return self._templates.get_scaled(directory,
+                                              self._template_scale)
+        return self._templates.get(directory)
 
     def log_message(self, message: str):
         """Prints to log if enabled"""
@@ -678,21 +1270,28 @@ class GameLauncher:
 
         def click_location_finder():
             if not self.location_finder_btn:
-                location_area_image, self.location_cords_relative = \
-                    self.get_screen_section(30, BOTTOM_IMAGE)
-
-                self.location_finder_btn = self.find_target(
-                    location_area_image,
-                    self.target_templates('location-finder'),
-                    threshold=0.25
-                )
+                self.location_finder_btn = self.find_element(
+                    'location-finder', 'location-finder',
+                    find_location_finder, threshold=0.25)
                 if not self.location_finder_btn:
                     raise LauncherException("Location position not found")
 
-            click_on_target(self.location_finder_btn,
-                            self.location_cords_relative,
+            click_on_target(self.location_finder_btn, None,
                             self.mouse, center=True)
 
+        def find_location_finder() -> Optional[Coordinates]:
+            location_area_image, location_cords_relative = \
+                self.get_screen_section(30, BOTTOM_IMAGE)
+            cords = self.find_target(
+                location_area_image,
+                self.target_templates('location-finder'),
+                threshold=0.25
+            )
+            if not cords:
+                return None
+            return GameHelper.get_relative_coordinates(
+                location_cords_relative, cords)
+
         def find_x_y_input():
             area_image, area_cords_relative = \
                 self.get_screen_section(55, BOTTOM_IMAGE)
@@ -747,7 +1346,7 @@ class GameLauncher:
                 # first clear the current content
                 for _ in range(5):
                     self.keyboard.clear()
-                    time.sleep(0.1)
+                    get_clock().sleep(0.1)
 
                 pos = new_pos[i]
                 # now enter the new content
@@ -756,7 +1355,7 @@ class GameLauncher:
                 # save content written
                 click_on_target(input_position[i], None, self.mouse, True)
 
-                time.sleep(0.1)
+                get_clock().sleep(0.1)
 
         x_min, x_max = (0, 1199)
         y_min, y_max = (0, 1199)
@@ -771,19 +1370,19 @@ class GameLauncher:
             for x in range(x_min, x_max + 1):
                 # first click on the location finder finder
                 click_location_finder()
-                time.sleep(1)
+                get_clock().sleep(1)
                 # now input the x and y positions
                 if not input_positions[0]:
                     input_positions = find_x_y_input()
                 # write the contents
                 input_x_y_position(input_positions, (x, y))
-                time.sleep(1)
+                get_clock().sleep(1)
                 # go the target
                 if not go_btn_cords:
                     go_btn_cords = find_go_btn()
                 # click on go btn
                 click_on_target(go_btn_cords, None, self.mouse, True)
-                time.sleep(2)
+                get_clock().sleep(2)
                 # now search if target city is in view
                 center_area_image, area_cords_relative = \
                     self.get_screen_section(60, TOP_IMAGE)
@@ -856,15 +1455,15 @@ class GameLauncher:
                 # move left
                 find_lee()
                 move_left()
-                time.sleep(0.1)
+                get_clock().sleep(0.1)
             # move up
             move_up()
             for _ in range(x_range):
                 find_lee()
                 # move right
                 move_right()
-                time.sleep(0.1)
+                get_clock().sleep(0.1)
 
             # move up
             move_up()
-            time.sleep(0.1)
+            get_clock().sleep(0.1)
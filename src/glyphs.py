@@ -0,0 +1,286 @@
+"""
+Reads the digit readouts of the game (fuel, radar level, set out time and
+zombie max level) without tesseract.
+
+The binarized readout is split into glyphs by its column projection, every
+glyph is scaled to a fixed grid and all of them are matched in one matrix
+product against an atlas of known glyphs. The atlas is learned from the
+readouts tesseract reads and kept in data/glyph_atlas.npz. A glyph only
+joins the atlas once independent readouts read it the same, and readouts
+with any glyph below the confidence are left to tesseract.
+"""
+import re
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+GLYPH_CHARSET = "0123456789:"
+
+
+class GlyphRecognizer:
+    """
+    Nearest-neighbour recognizer of single line digit readouts.
+
+    :param str atlas_path: The npz file the glyph atlas is kept in. The
+        atlas is only kept in memory when omitted.
+    :param float min_confidence: The lowest cosine similarity accepted for
+        every glyph of a readout.
+    :param int samples_per_glyph: The most samples kept for one character.
+    :param int confirmations: The number of readouts that have to read a
+        glyph the same before it joins the atlas.
+    """
+    GLYPH_SIZE = (24, 16)
+    MIN_PIXELS = 4
+    MAX_PENDING = 64
+
+    def __init__(self, atlas_path: Optional[str] = None,
+                 min_confidence: float = 0.9,
+                 samples_per_glyph: int = 8,
+                 confirmations: int = 2):
+        self.atlas_path = atlas_path
+        self.min_confidence = min_confidence
+        self.samples_per_glyph = samples_per_glyph
+        self.confirmations = confirmations
+        size = self.GLYPH_SIZE[0] * self.GLYPH_SIZE[1]
+        self._atlas = np.empty((0, size), dtype=np.float32)
+        self._labels = np.empty(0, dtype='<U1')
+        # the glyphs read once, with their label and number of readouts
+        self._pending: List[List] = []
+        self._changed = False
+        self._lock = threading.Lock()
+        if atlas_path and Path(atlas_path).is_file():
+            self.load(atlas_path)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def load(self, atlas_path: str):
+        """Loads the glyph atlas from a npz file"""
+        with np.load(atlas_path) as atlas:
+            glyphs = atlas["glyphs"].astype(np.float32)
+            labels = atlas["labels"].astype('<U1')
+        if glyphs.shape[1:] != self._atlas.shape[1:]:
+            raise Exception(f"Glyph atlas {atlas_path} has the wrong size")
+        with self._lock:
+            self._atlas = glyphs
+            self._labels = labels
+
+    def save(self, atlas_path: Optional[str] = None):
+        """
+        Writes the glyph atlas to a npz file. The atlas path is only
+        written when the atlas changed since it was last saved.
+        """
+        if not atlas_path:
+            atlas_path = self.atlas_path
+            if not atlas_path or not self._changed:
+                return
+        with self._lock:
+            glyphs, labels = self._atlas, self._labels
+            if atlas_path == self.atlas_path:
+                self._changed = False
+        np.savez_compressed(atlas_path, glyphs=glyphs.astype(np.uint8),
+                            labels=labels)
+
+    @classmethod
+    def segment(cls, image: np.ndarray) -> List[np.ndarray]:
+        """
+        Splits a binarized single line readout into its glyphs.
+
+        :param image: The inRange output, text pixels are non zero.
+        :return: The glyph crops from left to right, all cropped to the
+            height of the text line.
+        """
+        binary = image > 0
+        columns = np.flatnonzero(binary.any(axis=0))
+        if not columns.size:
+            return []
+        # split the filled columns into runs of touching columns
+        breaks = np.flatnonzero(np.diff(columns) > 1)
+        starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+        ends = np.concatenate((columns[breaks], [columns[-1]])) + 1
+
+        runs = []
+        for start, end in zip(starts, ends):
+            glyph = binary[:, start:end]
+            if glyph.sum() < cls.MIN_PIXELS:
+                continue
+            rows = np.flatnonzero(glyph.any(axis=1))
+            runs.append((glyph, rows[0], rows[-1] + 1))
+        if not runs:
+            return []
+
+        # the line is bounded by the glyphs of full height, so small
+        # specks above or below the text do not stretch it
+        tallest = max(bottom - top for _, top, bottom in runs)
+        full_height = [(top, bottom) for _, top, bottom in runs
+                       if bottom - top >= 0.5 * tallest]
+        line_top = min(top for top, _ in full_height)
+        line_bottom = max(bottom for _, bottom in full_height)
+        return [glyph[line_top:line_bottom] for glyph, _, _ in runs]
+
+    @classmethod
+    def normalize(cls, glyph: np.ndarray) -> np.ndarray:
+        """
+        Centers a glyph in a box of the glyph grid aspect ratio and scales
+        it to the grid with nearest-neighbour sampling.
+
+        :return: The flattened glyph with values 0 or 1
+        """
+        g_h, g_w = cls.GLYPH_SIZE
+        t_h, t_w = glyph.shape
+        box_h = max(t_h, int(np.ceil(t_w * g_h / g_w)))
+        box_w = max(t_w, int(np.ceil(t_h * g_w / g_h)))
+        box = np.zeros((box_h, box_w), dtype=np.float32)
+        top, left = (box_h - t_h) // 2, (box_w - t_w) // 2
+        box[top:top + t_h, left:left + t_w] = glyph
+        rows = (np.arange(g_h) * box_h // g_h)[:, None]
+        cols = (np.arange(g_w) * box_w // g_w)[None, :]
+        return box[rows, cols].ravel()
+
+    @staticmethod
+    def _similarity(glyphs: np.ndarray, atlas: np.ndarray) -> np.ndarray:
+        """Returns the cosine similarity of every glyph to every atlas row"""
+        atlas_norm = np.linalg.norm(atlas, axis=1)
+        glyph_norm = np.linalg.norm(glyphs, axis=1)
+        return glyphs @ atlas.T / \
+            np.maximum(np.outer(glyph_norm, atlas_norm), 1e-6)
+
+    def _match(self, glyphs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the best atlas label and similarity of every glyph"""
+        with self._lock:
+            atlas, labels = self._atlas, self._labels
+        if not len(labels):
+            return np.empty(0, dtype='<U1'), np.zeros(len(glyphs))
+        similarity = self._similarity(glyphs, atlas)
+        best = similarity.argmax(axis=1)
+        return labels[best], similarity[np.arange(len(glyphs)), best]
+
+    def _confirm(self, glyph: np.ndarray, char: str,
+                 added: List[List]) -> bool:
+        """
+        Counts a readout of a glyph not in the atlas. Called with the lock
+        held.
+
+        :param added: Collects the glyphs read for the first time, they
+            are only pending for the next readouts.
+        :return: True if enough readouts read the glyph as the character.
+        """
+        if self._pending:
+            pending = np.stack([entry[0] for entry in self._pending])
+            similarity = self._similarity(glyph[None, :], pending)[0]
+            index = int(similarity.argmax())
+            if similarity[index] >= self.min_confidence:
+                entry = self._pending[index]
+                if entry[1] != char:
+                    # the readouts disagree, trust neither of them
+                    del self._pending[index]
+                    return False
+                entry[2] += 1
+                if entry[2] < self.confirmations:
+                    return False
+                del self._pending[index]
+                return True
+        if self.confirmations <= 1:
+            return True
+        added.append([glyph, char, 1])
+        return False
+
+    def read(self, image: np.ndarray) -> Optional[str]:
+        """
+        Reads a binarized readout.
+
+        :param image: The inRange output, text pixels are non zero.
+        :return: The text or None when any glyph is not recognized with
+            enough confidence.
+        """
+        crops = self.segment(image)
+        if not crops or not len(self):
+            return None
+        glyphs = np.stack([self.normalize(crop) for crop in crops])
+        labels, similarity = self._match(glyphs)
+        if similarity.min() < self.min_confidence:
+            return None
+        return "".join(labels)
+
+    def learn(self, image: np.ndarray, text: str) -> bool:
+        """
+        Counts the glyphs of a readout given its known text, and adds the
+        ones read the same by enough readouts to the atlas. Readouts that
+        do not split into one glyph per character are skipped. The atlas
+        file is only written by save().
+
+        :param image: The inRange output, text pixels are non zero.
+        :param text: The text of the readout
+        :return: True if the atlas changed.
+        """
+        text = "".join(text.split())
+        if not text or any(char not in GLYPH_CHARSET for char in text):
+            return False
+        crops = self.segment(image)
+        if len(crops) != len(text):
+            return False
+        glyphs = np.stack([self.normalize(crop) for crop in crops])
+        labels, similarity = self._match(glyphs)
+
+        for index, char in enumerate(text):
+            if similarity[index] >= self.min_confidence and \
+                    labels[index] != char:
+                # tesseract and the atlas disagree, trust neither
+                return False
+
+        new_glyphs, new_labels, added = [], [], []
+        with self._lock:
+            for index, char in enumerate(text):
+                if similarity[index] >= self.min_confidence:
+                    continue
+                if np.count_nonzero(self._labels == char) + \
+                        new_labels.count(char) >= self.samples_per_glyph:
+                    continue
+                if self._confirm(glyphs[index], char, added):
+                    new_glyphs.append(glyphs[index])
+                    new_labels.append(char)
+            self._pending = (self._pending + added)[-self.MAX_PENDING:]
+            if not new_labels:
+                return False
+            self._atlas = np.vstack([self._atlas, np.stack(new_glyphs)])
+            self._labels = np.concatenate([self._labels,
+                                           np.array(new_labels)])
+            self._changed = True
+        return True
+
+
+_recognizer: Optional[GlyphRecognizer] = None
+
+
+def get_recognizer() -> GlyphRecognizer:
+    """
+    Returns the glyph recognizer shared by the digit readouts, backed by
+    data/glyph_atlas.npz.
+    """
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = GlyphRecognizer(
+            str(Path(__file__).cwd().joinpath("data", "glyph_atlas.npz")))
+    return _recognizer
+
+
+def set_recognizer(recognizer: GlyphRecognizer):
+    """Replaces the glyph recognizer used by the digit readouts"""
+    global _recognizer
+    _recognizer = recognizer
+
+
+def read_digits(image: np.ndarray, pattern: str = r'\d+') -> Optional[str]:
+    """
+    Reads a binarized digit readout with the shared recognizer.
+
+    :param image: The inRange output, text pixels are non zero.
+    :param pattern: The regex the whole readout has to match.
+    :return: The readout or None if it was not recognized.
+    """
+    text = get_recognizer().read(image)
+    if text is not None and re.fullmatch(pattern, text):
+        return text
+    return None
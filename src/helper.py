@@ -12,7 +12,6 @@ import numpy
 import numpy as np
 from numpy import dot
 from numpy.linalg import norm
-from skimage.feature import hog
 
 from src.listener import MouseController
 
@@ -130,13 +129,66 @@ class GameHelper:
         return None
 
     @staticmethod
-    def calculate_hog(image: np.ndarray, rgb_channel: False) -> [np.ndarray,
-                                                                 np.ndarray]:
-        """Calculates the HOG representation of an image"""
-        return hog(image, orientations=8,
-                   pixels_per_cell=(16, 16),
-                   cells_per_block=(1, 1), visualize=True,
-                   multichannel=rgb_channel)
+    def calculate_hog(image: np.ndarray, rgb_channel: bool = False,
+                      orientations: int = 8,
+                      cell_size: int = 16) -> np.ndarray:
+        """
+        Calculates the HOG feature vector of an image, with the same
+        values as skimage.feature.hog with 16x16 pixel cells, 1x1 cell
+        blocks and L2-Hys block normalization.
+
+        :param image: The input image
+        :param rgb_channel: The image has colour channels. The gradient of
+            the channel with the largest magnitude is used per pixel.
+        :param orientations: The number of orientation bins
+        :param cell_size: The cell size in pixels
+        :return: The feature vector ordered by cell row, cell column and
+            orientation.
+        """
+        # float64 like skimage, so the angles on bin edges fall alike
+        image = image.astype(np.float64)
+        if not rgb_channel:
+            image = image[:, :, None]
+        # central differences, the border rows and columns stay zero
+        g_row = np.zeros_like(image)
+        g_col = np.zeros_like(image)
+        g_row[1:-1] = image[2:] - image[:-2]
+        g_col[:, 1:-1] = image[:, 2:] - image[:, :-2]
+        magnitude = np.hypot(g_row, g_col)
+        if image.shape[2] > 1:
+            strongest = magnitude.argmax(axis=2)[:, :, None]
+            g_row = np.take_along_axis(g_row, strongest, axis=2)
+            g_col = np.take_along_axis(g_col, strongest, axis=2)
+            magnitude = np.take_along_axis(magnitude, strongest, axis=2)
+        g_row, g_col, magnitude = g_row[:, :, 0], g_col[:, :, 0], \
+            magnitude[:, :, 0]
+
+        n_rows = image.shape[0] // cell_size
+        n_cols = image.shape[1] // cell_size
+        if not n_rows or not n_cols:
+            return np.zeros(0)
+        height, width = n_rows * cell_size, n_cols * cell_size
+        orientation = np.rad2deg(np.arctan2(g_row[:height, :width],
+                                            g_col[:height, :width])) % 180
+        bins = np.minimum((orientation * orientations / 180).astype(int),
+                          orientations - 1)
+        cells = (np.arange(height)[:, None] // cell_size) * n_cols + \
+            np.arange(width)[None, :] // cell_size
+        histogram = np.bincount(
+            (cells * orientations + bins).ravel(),
+            weights=magnitude[:height, :width].ravel(),
+            minlength=n_rows * n_cols * orientations)
+        histogram = histogram.reshape(n_rows * n_cols, orientations) / \
+            (cell_size * cell_size)
+
+        # L2-Hys normalization of every single cell block
+        eps = 1e-5
+        blocks = histogram / np.sqrt(
+            (histogram ** 2).sum(axis=1, keepdims=True) + eps ** 2)
+        blocks = np.minimum(blocks, 0.2)
+        blocks = blocks / np.sqrt(
+            (blocks ** 2).sum(axis=1, keepdims=True) + eps ** 2)
+        return blocks.ravel()
 
     @staticmethod
     def cosine_similarity(vector_a, vector_b):
@@ -1,10 +1,59 @@
 """The mouse listener code. Outputs the mouse screen interaction"""
-import time
+from functools import wraps
 
-import pyautogui
 from multipledispatch import dispatch
 
-pyautogui.FAILSAFE = False
+from src.clock import get_clock
+
+# the object the mouse and keyboard actions are sent to, with the
+# pyautogui functions the controllers use
+_input_backend = None
+# counts the mouse and keyboard actions, anything captured from the screen
+# before an action is outdated afterwards.
+_input_epoch = 0
+
+
+def input_epoch() -> int:
+    """Returns the number of input actions performed so far"""
+    return _input_epoch
+
+
+def get_input_backend():
+    """
+    Returns the input backend, pyautogui unless replaced. pyautogui is
+    only imported on first use, as it needs a display.
+    """
+    global _input_backend
+    if _input_backend is None:
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        _input_backend = pyautogui
+    return _input_backend
+
+
+def set_input_backend(backend):
+    """
+    Replaces the input backend of the mouse and keyboard controllers.
+
+    :param backend: Provides the moveTo, move, position, click, drag,
+        hotkey, press and write functions of pyautogui
+    """
+    global _input_backend
+    _input_backend = backend
+
+
+def track_input(func):
+    """Marks a function as an input action that can change the screen"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        global _input_epoch
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _input_epoch += 1
+
+    return wrapper
 
 
 class KeyboardController:
@@ -13,6 +62,7 @@ class KeyboardController:
     """
 
     @staticmethod
+    @track_input
     def shake():
         """
         Initiate a shake on the bluestack app
@@ -20,50 +70,64 @@ class KeyboardController:
         Note: The cursor should be on the app before this else, shake will
         not occur
         """
-        pyautogui.hotkey('ctrl', '3')
+        get_input_backend().hotkey('ctrl', '3')
 
     @staticmethod
+    @track_input
     def home():
         """
         Initiate a home on the bluestack app
         Shake key combination is = Ctrl + Shift + 1.
         """
-        pyautogui.hotkey('ctrl', 'shift', '1')
+        get_input_backend().hotkey('ctrl', 'shift', '1')
 
     @staticmethod
+    @track_input
     def back():
         """
         Press the esc key to go back
         """
-        pyautogui.press('esc')
+        get_input_backend().press('esc')
 
     @staticmethod
+    @track_input
     def clear():
         """
         Press the backspace key to clear content
         """
-        pyautogui.press('backspace')
+        get_input_backend().press('backspace')
 
     @staticmethod
+    @track_input
     def write(message: str):
         """
         Write a set of contents
         """
-        pyautogui.write(message)
+        get_input_backend().write(message)
 
 
 class MouseController:
     """
     Mouse controller class
+
+    :param backend: The input backend of this mouse. Defaults to the
+        shared input backend.
     """
 
-    def __init__(self):
-        self._mouse = pyautogui
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def _mouse(self):
+        """Returns the input backend the mouse actions are sent to"""
+        return self._backend or get_input_backend()
 
+    @track_input
     def set_position(self, x, y):
         """Set the current mouse position"""
         self._mouse.moveTo(x, y)
 
+    @track_input
     def reset_position(self):
         """Reset the mouse position to 0, 0"""
         self._mouse.moveTo(0, 0)
@@ -74,22 +138,26 @@ class MouseController:
         return self._mouse.position()
 
     @dispatch(tuple)
+    @track_input
     def move(self, center: tuple):
         """Move mouse to a relative position"""
         self._mouse.move(*center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
 
     @dispatch(int, int)
+    @track_input
     def move(self, dx: int, dy: int):
         """Move mouse to a relative position"""
         self._mouse.move(dx, dy)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
 
+    @track_input
     def click(self,
               clicks: int = 1):
         """Perform a mouse click on the current mouse position"""
         self._mouse.click(clicks=clicks)
 
+    @track_input
     def drag(self, x: int, y: int, button: str = 'left'):
         """
         Drags the mouse to a given position.
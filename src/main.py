@@ -1,32 +1,56 @@
+import dataclasses
 import logging
-import time
-from typing import List
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
 
+from src.capture import ScreenCapture
+from src.clock import get_clock
 from src.farm.farming import Farm
 from src.game_launcher import GameLauncher
+from src.glyphs import get_recognizer
 from src.helper import output_log, get_traceback
-from src.listener import MouseController, KeyboardController
+from src.listener import MouseController, KeyboardController, \
+    get_input_backend, set_input_backend
 from src.profile import GameProfile, PlayerProfile
 from src.profile_loader import load_profiles
 from src.radar import Radar
+from src.scheduler import ProfileScheduler
+from src.session import SessionRecorder
 from src.zombies.zombies import Zombies
 
 
-def run_zombies(level: int, fleets: List[int]):
+def run_zombies(game_launcher: GameLauncher, level: int, fleets: List[int],
+                scheduler: Optional[ProfileScheduler], profile_name: str,
+                wait_for_fleets: bool = False):
     # zombie
-    zombie = Zombies(launcher)
+    zombie = Zombies(game_launcher)
+    if scheduler is None:
+        zombie.initialize_zombie()
+        print('------------------------.-----------------')
+        zombie.kill_zombies(level, fleets=fleets)
+        return
+    # resume the fleets still out from the last visit
+    zombie.fleet_scheduler = scheduler.fleet_scheduler(profile_name)
     zombie.initialize_zombie()
     print('------------------------.-----------------')
-    zombie.kill_zombies(level, fleets=fleets)
+    fuel = zombie.kill_zombies(level, fleets=fleets,
+                               wait_for_fleets=wait_for_fleets)
+    scheduler.record_fleets(profile_name, zombie.fleet_scheduler.returns())
+    scheduler.record_fuel(profile_name, fuel)
 
 
-def run_farming(farm_type, level):
+def run_farming(game_launcher: GameLauncher, farm_type, level,
+                scheduler: Optional[ProfileScheduler], profile_name: str):
     # farming
     farm = Farm(
         farm_type=farm_type,
         farm_level=level,
-        launcher=launcher)
-    farm.all_out_farming()
+        launcher=game_launcher)
+    deployed = farm.all_out_farming()
+    if scheduler is not None:
+        scheduler.record_farming(profile_name, deployed, farm.max_fleet,
+                                 farm.fleets_out)
 
 
 def kill_elite_zombie(zombie: Zombies):
@@ -41,9 +65,14 @@ def kill_elite_zombie(zombie: Zombies):
 
 def run_all_profiles(game_launcher: GameLauncher,
                      profile_launcher: GameProfile,
-                     game_profiles: List[PlayerProfile]):
+                     game_profiles: List[PlayerProfile],
+                     scheduler: ProfileScheduler = None):
     """
-    Run all game profiles available
+    Runs as many profile visits as there are game profiles. With a
+    scheduler, the scheduler picks the profile with the soonest useful work
+    for every visit and the visit waits until that work is due. Without
+    one every profile is run once in order and the zombie fleets are
+    waited for.
 
     :return:
     """
@@ -53,12 +82,30 @@ def run_all_profiles(game_launcher: GameLauncher,
     flag_bot = False
 
     elite_zombie = Zombies(game_launcher)
+    clock = get_clock()
     # run all game profiles
     for profile in game_profiles:
-        game_launcher.log_message(
-            f"######### Now launching profile {profile.name} ###########")
+        if scheduler is not None:
+            profile, start = scheduler.next_profile()
         try:
-            profile_launcher.load_profile(profile)
+            if scheduler is None:
+                game_launcher.log_message(
+                    f"######### Now launching profile {profile.name} "
+                    "###########")
+                profile_launcher.load_profile(profile)
+            elif profile.name != scheduler.current:
+                clock.sleep_until(start - scheduler.switch_cost)
+                game_launcher.log_message(
+                    f"######### Now launching profile {profile.name} "
+                    "###########")
+                profile_launcher.load_profile(profile)
+                scheduler.record_visit(profile.name)
+            else:
+                clock.sleep_until(start)
+                game_launcher.log_message(
+                    f"######### Staying on profile {profile.name} "
+                    "###########")
+                scheduler.record_visit(profile.name)
 
             # now we click on the reward that popups on the game screen.
             game_launcher.get_rewards()
@@ -66,20 +113,26 @@ def run_all_profiles(game_launcher: GameLauncher,
             game_launcher.reset_to_home()
             # shake to collect available resources
             game_launcher.keyboard.shake()
-            time.sleep(3)
+            clock.sleep(3)
             # Kill the Elite zombie if available
             kill_elite_zombie(elite_zombie)
 
             # Now do something with the loaded profile
             if profile.attack_zombies:
-                run_zombies(profile.zombie_level, profile.zombie_fleets)
+                # the farming fleets need the queues of the zombie fleets
+                run_zombies(game_launcher, profile.zombie_level,
+                            profile.zombie_fleets, scheduler, profile.name,
+                            wait_for_fleets=bool(profile.enable_farming))
             if profile.enable_farming:
-                run_farming(profile.farming_type, profile.farming_level)
+                run_farming(game_launcher, profile.farming_type,
+                            profile.farming_level, scheduler, profile.name)
         except Exception as error:
             game_launcher.log_message(
                 f"######### Error while processing profile {profile.name} "
                 "###########")
-            error_snapshot = game_launcher.get_game_screen()
+            if scheduler is not None:
+                scheduler.record_failure(profile.name)
+            error_snapshot = game_launcher.get_game_screen().copy()
             error_trace = get_traceback(error)
             error_mgs = str(error)
             profile_errors[profile.name] = [error_trace,error_mgs,
@@ -111,6 +164,19 @@ def run_all_profiles(game_launcher: GameLauncher,
     return flag_bot, profile_errors
 
 
+def new_session_file(log_dir: Path, keep: int) -> Path:
+    """
+    Returns the path of a new session file in the logs directory. The
+    oldest session files are removed, so at most keep are left with it.
+    """
+    sessions = sorted(log_dir.glob("session-*.aozs"),
+                      key=lambda path: path.stat().st_mtime)
+    for session_file in sessions[:max(len(sessions) - keep + 1, 0)]:
+        session_file.unlink()
+    return log_dir.joinpath(
+        datetime.now().strftime("session-%d-%m-%yT%H-%M-%S.aozs"))
+
+
 def log_errors(profile_game_errors: dict):
     """Logs all profile related errors"""
 
@@ -144,13 +210,36 @@ if __name__ == '__main__':
 
     clear_cache_counter = 0
     first_launch = True
-    # wait for 1 hour before trying again
+    # wait for 1 hour before trying again, also the longest the scheduler
+    # leaves a profile unvisited
     reload_time = 3600
+    # lets the ProfileScheduler pick the profile visits instead of running
+    # every profile in order and waiting the reload time
+    use_scheduler = True
+    # records every screen capture and input action into the logs
+    # directory, session_replay.py replays the run offline
+    record_session = False
+    # a new session file is started with every game relaunch, the oldest
+    # ones are removed and a session stops recording past the size limit
+    keep_sessions = 5
+    max_session_bytes = 2 * 1024 ** 3
+
+    recorder = None
+    capture_factory = None
+    if record_session:
+        log_dir = GameLauncher.cwd.joinpath(".logs")
+        log_dir.mkdir(parents=True, exist_ok=True)
+        recorder = SessionRecorder(new_session_file(log_dir, keep_sessions))
+        capture_factory = recorder.capture_factory(ScreenCapture)
+        set_input_backend(recorder.record_input(get_input_backend()))
 
     # Run game launcher
     launcher = GameLauncher(mouse, keyboard,
-                            cache=True, enable_debug=True)
+                            cache=True, enable_debug=True,
+                            capture_factory=capture_factory)
     launcher.start_game()
+    if recorder:
+        recorder.note("app_coordinates", launcher.app_coordinates)
 
     """
     image = launcher.get_game_screen()
@@ -166,6 +255,10 @@ if __name__ == '__main__':
 
     # Load the saved game profiles
     game_profiles = load_profiles()
+    if recorder:
+        recorder.note("profiles", [dataclasses.asdict(profile)
+                                   for profile in game_profiles])
+        recorder.note("reload_time", None if use_scheduler else reload_time)
 
     launcher.log_message(
         f"######### Loaded a total of {len(game_profiles)} profiles "
@@ -173,15 +266,27 @@ if __name__ == '__main__':
 
     # the profile launcher
     game_profile_launcher = GameProfile(launcher)
+    # decides the next profile to visit and when
+    profile_scheduler = ProfileScheduler(
+        game_profiles, max_idle=reload_time) if use_scheduler else None
 
     while True:
         # run all the game profiles
-        time.sleep(5)
+        get_clock().sleep(5)
         bot_error, game_errors = run_all_profiles(
             game_launcher=launcher,
             profile_launcher=game_profile_launcher,
-            game_profiles=game_profiles)
+            game_profiles=game_profiles,
+            scheduler=profile_scheduler)
         log_errors(game_errors)
+        # keep the glyphs learned in the cycle
+        get_recognizer().save()
+        if recorder and not recorder.closed and \
+                recorder.stats["bytes"] >= max_session_bytes:
+            launcher.log_message(
+                f"######### Session {recorder.path} is full, recording "
+                "stopped ###########")
+            recorder.close()
 
         if bot_error:
             # reset the game launcher again.
@@ -190,10 +295,12 @@ if __name__ == '__main__':
                 first_launch = False
                 clear_cache_counter = 0
                 launcher.clear_cache()
+                launcher.close()
 
                 # initialize a new launcher
                 launcher = GameLauncher(mouse, keyboard,
-                                        cache=True, enable_debug=True)
+                                        cache=True, enable_debug=True,
+                                        capture_factory=capture_factory)
                 # also reset the Radar instance.
                 Radar.reset()
                 # reset the profile launcher
@@ -201,9 +308,18 @@ if __name__ == '__main__':
                 game_profile_launcher = GameProfile(launcher)
 
             # relaunch game process again to fix issue
+            if recorder:
+                # the new session replays from the relaunch
+                recorder.rotate(new_session_file(log_dir, keep_sessions))
             launcher.start_game()
+            if recorder:
+                recorder.note("app_coordinates", launcher.app_coordinates)
+            # the loaded profile is not known after a relaunch
+            if profile_scheduler:
+                profile_scheduler.current = None
 
         else:
             clear_cache_counter = 0
-            # now wait again for a period of time before continuing
-            time.sleep(reload_time)
+            if not profile_scheduler:
+                # now wait again for a period of time before continuing
+                get_clock().sleep(reload_time)
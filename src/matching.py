@@ -0,0 +1,270 @@
+"""The template matching engines behind GameLauncher.find_target"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import cv2 as cv
+import imutils
+import numpy as np
+
+
+class Matcher(ABC):
+    """
+    Finds the best match of any of the templates in a reference image
+    over a series of reference scales.
+    """
+
+    @abstractmethod
+    def match(self, reference: np.ndarray, target: List[np.ndarray],
+              scales: np.ndarray) -> Optional[tuple]:
+        """
+        Finds the best template match over the scales of the reference.
+
+        :returns: The best template, its match value, location and the
+            resize ratio. None if no template fits in the reference.
+        """
+
+    def close(self):
+        """Releases the resources of the engine"""
+
+    @staticmethod
+    def _resized(reference: np.ndarray, scale: float) -> np.ndarray:
+        """Returns the reference resized to a scale of its width"""
+        width = int(reference.shape[1] * scale)
+        return reference if width == reference.shape[1] else \
+            imutils.resize(reference, width=width)
+
+
+class SweepMatcher(Matcher):
+    """Matches the full resolution templates against every scale"""
+
+    def match(self, reference: np.ndarray, target: List[np.ndarray],
+              scales: np.ndarray) -> Optional[tuple]:
+        # track matching history
+        found = None
+        # loop over for the best template match from a series of templates
+        for template in target:
+            t_w, t_h = template.shape[1], template.shape[0]
+            for scale in scales:
+                # resize the image according to the scale, and keep track
+                # of the ratio of the resizing
+                resized = self._resized(reference, scale)
+                # if the resized image is smaller than the template, then break
+                # from the loop
+                if resized.shape[0] < t_h or resized.shape[1] < t_w:
+                    break
+                # Apply template Matching
+                res = cv.matchTemplate(resized, template,
+                                       method=cv.TM_SQDIFF_NORMED)
+                min_val, _, min_loc, _ = cv.minMaxLoc(res)
+                if found is None or min_val < found[1]:
+                    r = reference.shape[1] / float(resized.shape[1])
+                    found = (template, min_val, min_loc, r)
+        return found
+
+
+class PyramidMatcher(Matcher):
+    """
+    Matches downsampled templates against a downsampled reference to
+    shortlist the candidate positions, then refines only those positions
+    at full resolution.
+
+    :param int level: The pyramid level matched first, every level halves
+        the size. Lowered for templates too small for it.
+    :param int candidates: The number of positions refined per scale
+    :param int min_size: The smallest template side matched at a level
+    """
+
+    def __init__(self, level: int = 2, candidates: int = 3,
+                 min_size: int = 8):
+        self.level = level
+        self.candidates = candidates
+        self.min_size = min_size
+
+    def _level_for(self, template: np.ndarray) -> int:
+        """Returns the deepest level keeping the template large enough"""
+        level = self.level
+        while level and min(template.shape[:2]) >> level < self.min_size:
+            level -= 1
+        return level
+
+    @staticmethod
+    def _downsample(image: np.ndarray, level: int) -> np.ndarray:
+        """Returns the image shrunk by a factor of 2 ** level"""
+        factor = 1 << level
+        return cv.resize(image, (max(1, image.shape[1] // factor),
+                                 max(1, image.shape[0] // factor)),
+                         interpolation=cv.INTER_AREA)
+
+    def _small_template(self, target: List[np.ndarray],
+                        template: np.ndarray, level: int) -> np.ndarray:
+        """
+        Returns the template at a pyramid level. It is cached with the
+        TemplateSet the template belongs to, so it goes when the template
+        registry drops the set.
+        """
+        pyramids = getattr(target, "pyramids", None)
+        if pyramids is None:
+            return self._downsample(template, level)
+        key = (id(template), level)
+        small = pyramids.get(key)
+        if small is None:
+            small = self._downsample(template, level)
+            pyramids[key] = small
+        return small
+
+    def _shortlist(self, result: np.ndarray,
+                   exclusion: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Returns the best positions of a match result, spread apart"""
+        result = result.copy()
+        positions = []
+        for _ in range(self.candidates):
+            min_val, _, min_loc, _ = cv.minMaxLoc(result)
+            if positions and min_val >= 1.0:
+                break
+            positions.append(min_loc)
+            x, y = min_loc
+            result[max(0, y - exclusion[1]):y + exclusion[1] + 1,
+                   max(0, x - exclusion[0]):x + exclusion[0] + 1] = 1.0
+        return positions
+
+    def match(self, reference: np.ndarray, target: List[np.ndarray],
+              scales: np.ndarray) -> Optional[tuple]:
+        found = None
+        for template in target:
+            t_w, t_h = template.shape[1], template.shape[0]
+            level = self._level_for(template)
+            factor = 1 << level
+            small_template = self._small_template(target, template, level)
+            s_h, s_w = small_template.shape[:2]
+            for scale in scales:
+                resized = self._resized(reference, scale)
+                if resized.shape[0] < t_h or resized.shape[1] < t_w:
+                    break
+                small = self._downsample(resized, level) if level else \
+                    resized
+                if small.shape[0] < s_h or small.shape[1] < s_w:
+                    break
+                coarse = cv.matchTemplate(small, small_template,
+                                          method=cv.TM_SQDIFF_NORMED)
+                r = reference.shape[1] / float(resized.shape[1])
+                for x, y in self._shortlist(coarse,
+                                            (max(1, s_w // 2),
+                                             max(1, s_h // 2))):
+                    # refine around the candidate at full resolution
+                    start_x = max(0, (x - 1) * factor)
+                    start_y = max(0, (y - 1) * factor)
+                    end_x = min(resized.shape[1], (x + 1) * factor + t_w)
+                    end_y = min(resized.shape[0], (y + 1) * factor + t_h)
+                    res = cv.matchTemplate(
+                        resized[start_y:end_y, start_x:end_x], template,
+                        method=cv.TM_SQDIFF_NORMED)
+                    min_val, _, min_loc, _ = cv.minMaxLoc(res)
+                    if found is None or min_val < found[1]:
+                        found = (template, min_val,
+                                 (start_x + min_loc[0], start_y + min_loc[1]),
+                                 r)
+        return found
+
+
+class ParallelMatcher(Matcher):
+    """
+    Evaluates every scale of a sweep concurrently on a thread pool,
+    matchTemplate releases the GIL while it runs. Every worker resizes the
+    reference to its scale and matches all the templates against it. Gives
+    the same match as the SweepMatcher over the templates kept by the
+    pruning, unless stop_below is set.
+
+    :param int workers: The pool size, the number of CPUs by default
+    :param float stop_below: Stops the search once a match value is at or
+        below it, scales not started yet are skipped. The match can then
+        differ from the sweep. Never stops early when None.
+    :param float prune_margin: Drops the templates whose coarse match is
+        worse than the best coarse match by more than this before the
+        full resolution sweep. No template is dropped when None.
+    :param int prune_level: The pyramid level of the coarse match
+    """
+
+    def __init__(self, workers: int = None,
+                 stop_below: Optional[float] = None,
+                 prune_margin: Optional[float] = 0.2,
+                 prune_level: int = 3):
+        self.workers = workers or os.cpu_count() or 1
+        self.stop_below = stop_below
+        self.prune_margin = prune_margin
+        self.prune_level = prune_level
+        self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                        thread_name_prefix="MatchThread")
+
+    def close(self):
+        """Stops the worker threads"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self, reference: np.ndarray,
+               target: List[np.ndarray]) -> List[int]:
+        """Returns the indices of the templates worth a full sweep"""
+        factor = 1 << self.prune_level
+        small_reference = PyramidMatcher._downsample(reference,
+                                                     self.prune_level)
+
+        def coarse_value(template: np.ndarray) -> Optional[float]:
+            if min(template.shape[:2]) < 2 * factor:
+                return None
+            small_template = PyramidMatcher._downsample(
+                template, self.prune_level)
+            if small_reference.shape[0] < small_template.shape[0] or \
+                    small_reference.shape[1] < small_template.shape[1]:
+                return None
+            res = cv.matchTemplate(small_reference, small_template,
+                                   method=cv.TM_SQDIFF_NORMED)
+            return cv.minMaxLoc(res)[0]
+
+        values = list(self._pool.map(coarse_value, target))
+        known = [value for value in values if value is not None]
+        if not known:
+            return list(range(len(target)))
+        best = min(known)
+        # templates too small for the coarse level are always kept
+        return [index for index, value in enumerate(values)
+                if value is None or value <= best + self.prune_margin]
+
+    def match(self, reference: np.ndarray, target: List[np.ndarray],
+              scales: np.ndarray) -> Optional[tuple]:
+        indices = range(len(target)) if self.prune_margin is None else \
+            self._prune(reference, target)
+        stop = threading.Event()
+
+        def evaluate(scale_index: int) -> List[tuple]:
+            if stop.is_set():
+                return []
+            resized = self._resized(reference, scales[scale_index])
+            r = reference.shape[1] / float(resized.shape[1])
+            results = []
+            for template_index in indices:
+                template = target[template_index]
+                if resized.shape[0] < template.shape[0] or \
+                        resized.shape[1] < template.shape[1]:
+                    continue
+                res = cv.matchTemplate(resized, template,
+                                       method=cv.TM_SQDIFF_NORMED)
+                min_val, _, min_loc, _ = cv.minMaxLoc(res)
+                # ties go to the pair the sweep would have seen first
+                results.append((min_val, template_index, scale_index,
+                                min_loc, r))
+                if self.stop_below is not None and \
+                        min_val <= self.stop_below:
+                    stop.set()
+                    break
+            return results
+
+        futures = [self._pool.submit(evaluate, scale_index)
+                   for scale_index in range(len(scales))]
+        results = [result for future in futures
+                   for result in future.result()]
+        if not results:
+            return None
+        min_val, template_index, _, min_loc, r = min(
+            results, key=lambda result: result[:3])
+        return target[template_index], min_val, min_loc, r
@@ -0,0 +1,102 @@
+"""
+Accuracy and latency of the parallel and pyramid matching engines against
+the full resolution sweep, over the bundled game screenshots.
+
+Every template folder is matched in every screenshot over the upper half
+of the sweep scales, or all the GameLauncher sweep scales with `--full`
+(a few seconds per folder). A match is counted as agreeing when its box
+overlaps the sweep box by at least half. Run from the `src`
+directory like the other demo scripts.
+"""
+import sys
+import time
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+
+from src.matching import SweepMatcher, PyramidMatcher, ParallelMatcher
+from src.templates import TemplateRegistry
+
+cwd = Path(__file__).cwd()
+sweep_scales = np.linspace(0.05, 1.0, 20)[::-1]
+if "--full" not in sys.argv:
+    sweep_scales = sweep_scales[sweep_scales >= 0.5]
+
+screenshots = sorted(cwd.joinpath("data", "game").glob("*.png")) + \
+    [cwd.joinpath("data", "screenshot.png")]
+template_dirs = sorted(path for path in cwd.joinpath("data", "game").iterdir()
+                       if path.is_dir())
+
+
+def box(found) -> tuple:
+    """Returns the match box in reference coordinates"""
+    template, _, (x, y), r = found
+    t_h, t_w = template.shape[:2]
+    return x * r, y * r, (x + t_w) * r, (y + t_h) * r
+
+
+def overlap(first: tuple, second: tuple) -> float:
+    """Returns the intersection over union of two boxes"""
+    width = min(first[2], second[2]) - max(first[0], second[0])
+    height = min(first[3], second[3]) - max(first[1], second[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area = (first[2] - first[0]) * (first[3] - first[1]) + \
+        (second[2] - second[0]) * (second[3] - second[1])
+    return intersection / (area - intersection)
+
+
+def timed(matcher, reference, target):
+    """Returns the match and its time in milliseconds"""
+    start = time.perf_counter()
+    found = matcher.match(reference, target, sweep_scales)
+    return found, (time.perf_counter() - start) * 1000
+
+
+registry = TemplateRegistry()
+engines = {"sweep": SweepMatcher(),
+           "parallel": ParallelMatcher(),
+           "pyramid 1/4": PyramidMatcher(level=2),
+           "pyramid 1/8": PyramidMatcher(level=3)}
+totals = {name: 0.0 for name in engines}
+agreed = {name: 0 for name in engines}
+value_gap = {name: [] for name in engines}
+pairs = 0
+
+for screenshot in screenshots:
+    reference = cv.imread(str(screenshot), cv.IMREAD_COLOR)
+    print(f"\n{screenshot.name} {reference.shape[1]}x{reference.shape[0]}")
+    print(f"{'target':<24}" + "".join(f"{name + ' (ms)':>20}"
+                                      for name in engines) + f"{'agree':>8}")
+    for directory in template_dirs:
+        target = registry.get(str(directory))
+        results = {name: timed(engine, reference, target)
+                   for name, engine in engines.items()}
+        sweep_found = results["sweep"][0]
+        if sweep_found is None:
+            continue
+        pairs += 1
+        agreement = ""
+        for name, (found, elapsed) in results.items():
+            totals[name] += elapsed
+            if found is not None and \
+                    overlap(box(found), box(sweep_found)) >= 0.5:
+                agreed[name] += 1
+                agreement += "y"
+            else:
+                agreement += "n"
+            if found is not None:
+                value_gap[name].append(found[1] - sweep_found[1])
+        print(f"{directory.name:<24}" +
+              "".join(f"{elapsed:>20.1f}" for _, elapsed in results.values())
+              + f"{agreement:>8}", flush=True)
+
+print(f"\n{'engine':<16}{'total (ms)':>12}{'speedup':>10}{'agree':>10}"
+      f"{'mean value gap':>18}")
+for name in engines:
+    print(f"{name:<16}{totals[name]:>12.1f}"
+          f"{totals['sweep'] / max(totals[name], 1e-6):>10.2f}"
+          f"{agreed[name] / max(pairs, 1):>10.2%}"
+          f"{np.mean(value_gap[name]) if value_gap[name] else 0:>18.4f}")
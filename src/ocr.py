@@ -1,4 +1,15 @@
-from typing import List, Optional, Union
+"""The OCR helpers and the OCR engines behind them"""
+import difflib
+import hashlib
+import logging
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union, Dict, Tuple, Callable, Any, \
+    Sequence
 
 import cv2
 import imutils
@@ -6,42 +17,421 @@ import numpy as np
 import pytesseract as ocr
 from imutils import contours
 
+from src.glyphs import get_recognizer, read_digits
 from src.helper import Coordinates
 
-ocr.pytesseract.tesseract_cmd = \
-    r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+try:
+    import tesserocr
+except ImportError:  # the in-process engine is optional
+    tesserocr = None
+
+WINDOWS_TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+WINDOWS_TESSDATA_PATH = r'C:\Program Files\Tesseract-OCR\tessdata'
+
+# the tesseract on the PATH is used when the Windows install is missing
+if os.path.isfile(WINDOWS_TESSERACT_CMD):
+    ocr.pytesseract.tesseract_cmd = WINDOWS_TESSERACT_CMD
+
+
+def default_tessdata_path() -> Optional[str]:
+    """
+    Returns the tessdata directory of the in-process engine: the
+    TESSDATA_PREFIX directory, else the Windows install when it exists.
+    None leaves it to the default tesserocr was built with.
+    """
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    if os.path.isdir(WINDOWS_TESSDATA_PATH):
+        return WINDOWS_TESSDATA_PATH
+    return None
+
+
+class OcrEngine(ABC):
+    """
+    The OCR engine interface. Engines take the same tesseract config
+    strings, e.g. r'-c tessedit_char_whitelist=0123456789 --oem 3 --psm 6'.
+    """
+
+    @abstractmethod
+    def image_to_string(self, image: np.ndarray, config: str = '') -> str:
+        """Returns the text found in the image"""
+
+    @abstractmethod
+    def image_to_data(self, image: np.ndarray,
+                      config: str = '') -> Dict[str, list]:
+        """
+        Returns the words found in the image with their bounding boxes
+        and confidences, using the keys of pytesseract's Output.DICT.
+        """
+
+
+class PytesseractEngine(OcrEngine):
+    """Runs a new tesseract process for every call"""
+
+    def image_to_string(self, image: np.ndarray, config: str = '') -> str:
+        return ocr.image_to_string(image, config=config)
+
+    def image_to_data(self, image: np.ndarray,
+                      config: str = '') -> Dict[str, list]:
+        return ocr.image_to_data(image, output_type=ocr.Output.DICT,
+                                 config=config)
+
+
+class TesserocrEngine(OcrEngine):
+    """
+    Keeps tesseract loaded in-process through tesserocr. One engine
+    instance is initialized per config and reused by every later call with
+    the same config.
+
+    The engine of the default config is initialized right away, so a
+    missing tessdata directory raises a RuntimeError here and not at the
+    first OCR call.
+
+    :param str tessdata_path: The tesseract tessdata directory. Defaults to
+        default_tessdata_path().
+    :param str lang: The tesseract language
+    """
+
+    def __init__(self, tessdata_path: str = None, lang: str = 'eng'):
+        if tesserocr is None:
+            raise ImportError("tesserocr is required for the in-process "
+                              "OCR engine")
+        self._tessdata_path = tessdata_path or default_tessdata_path()
+        self._lang = lang
+        self._apis: Dict[str, Tuple[object, threading.Lock]] = {}
+        self._lock = threading.Lock()
+        self._get_api('')
+
+    @staticmethod
+    def parse_config(config: str) -> Tuple[int, int, Dict[str, str]]:
+        """
+        Parses a tesseract config string.
+
+        :return: The oem, the psm and the '-c' variables.
+        """
+        oem = re.search(r'--oem\s+(\d+)', config)
+        psm = re.search(r'--psm\s+(\d+)', config)
+        variables = dict(re.findall(r'-c\s+(\w+)=(\S+)', config))
+        return (int(oem.group(1)) if oem else tesserocr.OEM.DEFAULT,
+                int(psm.group(1)) if psm else tesserocr.PSM.AUTO,
+                variables)
+
+    def _get_api(self, config: str) -> Tuple[object, threading.Lock]:
+        """Returns the initialized engine for a config"""
+        config = config.strip()
+        api = self._apis.get(config)
+        if api is not None:
+            return api
+        with self._lock:
+            if config not in self._apis:
+                oem, psm, variables = self.parse_config(config)
+                options = {"path": self._tessdata_path} \
+                    if self._tessdata_path else {}
+                tess_api = tesserocr.PyTessBaseAPI(
+                    lang=self._lang, oem=oem, psm=psm, **options)
+                for name, value in variables.items():
+                    tess_api.SetVariable(name, value)
+                self._apis[config] = (tess_api, threading.Lock())
+        return self._apis[config]
+
+    @staticmethod
+    def _set_image(api, image: np.ndarray):
+        """Hands the image pixels to the engine without an encode"""
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if len(image.shape) == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels,
+                          width * channels)
+
+    def image_to_string(self, image: np.ndarray, config: str = '') -> str:
+        api, lock = self._get_api(config)
+        with lock:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+
+    def image_to_data(self, image: np.ndarray,
+                      config: str = '') -> Dict[str, list]:
+        api, lock = self._get_api(config)
+        data = {key: [] for key in
+                ('text', 'conf', 'left', 'top', 'width', 'height')}
+        with lock:
+            self._set_image(api, image)
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                return data
+            level = tesserocr.RIL.WORD
+            for word in tesserocr.iterate_level(iterator, level):
+                try:
+                    text = word.GetUTF8Text(level)
+                except RuntimeError:
+                    continue
+                start_x, start_y, end_x, end_y = word.BoundingBox(level)
+                data['text'].append(text)
+                data['conf'].append(word.Confidence(level))
+                data['left'].append(start_x)
+                data['top'].append(start_y)
+                data['width'].append(end_x - start_x)
+                data['height'].append(end_y - start_y)
+        return data
+
+    def close(self):
+        """Releases all the initialized engines"""
+        with self._lock:
+            for api, _ in self._apis.values():
+                api.End()
+            self._apis.clear()
+
+
+class OcrCache:
+    """
+    A bounded LRU cache of OCR results, keyed by a hash of the image pixels
+    and the config. The same pixels are never sent to the engine twice.
+
+    :param int maxsize: The maximum number of results kept
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, image: np.ndarray, config: str) -> tuple:
+        """Returns the cache key of an OCR call"""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(image.data, digest_size=16).digest()
+        return kind, digest, image.shape, image.dtype.str, config.strip()
+
+    def get_or_run(self, key: tuple, run: Callable[[], Any]) -> Any:
+        """Returns the cached result or runs the OCR and caches it"""
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            self.misses += 1
+        result = run()
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def info(self) -> Dict[str, int]:
+        """Returns the hit and miss counters and the cache size"""
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._results), "maxsize": self.maxsize}
+
+    def clear(self):
+        """Drops all the cached results and resets the counters"""
+        with self._lock:
+            self._results.clear()
+            self.hits, self.misses = 0, 0
+
+
+class OcrExecutor:
+    """
+    Runs the OCR of several candidate (image, config) pairs on a worker
+    pool and keeps the first valid result by priority.
+
+    Every call site keeps count of which of its candidates gave the
+    result, and its candidates are tried most successful first.
+
+    :param int workers: The number of OCR worker threads
+    """
+
+    def __init__(self, workers: int = 3):
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix="OcrThread")
+        self._wins: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def stats(self, site: str) -> Dict[int, int]:
+        """Returns how often each candidate index of a call site won"""
+        return dict(self._wins.get(site, {}))
+
+    def run(self, site: str,
+            candidates: Sequence[Tuple[np.ndarray, str]],
+            read: Callable[[np.ndarray, str], Any] = None,
+            valid: Callable[[Any], bool] = bool) -> Optional[Tuple[int, Any]]:
+        """
+        Reads all the candidates and returns the valid result with the
+        highest priority. The candidates not started yet are cancelled
+        once it is known, or when a read raises.
+
+        :param site: The name of the call site the statistics are kept for
+        :param candidates: The (image, config) pairs in their default order
+        :param read: The OCR function called with an image and a config.
+            Defaults to get_text_from_image.
+        :param valid: Checks if a result can be used
+        :return: The index of the winning candidate and its result, or None
+            if no result is valid.
+        """
+        read = read or get_text_from_image
+        with self._lock:
+            wins = self._wins.setdefault(site, Counter())
+            order = sorted(range(len(candidates)),
+                           key=lambda index: -wins[index])
+        futures = [self._pool.submit(read, *candidates[index])
+                   for index in order]
+        try:
+            for rank, index in enumerate(order):
+                result = futures[rank].result()
+                if valid(result):
+                    with self._lock:
+                        wins[index] += 1
+                    return index, result
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        """Stops the worker threads"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_engine: Optional[OcrEngine] = None
+_executor: Optional[OcrExecutor] = None
+_cache = OcrCache()
+
+
+def get_engine() -> OcrEngine:
+    """
+    Returns the OCR engine in use. Defaults to the in-process engine when
+    tesserocr is installed and finds its tessdata, otherwise to a tesseract
+    process per call.
+    """
+    global _engine
+    if _engine is None:
+        if tesserocr is not None:
+            try:
+                _engine = TesserocrEngine()
+            except RuntimeError as error:
+                logging.warning(f"In-process OCR engine not available, "
+                                f"using tesseract processes - {error}")
+        if _engine is None:
+            _engine = PytesseractEngine()
+    return _engine
+
+
+def set_engine(engine: OcrEngine):
+    """Replaces the OCR engine used by all the OCR helpers"""
+    global _engine
+    _engine = engine
+    _cache.clear()
+
+
+def get_executor() -> OcrExecutor:
+    """Returns the OCR executor shared by the OCR fallbacks"""
+    global _executor
+    if _executor is None:
+        _executor = OcrExecutor()
+    return _executor
+
+
+def ocr_cache_info() -> Dict[str, int]:
+    """Returns the OCR cache hit and miss counters and size"""
+    return _cache.info()
+
+
+def clear_ocr_cache(maxsize: int = None):
+    """
+    Clears the OCR cache.
+
+    :param maxsize: A new size limit for the cache. 0 disables caching.
+    """
+    if maxsize is not None:
+        _cache.maxsize = maxsize
+    _cache.clear()
+
+
+def _image_to_string(image: np.ndarray, config: str) -> str:
+    """Runs the engine text OCR through the cache"""
+    return _cache.get_or_run(
+        OcrCache.make_key('string', image, config),
+        lambda: get_engine().image_to_string(image, config=config))
+
+
+def _image_to_data(image: np.ndarray, config: str) -> Dict[str, list]:
+    """Runs the engine word OCR through the cache"""
+    return _cache.get_or_run(
+        OcrCache.make_key('data', image, config),
+        lambda: get_engine().image_to_data(image, config=config))
 
 
 def ocr_from_contour(image: np.ndarray,
-                     config: str = r'--oem 3 --psm 10'):
+                     config: str = r'--oem 3 --psm 10',
+                     batch: bool = True):
     """
     Perform OCR on a given image by extracting all the
     contours out first and then applying the ocr to each single
     contour and joining the final result together.
 
+    In batch mode the contour crops are laid out side by side on one
+    canvas that is read once as a single text line. It falls back to one
+    OCR call per contour when the line does not read one character per
+    contour.
+
     :param config: A custom config
     :param image: The input image
+    :param batch: Read all the contours in a single OCR call
     :return: Detected text in image
     """
     cnts = cv2.findContours(image.copy(), cv2.RETR_EXTERNAL,
                             cv2.CHAIN_APPROX_SIMPLE)
     cnts = imutils.grab_contours(cnts)
+    if not cnts:
+        return ""
     cnts = contours.sort_contours(cnts,
                                   method="left-to-right")[0]
-    result = []
+    rois = []
     for c in cnts:
         (x, y, w, h) = cv2.boundingRect(c)
         area = cv2.contourArea(c)
         if area < 30:
             continue
         roi = image[y:y + h, x:x + w]
-        roi = cv2.resize(roi, (57, 88))
-        output = ocr.image_to_string(roi, config=config)
+        rois.append(cv2.resize(roi, (57, 88)))
+
+    if batch and rois:
+        output = "".join(
+            _image_to_string(_contour_canvas(rois),
+                             _single_line_config(config)).split())
+        if len(output) == len(rois):
+            return output
+
+    result = []
+    for roi in rois:
+        output = _image_to_string(roi, config)
         if output:
             result.append(output.strip())
     return "".join(result)
 
 
+def _contour_canvas(rois: List[np.ndarray], spacing: int = 20) -> np.ndarray:
+    """Lays out the character crops on one line with a fixed spacing"""
+    r_h, r_w = rois[0].shape[:2]
+    canvas = np.zeros((r_h + 2 * spacing,
+                       len(rois) * (r_w + spacing) + spacing),
+                      dtype=rois[0].dtype)
+    for index, roi in enumerate(rois):
+        start_x = spacing + index * (r_w + spacing)
+        canvas[spacing:spacing + r_h, start_x:start_x + r_w] = roi
+    return canvas
+
+
+def _single_line_config(config: str) -> str:
+    """Returns the config with the page segmentation set to a single line"""
+    if re.search(r'--psm\s+\d+', config):
+        return re.sub(r'--psm\s+\d+', '--psm 7', config)
+    return f'{config} --psm 7'
+
+
 def get_text_from_image(image: np.ndarray, config: str = '') -> str:
     """
     Perform OCR on a given image and returns the detected
@@ -51,7 +441,146 @@ def get_text_from_image(image: np.ndarray, config: str = '') -> str:
     :param image: The input image
     :return: Text in image
     """
-    return ocr.image_to_string(image, config=config).strip()
+    return _image_to_string(image, config).strip()
+
+
+def get_digits_from_image(image: np.ndarray,
+                          configs: Union[str, List[str]] = '',
+                          pattern: str = r'\d+',
+                          fallbacks: Sequence[np.ndarray] = (),
+                          site: str = 'digits') -> str:
+    """
+    Reads a binarized digit readout with the glyph recognizer. Falls back
+    to the OCR engine when a glyph is not recognized, and teaches the
+    recognizer the readouts the engine reads.
+
+    :param image: The inRange output, text pixels are non zero.
+    :param configs: The engine configs to try
+    :param pattern: The regex a valid readout matches
+    :param fallbacks: Other processed versions of the readout the engine
+        can read when the image itself gives no valid readout
+    :param site: The call site name the OcrExecutor keeps statistics for
+    :return: The readout text, the first non empty text when no readout
+        is valid.
+    """
+    text = read_digits(image, pattern)
+    if text is not None:
+        return text
+    if isinstance(configs, str):
+        configs = [configs]
+    candidates = [(candidate, config)
+                  for candidate in [image, *fallbacks]
+                  for config in configs]
+    winner = get_executor().run(
+        site, candidates,
+        valid=lambda result: bool(re.fullmatch(pattern, result)))
+    if winner is not None:
+        index, text = winner
+        if index < len(configs):
+            get_recognizer().learn(image, text)
+        return text
+    # the results are all cached by now
+    for candidate, config in candidates:
+        text = get_text_from_image(candidate, config)
+        if text:
+            return text
+    return ''
+
+
+class OcrResult:
+    """
+    The words the OCR engine found in an image, indexed by their
+    normalized text so any number of words can be looked up without
+    running the engine again.
+
+    :param dict data: The engine image_to_data output
+    """
+
+    def __init__(self, data: Dict[str, list]):
+        self.words: List[Tuple[str, Coordinates, float]] = []
+        self._index: Dict[str, List[int]] = {}
+        for index, text in enumerate(data.get("text") or []):
+            word = self.normalize(text)
+            confidence = float(data['conf'][index])
+            if not word or confidence < 0:
+                continue
+            box = Coordinates(
+                start_x=data['left'][index],
+                end_x=data['left'][index] + data['width'][index],
+                start_y=data['top'][index],
+                end_y=data['top'][index] + data['height'][index]
+            )
+            self._index.setdefault(word, []).append(len(self.words))
+            self.words.append((word, box, confidence))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Returns the text in the form it is indexed by"""
+        return text.lower().strip()
+
+    @staticmethod
+    def _in_region(box: Coordinates, region: Optional[Coordinates]) -> bool:
+        """Checks if the center of a box lies inside the region"""
+        if region is None:
+            return True
+        center_x = (box.start_x + box.end_x) / 2
+        center_y = (box.start_y + box.end_y) / 2
+        return region.start_x <= center_x < region.end_x and \
+            region.start_y <= center_y < region.end_y
+
+    def find_all(self, match: Union[str, List[str]],
+                 partial: bool = False, fuzzy: float = 0.0,
+                 region: Optional[Coordinates] = None) -> List[Coordinates]:
+        """
+        Returns the bounding boxes of all the words matching the target,
+        in reading order.
+
+        :param match: The target word or a list of accepted words
+        :param partial: Also match words containing the target word. Not
+            used for a list of accepted words.
+        :param fuzzy: When nothing matches, accept the closest words with
+            at least this similarity ratio between 0 and 1. 0 disables it.
+        :param region: Only search the words centered in this region
+        :return: The matched bounding boxes
+        """
+        targets = [match] if isinstance(match, str) else match
+        targets = [self.normalize(target) for target in targets]
+        matched = [word for word in self._index if word in targets or
+                   partial and isinstance(match, str) and targets[0] in word]
+        if not matched and fuzzy:
+            words = {word for word in self._index
+                     if any(self._in_region(self.words[index][1], region)
+                            for index in self._index[word])}
+            matched = [word for target in targets for word in
+                       difflib.get_close_matches(target, words,
+                                                 n=1, cutoff=fuzzy)]
+        # the first word in reading order wins, whether it matched
+        # exactly or partially
+        indices = sorted({index for word in matched
+                          for index in self._index[word]})
+        return [self.words[index][1] for index in indices
+                if self._in_region(self.words[index][1], region)]
+
+    def find(self, match: Union[str, List[str]],
+             partial: bool = False, fuzzy: float = 0.0,
+             region: Optional[Coordinates] = None) -> Optional[Coordinates]:
+        """
+        Returns the bounding box of the first word matching the target.
+        Takes the same arguments as find_all.
+        """
+        boxes = self.find_all(match, partial, fuzzy, region)
+        return boxes[0] if boxes else None
+
+
+def ocr_image(image: np.ndarray, config: str = '') -> OcrResult:
+    """
+    Perform OCR on a given image once and returns the indexed words
+
+    :param config: A custom config
+    :param image: The input image
+    :return: The words found in the image
+    """
+    return OcrResult(_image_to_data(image, config))
 
 
 def get_box_from_image(
@@ -67,37 +596,4 @@ def get_box_from_image(
     :param image: The input image
     :return: Text in image
     """
-    result = ocr.image_to_data(image,
-                               output_type=ocr.Output.DICT,
-                               config=config)
-    # print(ocr.image_to_string(image, config=config).strip())
-    matched_texts: List[str] = result.get("text")
-    if not matched_texts:
-        return None
-    for index, text in enumerate(matched_texts):
-        if not text:
-            continue
-        if isinstance(match, list):
-            if text.lower().strip() in match \
-                    and float(result['conf'][index]) >= 0:
-                break
-        else:
-            if text.lower().strip() == match.lower().strip() \
-                    and float(result['conf'][index]) >= 0:
-                break
-
-            if partial:
-                if match.lower().strip() in text.lower().strip() \
-                        and float(result['conf'][index]) >= 0:
-                    break
-    else:
-        return None
-    # returns the bounding box
-    bounding_box = Coordinates(
-        start_x=result['left'][index],
-        end_x=result['left'][index] + result['width'][index],
-        start_y=result['top'][index],
-        end_y=result['top'][index] + result['height'][index]
-    )
-
-    return bounding_box
+    return ocr_image(image, config).find(match, partial=partial)
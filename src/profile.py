@@ -1,15 +1,16 @@
 """The Game Profile is responsible for launching and managing all game
 profiles"""
-import time
 from dataclasses import dataclass
 from typing import List
 
 import cv2
 
+from src.clock import get_clock
 from src.constants import BOTTOM_IMAGE, TOP_IMAGE
 from src.exceptions import ProfileException
 from src.game_launcher import GameLauncher
 from src.helper import GameHelper, Coordinates, click_on_target, retry
+from src.ocr import get_executor
 
 
 @dataclass
@@ -64,7 +65,7 @@ class GameProfile:
                                     account_cords.start_y)
         launcher.mouse.move(center)
         launcher.mouse.click()
-        time.sleep(2)
+        launcher.wait_until_stable(timeout=2)
 
     @retry(exception=ProfileException,
            message="Switch account button not found",
@@ -89,7 +90,7 @@ class GameProfile:
                                          area_cords_relative.start_y)
         self.launcher.mouse.move(center)
         self.launcher.mouse.click()
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
         # finding the login button
         self._activate_login_in_switch()
 
@@ -120,7 +121,7 @@ class GameProfile:
         click_on_target(
             login_cords, login_cords_relative, self.launcher.mouse
         )
-        time.sleep(5)
+        self.launcher.wait_until_stable(timeout=5)
 
     @retry(exception=ProfileException,
            message="Profile not found",
@@ -148,7 +149,7 @@ class GameProfile:
         click_on_target(location,
                         profile_cords_relative,
                         self.launcher.mouse)
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
         self._activate_continue_on_profile(targets[0])
 
     @retry(exception=ProfileException,
@@ -168,7 +169,7 @@ class GameProfile:
         click_on_target(location,
                         continue_cords_relative,
                         self.launcher.mouse)
-        time.sleep(5)
+        self.launcher.wait_until_stable(timeout=5)
 
     def get_all_profiles(self):
         """
@@ -184,12 +185,12 @@ class GameProfile:
                                          account_cords.start_y)
         self.launcher.mouse.move(center)
         self.launcher.mouse.click()
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
         # Activate the account switching mode
         self.activate_switch_account()
         # Show the complete profile
         self._show_complete_profile()
-        time.sleep(2)
+        get_clock().sleep(2)
 
     def _show_complete_profile(self):
         """
@@ -241,29 +242,24 @@ class GameProfile:
         images = (profile_area_image, gray, gradient)
 
         ocr_settings = (3, 4, 6)
-        found = False
-        location = None
-        for image in images:
-            for psm in ocr_settings:
-                config = fr'-c tessedit_char_blacklist=_ --oem 3 --psm {psm}'
-
-                location = self.launcher.find_ocr_target(target,
-                                                         image,
-                                                         config)
-                if location:
-                    found = True
-                    break
-            if found:
-                break
-        else:
+        candidates = [
+            (image, fr'-c tessedit_char_blacklist=_ --oem 3 --psm {psm}')
+            for image in images for psm in ocr_settings]
+        # all the image and psm pairs are read at once
+        winner = get_executor().run(
+            'activate_target_in_profile', candidates,
+            lambda image, config: self.launcher.find_ocr_target(
+                target, image, config))
+        if not winner:
             self.launcher.log_message(f"Account target {target} not found")
             raise ProfileException("Account not found")
+        _, location = winner
 
         click_on_target(location,
                         profile_cords_relative,
                         self.launcher.mouse)
 
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
         # search for the confirm screen mode
         confirm_area_image, area_cords_relative = self.launcher. \
             get_confirm_view()
@@ -296,5 +292,6 @@ class GameProfile:
         self.go_to_profile(profile)
         # now activate the profile
         self.activate_target_in_profile(profile.name)
-        # now wait for some time for the profile to load fully
-        time.sleep(30)
+        # now wait for the profile to load fully
+        self.launcher.wait_until(self.launcher.is_game_loaded, timeout=30,
+                                 interval=1)
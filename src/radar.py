@@ -1,17 +1,18 @@
 """Responsible for managing the radar"""
-import time
 from datetime import timedelta
 from functools import cached_property
+from typing import Optional
 
 import cv2
 import numpy as np
 
+from src.clock import get_clock
 from src.constants import OUTSIDE_VIEW, BOTTOM_IMAGE, TOP_IMAGE, RIGHT_IMAGE, \
     LEFT_IMAGE
 from src.exceptions import RadarException
 from src.game_launcher import GameLauncher
 from src.helper import Coordinates, GameHelper, retry
-from src.ocr import get_text_from_image, ocr_from_contour
+from src.ocr import get_digits_from_image, ocr_from_contour
 
 
 class Radar:
@@ -67,14 +68,16 @@ class Radar:
     def go_button(self) -> Coordinates:
         """Returns the go button coordinates"""
         if not self._go_button:
-            self._go_button = self.get_go_button()
+            self._go_button = self.launcher.find_element(
+                'go-button', 'go-button', self.get_go_button)
         return self._go_button
 
     @property
     def radar_coordinates(self) -> Coordinates:
         """Returns the radar button coordinates"""
         if not self._radar_coordinates:
-            self._radar_coordinates = self.find_radar()
+            self._radar_coordinates = self.launcher.find_element(
+                'radar', 'radar', self.find_radar)
         return self._radar_coordinates
 
     @retry(exception=RadarException,
@@ -115,11 +118,11 @@ class Radar:
             "################ Activating the radar screen ################")
         self.launcher.mouse.set_position(self.radar_coordinates.start_x,
                                          self.radar_coordinates.start_y)
-        time.sleep(1)
+        get_clock().sleep(1)
         self.launcher.mouse.move(GameHelper.get_center(
             self.radar_coordinates))
         self.launcher.mouse.click()
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
 
     def select_radar_menu(self, menu: int):
         """
@@ -163,7 +166,7 @@ class Radar:
             current_cords.start_x, current_cords.start_y)
         self.launcher.mouse.move(*center)
         self.launcher.mouse.click()
-        time.sleep(2)
+        self.launcher.wait_until_stable(timeout=2)
 
     def get_go_button(self) -> Coordinates:
         """
@@ -201,17 +204,18 @@ class Radar:
         white_channel = cv2.inRange(image_with_zeros, white_min, white_max)
         custom_config = r'-c tessedit_char_whitelist=:0123456789 ' \
                         r'--oem 3 --psm 6 '
-        result = get_text_from_image(white_channel, custom_config).strip()
-        if (not result or ':' not in result) and result != "0":
-            rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 5))
-            top_hat = cv2.morphologyEx(cv2.cvtColor(image_with_zeros,
-                                                    cv2.COLOR_BGR2GRAY),
-                                       cv2.MORPH_TOPHAT,
-                                       rect_kernel)
-            result = get_text_from_image(top_hat, custom_config).strip()
-
-            if not result:
-                raise RadarException("Can not extract set out time")
+        rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 5))
+        top_hat = cv2.morphologyEx(cv2.cvtColor(image_with_zeros,
+                                                cv2.COLOR_BGR2GRAY),
+                                   cv2.MORPH_TOPHAT,
+                                   rect_kernel)
+        # both versions are read at once, the white channel is preferred
+        result = get_digits_from_image(white_channel, custom_config,
+                                       r'0|\d+(:\d+)+',
+                                       fallbacks=[top_hat],
+                                       site='set_out_time')
+        if not result:
+            raise RadarException("Can not extract set out time")
 
         if result == "0":
             return int(result)
@@ -251,32 +255,35 @@ class Radar:
         Fetches the positions for the increase and decrease buttons
         :return:
         """
-        button_section, cords_relative = self.launcher. \
-            get_screen_section(10, BOTTOM_IMAGE)
+
+        def search(percentage: float, position: int, target: str):
+            def find_button() -> Optional[Coordinates]:
+                button_section, cords_relative = self.launcher. \
+                    get_screen_section(10, BOTTOM_IMAGE)
+                section, section_relative = self.launcher. \
+                    get_screen_section(percentage, position,
+                                       button_section, cords_relative)
+                cords = self.launcher.find_target(
+                    section, self.launcher.target_templates(target))
+                if not cords:
+                    return None
+                return GameHelper.get_relative_coordinates(
+                    section_relative, cords)
+
+            return find_button
+
         # get the decrease button
-        decrease_section, decrease_relative = self.launcher. \
-            get_screen_section(30, LEFT_IMAGE,
-                               button_section, cords_relative)
-        decrease_cords = self.launcher.find_target(
-            decrease_section,
-            self.launcher.target_templates('zombie-decrease'))
-        if not decrease_cords:
+        self._decrease_btn_cords = self.launcher.find_element(
+            'zombie-decrease', 'zombie-decrease',
+            search(30, LEFT_IMAGE, 'zombie-decrease'))
+        if not self._decrease_btn_cords:
             raise RadarException("Decrease button not found")
-        self._decrease_btn_cords = GameHelper.get_relative_coordinates(
-            decrease_relative,
-            decrease_cords)
         # get the increase button
-        increase_section, increase_relative = self.launcher. \
-            get_screen_section(40, RIGHT_IMAGE,
-                               button_section, cords_relative)
-        increase_cords = self.launcher.find_target(
-            increase_section,
-            self.launcher.target_templates('zombie-increase'))
-        if not increase_cords:
+        self._increase_btn_cords = self.launcher.find_element(
+            'zombie-increase', 'zombie-increase',
+            search(40, RIGHT_IMAGE, 'zombie-increase'))
+        if not self._increase_btn_cords:
             raise RadarException("Increase button not found")
-        self._increase_btn_cords = GameHelper.get_relative_coordinates(
-            increase_relative,
-            increase_cords)
 
     def adjust_level(self, level_type: str, increase_count: int):
         """
@@ -299,10 +306,10 @@ class Radar:
             self.launcher.mouse.move(*center)
         else:
             raise RadarException('Level type not supported')
-        time.sleep(1)
+        get_clock().sleep(1)
         for _ in range(increase_count):
             self.launcher.mouse.click()
-            time.sleep(0.5)
+            get_clock().sleep(0.5)
 
     def set_level(self, level: int, max_level: int):
         """
@@ -348,8 +355,8 @@ class Radar:
                         r'--oem 3 --psm 6'
         custom_config2 = r'-c tessedit_char_whitelist=0123456789 ' \
                          r'--oem 3 --psm 10'
-        level_val = get_text_from_image(image_processed,
-                                        custom_config)
+        level_val = get_digits_from_image(image_processed,
+                                          custom_config, site='radar_level')
         level_val = level_val if level_val else \
             ocr_from_contour(image_processed, custom_config2)
         try:
@@ -362,6 +369,21 @@ class Radar:
             pass
         raise RadarException(f"Current level {level_val} can not be extracted")
 
+    def _find_set_out_btn(self) -> Optional[Coordinates]:
+        """Searches the set out button in the bottom right of the screen"""
+        bottom_section, cords_relative = self.launcher. \
+            get_screen_section(13, BOTTOM_IMAGE)
+
+        bottom_section, cords_relative = self.launcher. \
+            get_screen_section(45, RIGHT_IMAGE,
+                               bottom_section, cords_relative)
+        cords = self.launcher.find_target(
+            bottom_section,
+            self.launcher.target_templates('setout'))
+        if not cords:
+            return None
+        return GameHelper.get_relative_coordinates(cords_relative, cords)
+
     @retry(exception=RadarException,
            message="No set-out button found",
            attempts=2)
@@ -379,28 +401,17 @@ class Radar:
             self.select_fleet(fleet_id)
 
         if not self._set_out_btn_cords:
-            bottom_section, cords_relative = self.launcher. \
-                get_screen_section(13, BOTTOM_IMAGE)
-
-            bottom_section, cords_relative = self.launcher. \
-                get_screen_section(45, RIGHT_IMAGE,
-                                   bottom_section, cords_relative)
-            cords = self.launcher.find_target(
-                bottom_section,
-                self.launcher.target_templates('setout'))
-            if not cords:
+            self._set_out_btn_cords = self.launcher.find_element(
+                'setout', 'setout', self._find_set_out_btn)
+            if not self._set_out_btn_cords:
                 raise RadarException("No set-out button found")
-            cords_relative = GameHelper. \
-                get_relative_coordinates(
-                cords_relative, cords)
-            self._set_out_btn_cords = cords_relative
 
         if not override_time:
-            time_section = self.launcher.get_screenshot()[
-                           self._set_out_btn_cords.start_y - 35:
-                           self._set_out_btn_cords.start_y,
-                           self._set_out_btn_cords.start_x:
-                           self._set_out_btn_cords.end_x - 20]
+            time_section = self.launcher.get_screenshot(Coordinates(
+                start_x=self._set_out_btn_cords.start_x,
+                start_y=self._set_out_btn_cords.start_y - 35,
+                end_x=self._set_out_btn_cords.end_x - 20,
+                end_y=self._set_out_btn_cords.start_y))
             set_time = self.get_set_out_time(time_section)
             return self._set_out_btn_cords, set_time
         else:
@@ -477,9 +488,9 @@ class Radar:
                                          target_roi.start_y)
         center = GameHelper.get_center(target_roi)
         self.launcher.mouse.move(center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
         return True
 
     @cached_property
@@ -490,26 +501,26 @@ class Radar:
         :return: An enum of the game fleets coordinates
         """
 
-        area_image, area_cords_relative = \
-            self.launcher.get_screen_section(30, TOP_IMAGE)
+        def find_fleets() -> Optional[Coordinates]:
+            area_image, area_cords_relative = \
+                self.launcher.get_screen_section(30, TOP_IMAGE)
+            cords = self.launcher.find_target(
+                area_image,
+                self.launcher.target_templates('fleets'),
+                threshold=0.1
+            )
+            if not cords:
+                return None
+            return GameHelper. \
+                get_relative_coordinates(area_cords_relative, cords)
 
-        cords = self.launcher.find_target(
-            area_image,
-            self.launcher.target_templates('fleets'),
-            threshold=0.1
-        )
-        if not cords:
+        cords_relative = self.launcher.find_element(
+            'fleets', 'fleets', find_fleets, threshold=0.1)
+        if not cords_relative:
             raise RadarException("Fleets area not found")
 
-        cords_relative = GameHelper. \
-            get_relative_coordinates(area_cords_relative, cords)
-
-        fleets = area_image[
-                 cords.start_y:cords.end_y,
-                 cords.start_x:cords.end_x
-                 ]
         # extract and categorizes fleets.
-        t_h, t_w, _ = fleets.shape
+        t_w = cords_relative.end_x - cords_relative.start_x
         fleet_dict = {}
 
         # each fleet takes about 14.3% in size
@@ -548,5 +559,5 @@ class Radar:
                                          fleet_cords.start_y)
         center = GameHelper.get_center(fleet_cords)
         self.launcher.mouse.move(center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
         self.launcher.mouse.click()
@@ -0,0 +1,371 @@
+"""Schedules the fleets and the game profiles by the time the fleets are
+back from their missions"""
+import bisect
+import heapq
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from src.clock import Clock, get_clock
+
+
+class FleetScheduler:
+    """
+    Keeps the fleets in a heap ordered by the time they are back, so the
+    dispatcher wakes exactly when the next fleet can be sent out again.
+    Fleets due at the same time come out in the order they were scheduled.
+
+    :param fleets: The fleets available right away
+    :param clock: The clock the return times are kept in. Defaults to the
+        clock shared by the game activities.
+    """
+
+    def __init__(self, fleets: Iterable[Hashable] = (),
+                 clock: Clock = None):
+        self.clock = clock or get_clock()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+        self._returns: Dict[Hashable, float] = {}
+        for fleet_id in fleets:
+            self.schedule(fleet_id)
+
+    def __len__(self):
+        return len(self._returns)
+
+    def __contains__(self, fleet_id: Hashable) -> bool:
+        return fleet_id in self._returns
+
+    def schedule(self, fleet_id: Hashable, delay: float = 0):
+        """
+        Sets when a fleet is available again, replacing any earlier time.
+
+        :param fleet_id: The fleet
+        :param delay: The seconds from now until the fleet is back
+        """
+        back_at = self.clock.now() + max(0.0, delay)
+        self._returns[fleet_id] = back_at
+        heapq.heappush(self._heap, (back_at, next(self._counter), fleet_id))
+
+    def remove(self, fleet_id: Hashable):
+        """Stops scheduling a fleet"""
+        self._returns.pop(fleet_id, None)
+
+    def _drop_stale(self):
+        """Pops the heap entries replaced by a later schedule"""
+        while self._heap:
+            back_at, _, fleet_id = self._heap[0]
+            if self._returns.get(fleet_id) == back_at:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[Tuple[float, Hashable]]:
+        """Returns the time the next fleet is back and the fleet"""
+        self._drop_stale()
+        if not self._heap:
+            return None
+        back_at, _, fleet_id = self._heap[0]
+        return back_at, fleet_id
+
+    def pop(self) -> Optional[Hashable]:
+        """Removes the next fleet to be back, whether it is back or not"""
+        self._drop_stale()
+        if not self._heap:
+            return None
+        _, _, fleet_id = heapq.heappop(self._heap)
+        del self._returns[fleet_id]
+        return fleet_id
+
+    def due(self) -> List[Hashable]:
+        """Removes and returns all the fleets back by now"""
+        now = self.clock.now()
+        fleets = []
+        while True:
+            next_due = self.next_due()
+            if next_due is None or next_due[0] > now:
+                return fleets
+            fleets.append(self.pop())
+
+    def wait(self) -> Optional[Hashable]:
+        """
+        Sleeps until the next fleet is back and removes it.
+
+        :return: The fleet, or None if no fleet is scheduled.
+        """
+        next_due = self.next_due()
+        if next_due is None:
+            return None
+        self.clock.sleep_until(next_due[0])
+        return self.pop()
+
+    def returns(self) -> Dict[Hashable, float]:
+        """Returns the time every scheduled fleet is back"""
+        return dict(self._returns)
+
+
+@dataclass
+class ProfileState:
+    """What is known about the activities of a game profile"""
+    fleet_returns: Dict[int, float] = field(default_factory=dict)
+    fuel: Optional[int] = None
+    fuel_read_at: float = 0.0
+    # the time every farming fleet believed out was sent out and last seen
+    # out, None until the profile farmed once
+    farm_fleets: Optional[List[Tuple[float, float]]] = None
+    # farming sent no fleet out, it is tried again from then on
+    farm_retry_at: Optional[float] = None
+    max_fleet: Optional[int] = None
+    blocked_until: float = 0.0
+    visited_at: Optional[float] = None
+
+
+class ProfileScheduler:
+    """
+    Decides which game profile to switch to next, and when, so the most
+    fleets are sent out per hour.
+
+    Every profile visit records when the zombie fleets are back, the fuel
+    left and the farming fleets sent out. The game does not tell how long
+    the farming fleets stay out, the fleets seen out on every visit tell
+    which ones are back though, and the scheduler learns the farming
+    durations from them. The next visit is the soonest one expected to
+    send out at least min_dispatches fleets, trying the times fleets are
+    likely back as later start times. The fleet queues stay busy the most
+    that way, waiting for more fleets to be back leaves the ones back
+    idle. Of the visits worth starting right away, the one with the most
+    dispatches per second of the switch, the visit and the dispatches goes
+    first.
+
+    :param profiles: The player profiles, in their preferred order. Only
+        their name, zombie_fleets, attack_zombies and enable_farming are
+        used.
+    :param float switch_cost: The seconds it takes to load a profile and
+        navigate back to the game screen
+    :param float dispatch_cost: The seconds it takes to send out a fleet
+    :param float visit_cost: The seconds a visit takes besides the switch
+        and the dispatches, collecting the rewards and reading the screens
+    :param float min_dispatches: The fleets a visit is expected to send
+        out at least
+    :param int min_mobility: The fuel zombies are killed down to
+    :param int fuel_per_attack: The fuel a zombie attack uses
+    :param float fuel_per_hour: The fuel regained per hour
+    :param float farm_duration: The seconds farming fleets are assumed to
+        stay out until a farming fleet is seen back
+    :param int farm_samples: The most recent farming durations learned
+    :param float max_idle: The longest time a profile is left unvisited
+        when nothing is known to be due, like the old reload time
+    :param clock: The clock the times are kept in. Defaults to the clock
+        shared by the game activities.
+    """
+
+    def __init__(self, profiles: Iterable, switch_cost: float = 30.0,
+                 dispatch_cost: float = 20.0, visit_cost: float = 60.0,
+                 min_dispatches: float = 0.5, min_mobility: int = 10,
+                 fuel_per_attack: int = 10, fuel_per_hour: float = 10.0,
+                 farm_duration: float = 7200.0, farm_samples: int = 50,
+                 max_idle: float = 3600.0, clock: Clock = None):
+        self.profiles = list(profiles)
+        self.switch_cost = switch_cost
+        self.dispatch_cost = dispatch_cost
+        self.visit_cost = visit_cost
+        self.min_dispatches = min_dispatches
+        self.min_mobility = min_mobility
+        self.fuel_per_attack = fuel_per_attack
+        self.fuel_per_hour = fuel_per_hour
+        self.farm_duration = farm_duration
+        self.farm_durations = deque(maxlen=farm_samples)
+        self.max_idle = max_idle
+        self.clock = clock or get_clock()
+        self.states: Dict[str, ProfileState] = {
+            profile.name: ProfileState() for profile in self.profiles}
+        self.current: Optional[str] = None
+
+    def record_visit(self, name: str):
+        """Records that a profile is loaded now"""
+        self.current = name
+        self.states[name].visited_at = self.clock.now()
+
+    def record_fleets(self, name: str, returns: Dict[int, float]):
+        """Records the time every zombie fleet of a profile is back"""
+        self.states[name].fleet_returns = dict(returns)
+
+    def record_fuel(self, name: str, fuel: Optional[int]):
+        """Records the fuel a profile has left now"""
+        if fuel is None:
+            return
+        state = self.states[name]
+        state.fuel, state.fuel_read_at = fuel, self.clock.now()
+
+    def record_farming(self, name: str, deployed: int,
+                       max_fleet: Optional[int] = None,
+                       fleets_out: Optional[int] = None):
+        """
+        Records the farming fleets sent out now, and learns the farming
+        durations from the fleets that were out before. When none could be
+        sent out and no farming fleet is out, farming is tried again after
+        the expected farming duration.
+
+        :param name: The profile name
+        :param deployed: The farming fleets sent out
+        :param max_fleet: The fleet queues of the profile, shared by the
+            zombie and the farming fleets
+        :param fleets_out: The fleets out before the farming fleets were
+            sent, the zombie fleets included, when they were read
+        """
+        state = self.states[name]
+        if max_fleet:
+            state.max_fleet = max_fleet
+        now = self.clock.now()
+        farming = sorted(state.farm_fleets or [])
+        if fleets_out is not None:
+            farms_out = max(0, fleets_out - sum(
+                back_at > now for back_at in state.fleet_returns.values()))
+            back = max(0, len(farming) - farms_out)
+            # the fleets sent out first are taken as the ones back, they
+            # came back between the last visit and now
+            for sent_at, seen_at in farming[:back]:
+                self.farm_durations.append((seen_at + now) / 2 - sent_at)
+            farming = [(sent_at, now) for sent_at, _ in farming[back:]]
+            # fleets sent out by someone else, as if they were sent now
+            farming += [(now, now)] * (farms_out - len(farming))
+        farming += [(now, now)] * deployed
+        state.farm_fleets = farming
+        state.farm_retry_at = None
+        if not deployed and not farming:
+            state.farm_retry_at = now + self.expected_farm_duration()
+
+    def record_failure(self, name: str, delay: float = 600.0):
+        """Keeps a profile that failed out of the schedule for a while"""
+        self.states[name].blocked_until = self.clock.now() + delay
+
+    def fleet_scheduler(self, name: str) -> FleetScheduler:
+        """Returns a fleet scheduler with the zombie fleets of a profile"""
+        scheduler = FleetScheduler(clock=self.clock)
+        now = self.clock.now()
+        for fleet_id, back_at in self.states[name].fleet_returns.items():
+            scheduler.schedule(fleet_id, back_at - now)
+        return scheduler
+
+    def _durations(self) -> List[float]:
+        """Returns the farming durations learned, sorted"""
+        return sorted(self.farm_durations) or [self.farm_duration]
+
+    def expected_farm_duration(self) -> float:
+        """Returns the mean farming duration learned"""
+        durations = self._durations()
+        return sum(durations) / len(durations)
+
+    def _back_chance(self, durations: List[float], sent_at: float,
+                     seen_at: float, at: float) -> float:
+        """
+        Returns the chance a farming fleet is back at a time, knowing it was
+        still out when last seen.
+        """
+        def share(duration: float) -> float:
+            return bisect.bisect_right(durations, duration) / len(durations)
+
+        seen = share(seen_at - sent_at)
+        if seen >= 1:
+            # out longer than ever seen, it should be back any time
+            return 1.0
+        return max(0.0, share(at - sent_at) - seen) / (1 - seen)
+
+    def _fuel_at(self, state: ProfileState, at: float) -> Optional[float]:
+        """Returns the fuel a profile is expected to have at a time"""
+        if state.fuel is None:
+            return None
+        return state.fuel + \
+            self.fuel_per_hour * (at - state.fuel_read_at) / 3600
+
+    def dispatches(self, profile, at: float) -> float:
+        """Returns the fleets a profile is expected to send out at a time"""
+        state = self.states[profile.name]
+        durations = self._durations()
+        farms = sum(self._back_chance(durations, sent_at, seen_at, at)
+                    for sent_at, seen_at in state.farm_fleets or [])
+        if state.farm_fleets is None:
+            # never farmed, worth a try
+            farms = 1
+        elif state.farm_retry_at is not None and at >= state.farm_retry_at:
+            farms += 1
+        # fleet queues free at the time, when their number is known
+        free = float('inf')
+        if state.max_fleet:
+            free = max(0.0, state.max_fleet -
+                       len(state.farm_fleets or []) + farms -
+                       sum(back_at > at
+                           for back_at in state.fleet_returns.values()))
+        count = 0.0
+        if profile.attack_zombies:
+            fleets = profile.zombie_fleets or [1]
+            # fleets never sent out are back
+            back = sum(state.fleet_returns.get(fleet_id, at) <= at
+                       for fleet_id in fleets)
+            fuel = self._fuel_at(state, at)
+            if fuel is not None:
+                attacks = 0 if fuel < self.min_mobility else \
+                    int((fuel - self.min_mobility) //
+                        self.fuel_per_attack) + 1
+                back = min(back, attacks)
+            count += min(back, free)
+        if profile.enable_farming:
+            count += max(0.0, min(farms, free - count))
+        return count
+
+    def _start_times(self, profile, earliest: float) -> List[float]:
+        """Returns the start times worth trying for a profile"""
+        state = self.states[profile.name]
+        times = list(state.fleet_returns.values())
+        durations = self._durations()
+        # the farming fleets are likely back at the quantiles of the
+        # durations learned
+        quantiles = sorted({durations[int(len(durations) * share)]
+                            for share in (0.1, 0.3, 0.5, 0.7, 0.9)})
+        for sent_at, _ in state.farm_fleets or []:
+            times += [sent_at + duration for duration in quantiles]
+        if state.farm_retry_at is not None:
+            times.append(state.farm_retry_at)
+        fuel = self._fuel_at(state, earliest)
+        if fuel is not None and fuel < self.min_mobility and \
+                self.fuel_per_hour > 0:
+            # the time enough fuel for an attack is regained
+            times.append(earliest + (self.min_mobility - fuel) * 3600 /
+                         self.fuel_per_hour)
+        return [earliest] + sorted({at for at in times if at > earliest})
+
+    def next_profile(self) -> Tuple[object, float]:
+        """
+        Decides the next profile to load.
+
+        :return: The profile and the time to start its activities at. A
+            switch to another profile has to start switch_cost earlier.
+        """
+        now = self.clock.now()
+        best_now, best_rate = None, 0.0
+        best_later = None
+        for profile in self.profiles:
+            state = self.states[profile.name]
+            switch = 0.0 if profile.name == self.current else \
+                self.switch_cost
+            earliest = max(now + switch, state.blocked_until)
+            for start in self._start_times(profile, earliest):
+                gain = self.dispatches(profile, start)
+                if gain < self.min_dispatches:
+                    continue
+                if start <= now + switch:
+                    # worth a visit right away
+                    rate = gain / (switch + self.visit_cost +
+                                   gain * self.dispatch_cost)
+                    if rate > best_rate:
+                        best_now, best_rate = (profile, start), rate
+                elif best_later is None or start < best_later[1]:
+                    best_later = (profile, start)
+                # the later start times are no sooner
+                break
+        if best_now or best_later:
+            return best_now or best_later
+        # nothing known to be due, revisit the longest unvisited profile
+        profile = min(self.profiles, key=lambda item: (
+            self.states[item.name].visited_at or float('-inf')))
+        return profile, max(now + self.max_idle,
+                            self.states[profile.name].blocked_until)
@@ -0,0 +1,146 @@
+"""Tells which screen of the game is showing from a single frame"""
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+
+class ScreenClassifier:
+    """
+    Labels a game screen by comparing a compact descriptor of the frame,
+    colour histograms plus a tiny grayscale thumbnail, against reference
+    descriptors of known screens in a single matrix product.
+
+    The references are learned from the screens the slower template and
+    OCR probes identified, and kept in a npz file.
+
+    :param str references_path: The npz file the references are kept in.
+        They are only kept in memory when omitted.
+    :param float min_similarity: The lowest cosine similarity a label is
+        accepted with
+    :param float margin: How much closer the best label has to be than
+        any other label
+    :param int references_per_label: The most references kept per label
+    """
+    THUMBNAIL_SIZE = (12, 20)
+    HISTOGRAM_BINS = 8
+
+    def __init__(self, references_path: Optional[str] = None,
+                 min_similarity: float = 0.95, margin: float = 0.02,
+                 references_per_label: int = 8):
+        self.references_path = references_path
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.references_per_label = references_per_label
+        size = 3 * self.HISTOGRAM_BINS + \
+            self.THUMBNAIL_SIZE[0] * self.THUMBNAIL_SIZE[1]
+        self._references = np.empty((0, size), dtype=np.float32)
+        self._labels = np.empty(0, dtype=object)
+        self._lock = threading.Lock()
+        if references_path and Path(references_path).is_file():
+            self.load(references_path)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def load(self, references_path: str):
+        """Loads the reference screens from a npz file"""
+        with np.load(references_path, allow_pickle=False) as references:
+            descriptors = references["descriptors"].astype(np.float32)
+            labels = references["labels"].astype(str).astype(object)
+        if descriptors.shape[1:] != self._references.shape[1:]:
+            raise Exception(f"Screen references {references_path} "
+                            f"have the wrong size")
+        with self._lock:
+            self._references = descriptors
+            self._labels = labels
+
+    def save(self, references_path: Optional[str] = None):
+        """Writes the reference screens to a npz file"""
+        references_path = references_path or self.references_path
+        if not references_path:
+            return
+        with self._lock:
+            descriptors, labels = self._references, self._labels
+        np.savez_compressed(references_path, descriptors=descriptors,
+                            labels=labels.astype(str))
+
+    @classmethod
+    def describe(cls, frame: np.ndarray) -> np.ndarray:
+        """
+        Returns the descriptor of a BGR frame. The histogram and the
+        thumbnail halves have unit norm each, so the cosine similarity of
+        two descriptors is the mean of the similarity of both halves.
+        """
+        t_w, t_h = cls.THUMBNAIL_SIZE
+        small = cv.resize(frame, (4 * t_w, 4 * t_h),
+                          interpolation=cv.INTER_AREA)
+        # per channel colour histograms, compared by their square roots
+        bins = (small.reshape(-1, 3) // (256 // cls.HISTOGRAM_BINS)) + \
+            np.arange(3) * cls.HISTOGRAM_BINS
+        histogram = np.sqrt(np.bincount(
+            bins.ravel(), minlength=3 * cls.HISTOGRAM_BINS).astype(np.float32))
+        # the zero mean thumbnail compares the layout of the screen
+        thumbnail = cv.resize(cv.cvtColor(small, cv.COLOR_BGR2GRAY),
+                              cls.THUMBNAIL_SIZE,
+                              interpolation=cv.INTER_AREA).astype(np.float32)
+        thumbnail = thumbnail.ravel() - thumbnail.mean()
+
+        def unit(vector: np.ndarray) -> np.ndarray:
+            return vector / max(float(np.linalg.norm(vector)), 1e-6)
+
+        return np.concatenate([unit(histogram), unit(thumbnail)]) * \
+            np.float32(np.sqrt(0.5))
+
+    def similarities(self, frame: np.ndarray) -> Tuple[np.ndarray,
+                                                        np.ndarray]:
+        """Returns the reference labels and their similarity to the frame"""
+        with self._lock:
+            references, labels = self._references, self._labels
+        return labels, references @ self.describe(frame)
+
+    def classify(self, frame: np.ndarray) -> Tuple[Optional[str], float]:
+        """
+        Labels a frame of the game screen.
+
+        :param frame: The BGR game screen
+        :return: The label and its similarity. The label is None when the
+            screen is not recognized with enough confidence.
+        """
+        labels, similarity = self.similarities(frame)
+        if not len(labels):
+            return None, 0.0
+        best = int(similarity.argmax())
+        label, score = labels[best], float(similarity[best])
+        others = similarity[labels != label]
+        if score < self.min_similarity or \
+                (others.size and score - others.max() < self.margin):
+            return None, score
+        return label, score
+
+    def learn(self, label: str, frame: np.ndarray) -> bool:
+        """
+        Stores a frame as a reference of a label, unless a reference of
+        that label already matches it almost exactly.
+
+        :return: True if the references changed.
+        """
+        descriptor = self.describe(frame)
+        with self._lock:
+            same_label = self._labels == label
+            if same_label.any() and \
+                    (self._references[same_label] @ descriptor).max() > 0.99:
+                return False
+            if same_label.sum() >= self.references_per_label:
+                # drop the oldest reference of the label
+                oldest = np.flatnonzero(same_label)[0]
+                keep = np.arange(len(self._labels)) != oldest
+                self._references = self._references[keep]
+                self._labels = self._labels[keep]
+            self._references = np.vstack([self._references,
+                                          descriptor[None, :]])
+            self._labels = np.append(self._labels, label).astype(object)
+        self.save()
+        return True
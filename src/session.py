@@ -0,0 +1,527 @@
+"""
+Records the screen captures and the input actions of a bot run into a
+session file, and replays them offline.
+
+A session file starts with a magic header followed by records, each a
+kind, a timestamp in seconds since the recording started and the payload
+size, then the payload:
+
+- a frame record holds the frame id and the captured region. A frame not
+  seen before is followed by its png, or by the id of an earlier frame of
+  the region and the png of the difference to it, which compresses far
+  better as most of the screen stays the same. Repeated frames only refer
+  to the id of the first one.
+- an action record holds a mouse or keyboard action as json.
+- a note record holds a named json value, like the app coordinates.
+
+The records are appended as they happen, so the session of a run that
+crashed can still be replayed up to the crash. A long run is split into
+several session files with SessionRecorder.rotate(), each of them can be
+replayed on its own.
+"""
+import dataclasses
+import hashlib
+import json
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from src.capture import CaptureBackend
+from src.clock import Clock, get_clock
+from src.exceptions import SessionException
+from src.helper import Coordinates
+
+MAGIC = b"AOZSESSION1"
+# the record kind, timestamp and payload size
+_HEADER = struct.Struct("<BdI")
+# the frame id and the captured region, all -1 for the whole monitor
+_FRAME = struct.Struct("<I4i")
+# the id of the frame a new frame is the difference to, -1 for none
+_BASE = struct.Struct("<i")
+
+FRAME, ACTION, NOTE = 1, 2, 3
+
+# the input backend functions that act on the game
+INPUT_ACTIONS = ("moveTo", "move", "click", "drag", "hotkey", "press",
+                 "write")
+
+_WHOLE_MONITOR = (-1, -1, -1, -1)
+
+
+def _region_key(region: Optional[Coordinates]) -> Tuple[int, int, int, int]:
+    """Returns the region as the int tuple stored in the frame records"""
+    if region is None:
+        return _WHOLE_MONITOR
+    return (int(region.start_x), int(region.start_y),
+            int(region.end_x), int(region.end_y))
+
+
+def _jsonable(value):
+    """Converts the values json does not know, like numpy ints"""
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _normalize(value):
+    """Returns a value the way it reads back from a session file"""
+    return json.loads(json.dumps(value, default=_jsonable))
+
+
+class SessionRecorder:
+    """
+    Streams the screen captures and the input actions of a run into a
+    session file. Every distinct frame is stored once, as the difference to
+    the last frame of the same region, frames captured again only take a
+    few bytes.
+
+    The capture and input backends are wrapped with capture() and
+    record_input(), everything going through them is recorded.
+
+    :param path: The session file, overwritten if it exists
+    :param clock: The clock the timestamps are taken from. Defaults to the
+        clock shared by the game activities.
+    :param int compression: The png compression level, 0 to 9
+    :param int keyframe_interval: The most differences stored in a row
+        before a whole frame, which bounds the frames decoded to replay one
+    :param int max_frames: The most recent distinct frames remembered to
+        spot repeated frames. An older frame captured again is stored again.
+    """
+
+    def __init__(self, path, clock: Clock = None, compression: int = 3,
+                 keyframe_interval: int = 16, max_frames: int = 4096):
+        self.clock = clock or get_clock()
+        self._png_params = [cv.IMWRITE_PNG_COMPRESSION, compression]
+        self.keyframe_interval = keyframe_interval
+        self.max_frames = max_frames
+        # the capture stream records from its own thread
+        self._lock = threading.Lock()
+        # the last value of every note, written again to a rotated file
+        self._notes: Dict[str, Any] = {}
+        self._file = None
+        self._open(path)
+
+    def _open(self, path):
+        """Starts a new session file. Called with the lock held."""
+        self.path = Path(path)
+        # the id and the differences in a row up to it of recent frames,
+        # by the digest of the frame
+        self._frame_ids: OrderedDict[bytes, Tuple[int, int]] = OrderedDict()
+        self._next_id = 0
+        # the id, a copy and the depth of the last frame of every region
+        self._last: Dict[Tuple[int, int, int, int],
+                         Tuple[int, np.ndarray, int]] = {}
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        self._started = self.clock.now()
+        self.stats = {"frames": 0, "unique_frames": 0, "actions": 0,
+                      "bytes": len(MAGIC)}
+        for name, value in self._notes.items():
+            self._write_note(name, value)
+
+    def rotate(self, path):
+        """
+        Closes the session file and goes on recording into a new one. The
+        notes are written again, so the new file replays on its own.
+
+        :param path: The new session file, overwritten if it exists
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            self._open(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _write(self, kind: int, payload: bytes):
+        """Appends a record, stamped with the time since the start"""
+        timestamp = self.clock.now() - self._started
+        self._file.write(_HEADER.pack(kind, timestamp, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self.stats["bytes"] += _HEADER.size + len(payload)
+
+    def record_frame(self, frame: np.ndarray,
+                     region: Optional[Coordinates] = None):
+        """
+        Records a captured frame.
+
+        :param frame: The captured image
+        :param region: The captured region, None for the whole monitor
+        """
+        digest = hashlib.blake2b(str(frame.shape).encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(frame).data)
+        digest = digest.digest()
+        with self._lock:
+            if self._file.closed:
+                return
+            key = _region_key(region)
+            known = self._frame_ids.get(digest)
+            image = b""
+            if known is None:
+                frame_id = self._next_id
+                self._next_id += 1
+                image, depth = self._encode(key, frame)
+                self._frame_ids[digest] = frame_id, depth
+                if len(self._frame_ids) > self.max_frames:
+                    self._frame_ids.popitem(last=False)
+                self.stats["unique_frames"] += 1
+            else:
+                frame_id, depth = known
+                self._frame_ids.move_to_end(digest)
+            self._write(FRAME, _FRAME.pack(frame_id, *key) + image)
+            if self._last.get(key, (None,))[0] != frame_id:
+                self._last[key] = frame_id, frame.copy(), depth
+            self.stats["frames"] += 1
+
+    def _encode(self, key: Tuple[int, int, int, int],
+                frame: np.ndarray) -> Tuple[bytes, int]:
+        """
+        Encodes a new frame, as the difference to the last one if any.
+
+        :return: The frame payload and the differences in a row up to it
+        """
+        base_id, depth = -1, 0
+        last = self._last.get(key)
+        if last is not None and last[1].shape == frame.shape and \
+                last[2] < self.keyframe_interval:
+            base_id, depth = last[0], last[2] + 1
+            # wraps around, added back the same way
+            frame = frame - last[1]
+        _, encoded = cv.imencode(".png", frame, self._png_params)
+        return _BASE.pack(base_id) + encoded.tobytes(), depth
+
+    def record_action(self, name: str, *args, **kwargs):
+        """Records a call of an input backend function"""
+        payload = json.dumps({"action": name, "args": args,
+                              "kwargs": kwargs}, default=_jsonable)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._write(ACTION, payload.encode())
+            self.stats["actions"] += 1
+
+    def note(self, name: str, value: Any):
+        """Records a named value needed to replay the session"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._notes[name] = value
+            self._write_note(name, value)
+
+    def _write_note(self, name: str, value: Any):
+        """Appends a note record. Called with the lock held."""
+        payload = json.dumps({"note": name, "value": value},
+                             default=_jsonable)
+        self._write(NOTE, payload.encode())
+
+    def capture(self, backend: CaptureBackend) -> "RecordingCapture":
+        """Returns the capture backend, recording every frame it grabs"""
+        return RecordingCapture(backend, self)
+
+    def capture_factory(self, factory: Callable[[], CaptureBackend]) \
+            -> Callable[[], CaptureBackend]:
+        """Returns a capture factory for the GameLauncher that records"""
+        return lambda: self.capture(factory())
+
+    def record_input(self, backend) -> "RecordingInput":
+        """Returns the input backend, recording every action it performs"""
+        return RecordingInput(backend, self)
+
+    @property
+    def closed(self) -> bool:
+        """True once the session file is closed"""
+        return self._file.closed
+
+    def close(self):
+        """Closes the session file"""
+        with self._lock:
+            self._file.close()
+
+
+class RecordingCapture(CaptureBackend):
+    """
+    Captures through another capture backend and records the frames.
+
+    :param backend: The capture backend
+    :param recorder: The session recorder
+    """
+
+    def __init__(self, backend: CaptureBackend, recorder: SessionRecorder):
+        self.backend = backend
+        self.recorder = recorder
+
+    def grab(self, region: Optional[Coordinates] = None) -> np.ndarray:
+        frame = self.backend.grab(region)
+        self.recorder.record_frame(frame, region)
+        return frame
+
+    def close(self):
+        self.backend.close()
+
+
+class RecordingInput:
+    """
+    Performs the input actions through another input backend and records
+    them. Anything else, like position(), goes straight to the backend.
+
+    :param backend: The input backend, like pyautogui
+    :param recorder: The session recorder
+    """
+
+    def __init__(self, backend, recorder: SessionRecorder):
+        self.backend = backend
+        self.recorder = recorder
+
+    def __getattr__(self, name: str):
+        function = getattr(self.backend, name)
+        if name not in INPUT_ACTIONS:
+            return function
+
+        def record(*args, **kwargs):
+            self.recorder.record_action(name, *args, **kwargs)
+            return function(*args, **kwargs)
+
+        return record
+
+
+class Session:
+    """
+    A session file read back. A record cut short by a crash ends the
+    session.
+
+    :param path: The session file
+    :param int cache_size: The number of decoded frames kept in memory
+    """
+
+    def __init__(self, path, cache_size: int = 64):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        # the timestamp, region and frame id of every capture
+        self.captures: List[Tuple[float, Tuple[int, int, int, int], int]] = []
+        # the timestamp, function name, args and kwargs of every action
+        self.actions: List[Tuple[float, str, list, dict]] = []
+        self.notes: Dict[str, Any] = {}
+        # the base frame id and the png of every distinct frame
+        self._images: Dict[int, Tuple[int, bytes]] = {}
+        self._decoded: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._read()
+
+    def _read(self):
+        """Reads all the records of the session file"""
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if not data.startswith(MAGIC):
+            raise SessionException(f"{self.path} is not a session file")
+        offset = len(MAGIC)
+        while offset + _HEADER.size <= len(data):
+            kind, timestamp, size = _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+            if offset + size > len(data):
+                break
+            payload = data[offset:offset + size]
+            offset += size
+            if kind == FRAME:
+                frame_id, *region = _FRAME.unpack_from(payload)
+                if len(payload) > _FRAME.size:
+                    base_id, = _BASE.unpack_from(payload, _FRAME.size)
+                    self._images[frame_id] = \
+                        base_id, payload[_FRAME.size + _BASE.size:]
+                self.captures.append((timestamp, tuple(region), frame_id))
+            elif kind == ACTION:
+                action = json.loads(payload)
+                self.actions.append((timestamp, action["action"],
+                                     action["args"], action["kwargs"]))
+            elif kind == NOTE:
+                note = json.loads(payload)
+                self.notes[note["note"]] = note["value"]
+
+    @property
+    def unique_frames(self) -> int:
+        """Returns the number of distinct frames in the session"""
+        return len(self._images)
+
+    def frame(self, frame_id: int) -> np.ndarray:
+        """Returns a recorded frame, decoded on first use"""
+        # the frames down to a whole or an already decoded one
+        chain = []
+        frame = self._decoded.get(frame_id)
+        while frame is None:
+            if frame_id not in self._images:
+                raise SessionException(
+                    f"Frame {frame_id} is not in the session")
+            base_id, image = self._images[frame_id]
+            chain.append((frame_id, image))
+            if base_id < 0:
+                break
+            frame_id = base_id
+            frame = self._decoded.get(frame_id)
+        if frame is not None:
+            self._decoded.move_to_end(frame_id)
+        for frame_id, image in reversed(chain):
+            decoded = cv.imdecode(np.frombuffer(image, np.uint8),
+                                  cv.IMREAD_UNCHANGED)
+            frame = decoded if frame is None else frame + decoded
+            self._decoded[frame_id] = frame
+            if len(self._decoded) > self.cache_size:
+                self._decoded.popitem(last=False)
+        return frame
+
+
+class ReplayCapture(CaptureBackend):
+    """
+    Feeds the frames of a session back in the order they were recorded. A
+    capture gets the next recorded frame of the same region, skipping the
+    frames of other regions. A region with no recorded frame left is cut
+    out of the last frame served that covers it.
+
+    The clock is moved on to the time every frame was recorded at, so the
+    timeouts and schedules of the bot see the recorded times. On a
+    VirtualClock this takes no time at all.
+
+    The replay is only faithful when the bot starts from the same learned
+    state, like the calibration and the UI coordinates, as the recording.
+
+    :param session: The session
+    :param clock: The clock moved on to the recorded times. Defaults to the
+        clock shared by the game activities.
+    :param bool strict: Raise a SessionException as soon as a capture does
+        not match the next recorded one
+    """
+
+    def __init__(self, session: Session, clock: Clock = None,
+                 strict: bool = False):
+        self.session = session
+        self.clock = clock or get_clock()
+        self.strict = strict
+        self._started = self.clock.now()
+        self._cursor = 0
+        self._served: Dict[Tuple[int, int, int, int], int] = {}
+        self.grabs = 0
+        self.skipped = 0
+        self.cropped = 0
+
+    @property
+    def remaining(self) -> int:
+        """Returns the number of recorded captures not served yet"""
+        return len(self.session.captures) - self._cursor
+
+    def _crop(self, key: Tuple[int, int, int, int]) -> Optional[np.ndarray]:
+        """Cuts a region out of the last frame served that covers it"""
+        start_x, start_y, end_x, end_y = key
+        for served, frame_id in reversed(list(self._served.items())):
+            if served == _WHOLE_MONITOR:
+                left, top = 0, 0
+            elif key != _WHOLE_MONITOR and served[0] <= start_x and \
+                    served[1] <= start_y and served[2] >= end_x and \
+                    served[3] >= end_y:
+                left, top = served[0], served[1]
+            else:
+                continue
+            frame = self.session.frame(frame_id)
+            return frame[start_y - top:end_y - top,
+                         start_x - left:end_x - left].copy()
+        return None
+
+    def grab(self, region: Optional[Coordinates] = None) -> np.ndarray:
+        key = _region_key(region)
+        captures = self.session.captures
+        for index in range(self._cursor, len(captures)):
+            if captures[index][1] == key:
+                break
+            if self.strict:
+                raise SessionException(
+                    f"Replay diverged at capture {index}: {key} captured, "
+                    f"{captures[index][1]} recorded")
+        else:
+            frame = self._crop(key) if self.remaining else None
+            if frame is None:
+                raise SessionException(
+                    "The session has no frames left for the region "
+                    f"{key}")
+            self.cropped += 1
+            self.grabs += 1
+            return frame
+        timestamp, _, frame_id = captures[index]
+        self.skipped += index - self._cursor
+        self._cursor = index + 1
+        self.grabs += 1
+        self.clock.sleep_until(self._started + timestamp)
+        # move the region to the end, the newest frames are cropped first
+        self._served.pop(key, None)
+        self._served[key] = frame_id
+        # callers may draw on the frame, the cached one stays untouched
+        return self.session.frame(frame_id).copy()
+
+
+class ReplayInput:
+    """
+    An input backend that performs nothing and compares the actions with
+    the recorded ones. The mouse position is followed, so position() works
+    like in the recording.
+
+    :param session: The session
+    :param bool strict: Raise a SessionException as soon as an action
+        differs from the recorded one
+    """
+
+    def __init__(self, session: Session, strict: bool = False):
+        self.session = session
+        self.strict = strict
+        self._cursor = 0
+        self._x, self._y = 0, 0
+        self.actions = 0
+        self.mismatches = 0
+
+    def _perform(self, name: str, *args, **kwargs):
+        """Compares an action with the next recorded one"""
+        self.actions += 1
+        performed = _normalize([name, args, kwargs])
+        recorded = None
+        if self._cursor < len(self.session.actions):
+            recorded = list(self.session.actions[self._cursor][1:])
+            self._cursor += 1
+        if performed != recorded:
+            self.mismatches += 1
+            if self.strict:
+                raise SessionException(
+                    f"Replay diverged at action {self.actions}: {performed} "
+                    f"performed, {recorded} recorded")
+
+    def moveTo(self, x: int, y: int, *args, **kwargs):
+        self._perform("moveTo", x, y, *args, **kwargs)
+        self._x, self._y = int(x), int(y)
+
+    def move(self, dx: int, dy: int, *args, **kwargs):
+        self._perform("move", dx, dy, *args, **kwargs)
+        self._x, self._y = self._x + int(dx), self._y + int(dy)
+
+    def position(self) -> Tuple[int, int]:
+        return self._x, self._y
+
+    def click(self, *args, **kwargs):
+        self._perform("click", *args, **kwargs)
+
+    def drag(self, x: int, y: int, *args, **kwargs):
+        self._perform("drag", x, y, *args, **kwargs)
+        self._x, self._y = self._x + int(x), self._y + int(y)
+
+    def hotkey(self, *keys: str, **kwargs):
+        self._perform("hotkey", *keys, **kwargs)
+
+    def press(self, *args, **kwargs):
+        self._perform("press", *args, **kwargs)
+
+    def write(self, *args, **kwargs):
+        self._perform("write", *args, **kwargs)
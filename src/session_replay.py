@@ -0,0 +1,125 @@
+"""
+Replays a recorded session offline and reports where the wall time goes.
+The recorded frames are fed back to the GameLauncher on a VirtualClock,
+so the same detection and decision code runs on the same frames on every
+replay, and the input actions of the bot are compared with the recorded
+ones. The replay runs the profile cycles like main.py until the session
+has no frames left, with the ProfileScheduler when the session notes no
+reload time.
+
+Sessions are recorded by main.py when record_session is set, and by
+synthetic_benchmark.py with --record. The session has to note the app
+coordinates and the profiles. The learned state the recording started
+from, like the calibration, is read from --cache-dir, a fresh one is used
+when omitted.
+Run from the `src` directory like the other demo scripts:
+
+    python session_replay.py session.aozs --strict
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from src.clock import VirtualClock, set_clock
+from src.exceptions import SessionException
+from src.game_launcher import GameLauncher
+from src.glyphs import GlyphRecognizer, set_recognizer
+from src.helper import Coordinates
+from src.listener import MouseController, KeyboardController, \
+    set_input_backend
+from src.main import run_all_profiles
+from src.ocr import TesserocrEngine, get_engine, set_engine
+from src.profile import GameProfile, PlayerProfile
+from src.radar import Radar
+from src.scheduler import ProfileScheduler
+from src.session import ReplayCapture, ReplayInput, Session
+from src.timings import StageTimer
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("session", type=str, help="the session file")
+parser.add_argument("--cache-dir", type=str, default=None,
+                    help="the directory with the learned launcher files")
+parser.add_argument("--strict", action="store_true",
+                    help="stop at the first capture or action that differs")
+parser.add_argument("--tessdata", type=str, default=None)
+parser.add_argument("--verbose", action="store_true")
+args = parser.parse_args()
+
+loading = time.perf_counter()
+session = Session(args.session)
+loaded = time.perf_counter() - loading
+if "app_coordinates" not in session.notes or "profiles" not in session.notes:
+    parser.error("the session does not note the app coordinates and the "
+                 "profiles")
+app_coordinates = Coordinates(*session.notes["app_coordinates"])
+profiles = [PlayerProfile(**profile) for profile in session.notes["profiles"]]
+print(f"session of {len(session.captures)} captures, "
+      f"{session.unique_frames} unique frames and {len(session.actions)} "
+      f"actions loaded in {loaded:.2f} s")
+
+timer = StageTimer()
+clock = VirtualClock()
+set_clock(clock)
+capture = ReplayCapture(session, clock, strict=args.strict)
+replay_input = ReplayInput(session, strict=args.strict)
+set_input_backend(replay_input)
+set_engine(timer.engine(TesserocrEngine(args.tessdata) if args.tessdata
+                        else get_engine()))
+set_recognizer(GlyphRecognizer())
+# the learned files are copied, so every replay starts from the same state
+cache_dir = Path(tempfile.mkdtemp(prefix="replay-"))
+if args.cache_dir:
+    shutil.copytree(args.cache_dir, cache_dir, dirs_exist_ok=True)
+GameLauncher.cache_file = cache_dir.joinpath("game_cache.txt")
+GameLauncher.calibration_file = cache_dir.joinpath("game_calibration.txt")
+GameLauncher.screen_states_file = cache_dir.joinpath("screen_states.npz")
+GameLauncher.coordinates_file = cache_dir.joinpath("ui_coordinates.json")
+Radar.reset()
+GameProfile.reset()
+
+launcher = GameLauncher(MouseController(), KeyboardController(),
+                        cache=True, enable_debug=args.verbose,
+                        capture_factory=lambda: capture)
+for method in ("find_target", "classify_screen", "wait_until_stable"):
+    timer.wrap(launcher, method)
+profile_launcher = GameProfile(launcher)
+timer.wrap(profile_launcher, "load_profile")
+
+reload_time = session.notes.get("reload_time")
+scheduler = ProfileScheduler(profiles) if reload_time is None else None
+errors = []
+started = time.perf_counter()
+try:
+    launcher.start_game(app_coordinates)
+    while True:
+        clock.sleep(5)
+        flag_bot, cycle_errors = run_all_profiles(
+            launcher, profile_launcher, profiles, scheduler)
+        errors += [(name, error[1]) for name, error in cycle_errors.items()]
+        if flag_bot:
+            # relaunch like main.py does
+            launcher.start_game(app_coordinates)
+            if scheduler:
+                scheduler.current = None
+        elif not scheduler:
+            clock.sleep(reload_time)
+except SessionException as error:
+    ended = str(error)
+elapsed = time.perf_counter() - started
+
+print(f"replay ended: {ended}")
+print(f"\n{'captures served':<24}{capture.grabs:>12}")
+print(f"{'captures skipped':<24}{capture.skipped:>12}")
+print(f"{'captures cropped':<24}{capture.cropped:>12}")
+print(f"{'captures left':<24}{capture.remaining:>12}")
+print(f"{'actions':<24}{replay_input.actions:>12}")
+print(f"{'action mismatches':<24}{replay_input.mismatches:>12}")
+print(f"{'errors':<24}{len(errors):>12}")
+for name, message in errors:
+    print(f"  {name}: {message}")
+print(f"{'session hours':<24}"
+      f"{session.captures[-1][0] / 3600 if session.captures else 0:>12.2f}")
+print(f"{'wall time (s)':<24}{elapsed:>12.2f}")
+timer.report()
@@ -0,0 +1,366 @@
+"""
+Discrete event simulation of the bot, to compare the profile scheduling
+policies offline. The game is modelled from what the bot sees of it:
+
+ - a zombie attack uses 10 fuel, and its fleet is back after twice the
+   set out time read by Radar.send_fleet plus the attack duration
+ - fuel is regained over time
+ - every profile has Farm.max_fleet fleet queues, shared by the zombie
+   fleets and the farming fleets
+ - every bot action costs the time the GameLauncher, Radar, Zombies and
+   Farm sleeps and waits take on the live game
+
+The bot runs on a VirtualClock, so hours of game time take a fraction of
+a second. The run fails when the profile scheduler sends out fewer fleets
+per hour than the best round robin, main.py runs with the scheduler.
+Run from the `src` directory like the other demo scripts:
+
+    python simulator.py --hours 24 --profiles 5
+"""
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from src.clock import Clock, VirtualClock
+from src.scheduler import FleetScheduler, ProfileScheduler
+
+
+@dataclass
+class SimulationCosts:
+    """The seconds the bot spends on every action in the live game"""
+    # GameProfile.load_profile and the navigation back to the game
+    switch: float = 30.0
+    # rewards, reset to home, the shake and the elite zombie check
+    visit: float = 12.0
+    # Zombies.initialize_zombie and the switch to the outside view
+    zombie_setup: float = 9.0
+    # radar menu, level, go, the arrow snapshots, attack and set out
+    zombie_attack: float = 16.0
+    # Farm.get_fleet_count and the switch to the outside view
+    farm_setup: float = 8.0
+    # radar menu, find farm, gather and set out, then the 2 secs pause
+    farm_dispatch: float = 18.0
+
+
+@dataclass
+class SimulatedProfile:
+    """A player profile with the game state the simulation keeps for it"""
+    name: str
+    zombie_fleets: List[int]
+    attack_zombies: int = 1
+    enable_farming: int = 1
+    max_fleet: int = 4
+    fuel: float = 100.0
+    fuel_read_at: float = 0.0
+    fleet_returns: Dict[int, float] = field(default_factory=dict)
+    farm_returns: List[float] = field(default_factory=list)
+
+
+@dataclass
+class SimulationResult:
+    """The activity of one policy over the simulated time"""
+    policy: str
+    hours: float
+    zombie_dispatches: int = 0
+    farm_dispatches: int = 0
+    zombie_misses: int = 0
+    switches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def dispatches(self) -> int:
+        return self.zombie_dispatches + self.farm_dispatches
+
+    @property
+    def dispatches_per_hour(self) -> float:
+        return self.dispatches / self.hours
+
+
+class SimulatedGame:
+    """
+    The game state of all the profiles, moved on by the bot actions.
+
+    :param clock: The virtual clock of the simulation
+    :param rng: The random source of the travel and gathering times
+    :param travel_time: The range of the zombie set out times in secs
+    :param gather_time: The range of the farming times in secs
+    :param float fuel_per_hour: The fuel regained per hour
+    :param float max_fuel: The most fuel regained
+    :param float miss_chance: The chance no zombie is found
+    """
+
+    def __init__(self, clock: Clock, rng: random.Random,
+                 travel_time: Tuple[float, float] = (15, 90),
+                 gather_time: Tuple[float, float] = (3600, 10800),
+                 fuel_per_hour: float = 10.0, max_fuel: float = 100.0,
+                 miss_chance: float = 0.1):
+        self.clock = clock
+        self.rng = rng
+        self.travel_time = travel_time
+        self.gather_time = gather_time
+        self.fuel_per_hour = fuel_per_hour
+        self.max_fuel = max_fuel
+        self.miss_chance = miss_chance
+
+    def fuel(self, profile: SimulatedProfile) -> int:
+        """Returns the fuel of a profile now, as the bot reads it"""
+        now = self.clock.now()
+        if profile.fuel < self.max_fuel:
+            profile.fuel = min(self.max_fuel, profile.fuel + self.fuel_per_hour
+                               * (now - profile.fuel_read_at) / 3600)
+        profile.fuel_read_at = now
+        return int(profile.fuel)
+
+    def busy_queues(self, profile: SimulatedProfile) -> int:
+        """Returns the fleet queues of a profile still out"""
+        now = self.clock.now()
+        return sum(back_at > now for back_at in
+                   list(profile.fleet_returns.values()) +
+                   profile.farm_returns)
+
+    def attack(self, profile: SimulatedProfile,
+               fleet_id: int) -> Optional[float]:
+        """
+        Sends a fleet to a zombie.
+
+        :return: The secs until the fleet is back, or None if no zombie
+            was found or no fleet queue is free.
+        """
+        now = self.clock.now()
+        if profile.fleet_returns.get(fleet_id, now) > now or \
+                self.busy_queues(profile) >= profile.max_fleet or \
+                self.rng.random() < self.miss_chance:
+            return None
+        self.fuel(profile)
+        profile.fuel -= 10
+        # the attack duration Zombies waits on top of the round trip
+        waiting_time = 2 * self.rng.uniform(*self.travel_time) + 2
+        profile.fleet_returns[fleet_id] = now + waiting_time
+        return waiting_time
+
+    def gather(self, profile: SimulatedProfile) -> bool:
+        """Sends a fleet to farm if a fleet queue is free"""
+        now = self.clock.now()
+        if self.busy_queues(profile) >= profile.max_fleet:
+            return False
+        profile.farm_returns = [back_at for back_at in profile.farm_returns
+                                if back_at > now]
+        profile.farm_returns.append(now + self.rng.uniform(*self.gather_time))
+        return True
+
+
+class SimulatedBot:
+    """
+    Plays the game the way the bot does, spending the time of every
+    action on the virtual clock.
+    """
+
+    def __init__(self, game: SimulatedGame, costs: SimulationCosts,
+                 result: SimulationResult, min_mobility: int = 10):
+        self.game = game
+        self.clock = game.clock
+        self.costs = costs
+        self.result = result
+        self.min_mobility = max(min_mobility, 10)
+        self.current: Optional[str] = None
+
+    def visit(self, profile: SimulatedProfile):
+        """Loads a profile unless it is loaded already"""
+        if profile.name != self.current:
+            self.clock.sleep(self.costs.switch)
+            self.current = profile.name
+            self.result.switches += 1
+        self.clock.sleep(self.costs.visit)
+
+    def kill_zombies(self, profile: SimulatedProfile,
+                     fleet_scheduler: FleetScheduler,
+                     wait_for_fleets: bool) -> int:
+        """Mirrors Zombies.kill_zombies, returns the fuel left"""
+        self.clock.sleep(self.costs.zombie_setup)
+        for fleet_id in profile.zombie_fleets:
+            if fleet_id not in fleet_scheduler:
+                fleet_scheduler.schedule(fleet_id)
+
+        def check_mobility_limit(fuel: int) -> bool:
+            if fuel < 20:
+                # get the latest fuel value just in case
+                fuel = self.game.fuel(profile)
+            return fuel >= self.min_mobility
+
+        current_fuel = self.game.fuel(profile)
+        no_zombie_count = 0
+        while check_mobility_limit(current_fuel):
+            fleet_id = fleet_scheduler.wait()
+            self.clock.sleep(self.costs.zombie_attack)
+            waiting_time = self.game.attack(profile, fleet_id)
+            if waiting_time is None:
+                self.result.zombie_misses += 1
+                no_zombie_count = no_zombie_count + 1
+                waiting_time = 10 * no_zombie_count
+            else:
+                self.result.zombie_dispatches += 1
+                current_fuel = current_fuel - 10
+                no_zombie_count = 0
+            fleet_scheduler.schedule(fleet_id, waiting_time)
+        if wait_for_fleets:
+            while fleet_scheduler.wait() is not None:
+                pass
+        return current_fuel
+
+    def farm(self, profile: SimulatedProfile) -> int:
+        """Mirrors Farm.all_out_farming, returns the fleets sent out"""
+        self.clock.sleep(self.costs.farm_setup)
+        deployed = 0
+        while True:
+            self.clock.sleep(self.costs.farm_dispatch)
+            if not self.game.gather(profile):
+                break
+            deployed = deployed + 1
+        self.result.farm_dispatches += deployed
+        return deployed
+
+
+class RoundRobinPolicy:
+    """
+    The original main loop: every profile in order, the zombie fleets
+    waited for, then a fixed sleep before the next round.
+
+    :param float reload_time: The sleep after every round in secs
+    """
+
+    def __init__(self, reload_time: float = 3600):
+        self.reload_time = reload_time
+        self.name = f"round robin, {reload_time:.0f}s reload"
+
+    def run(self, bot: SimulatedBot, profiles: List[SimulatedProfile],
+            until: float):
+        while bot.clock.now() < until:
+            for profile in profiles:
+                bot.visit(profile)
+                if profile.attack_zombies:
+                    bot.kill_zombies(profile, FleetScheduler(clock=bot.clock),
+                                     wait_for_fleets=True)
+                if profile.enable_farming:
+                    bot.farm(profile)
+            bot.clock.sleep(self.reload_time)
+
+
+class ScheduledPolicy:
+    """
+    The ProfileScheduler main loop: the profile with the soonest useful
+    work is visited next. The zombie fleets are only waited for when the
+    farming fleets need their queues.
+
+    :param scheduler_options: The ProfileScheduler options
+    """
+
+    def __init__(self, **scheduler_options):
+        self.scheduler_options = scheduler_options
+        self.name = "profile scheduler"
+
+    def run(self, bot: SimulatedBot, profiles: List[SimulatedProfile],
+            until: float):
+        scheduler = ProfileScheduler(profiles, clock=bot.clock,
+                                     switch_cost=bot.costs.switch,
+                                     **self.scheduler_options)
+        while bot.clock.now() < until:
+            profile, start = scheduler.next_profile()
+            if profile.name != scheduler.current:
+                bot.clock.sleep_until(start - scheduler.switch_cost)
+            else:
+                bot.clock.sleep_until(start)
+            bot.visit(profile)
+            scheduler.record_visit(profile.name)
+            if profile.attack_zombies:
+                fleet_scheduler = scheduler.fleet_scheduler(profile.name)
+                # the farming fleets need the queues of the zombie fleets
+                fuel = bot.kill_zombies(
+                    profile, fleet_scheduler,
+                    wait_for_fleets=bool(profile.enable_farming))
+                scheduler.record_fleets(profile.name,
+                                        fleet_scheduler.returns())
+                scheduler.record_fuel(profile.name, fuel)
+            if profile.enable_farming:
+                # Farm.get_fleet_count reads the fleets out first
+                fleets_out = bot.game.busy_queues(profile)
+                scheduler.record_farming(profile.name, bot.farm(profile),
+                                         profile.max_fleet, fleets_out)
+
+
+def make_profiles(count: int = 5,
+                  zombie_fleets: List[int] = None) -> List[SimulatedProfile]:
+    """Returns profiles like the ones of the config file"""
+    return [SimulatedProfile(name=f"profile{index}",
+                             zombie_fleets=list(zombie_fleets or [1, 2]))
+            for index in range(1, count + 1)]
+
+
+def simulate(policy, hours: float = 24, profile_count: int = 5,
+             zombie_fleets: List[int] = None, seed: int = 0,
+             costs: SimulationCosts = None, min_mobility: int = 10,
+             **game_options) -> SimulationResult:
+    """
+    Runs a policy over a number of simulated hours.
+
+    :param policy: A RoundRobinPolicy or a ScheduledPolicy
+    :param hours: The simulated hours
+    :param profile_count: The number of player profiles
+    :param zombie_fleets: The zombie fleets of every profile
+    :param seed: The seed of the random travel and gathering times
+    :param costs: The seconds of the bot actions
+    :param min_mobility: The fuel zombies are killed down to
+    :param game_options: The SimulatedGame options
+    """
+    started = time.perf_counter()
+    clock = VirtualClock()
+    game = SimulatedGame(clock, random.Random(seed), **game_options)
+    result = SimulationResult(policy.name, hours)
+    bot = SimulatedBot(game, costs or SimulationCosts(), result,
+                       min_mobility)
+    policy.run(bot, make_profiles(profile_count, zombie_fleets),
+               until=hours * 3600)
+    # the last visit may run past the end
+    result.hours = clock.now() / 3600
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--profiles", type=int, default=5)
+    parser.add_argument("--fleets", type=str, default="1,2",
+                        help="the zombie fleets of every profile")
+    parser.add_argument("--min-mobility", type=int, default=10)
+    parser.add_argument("--seeds", type=int, default=5)
+    args = parser.parse_args()
+    fleets = [int(fleet) for fleet in args.fleets.split(",")]
+
+    round_robins = [RoundRobinPolicy(3600), RoundRobinPolicy(1800),
+                    RoundRobinPolicy(600), RoundRobinPolicy(0)]
+    scheduled = ScheduledPolicy()
+    rates = {}
+    print(f"{'policy':<28}{'dispatches/h':>14}{'zombies':>10}"
+          f"{'farms':>8}{'misses':>8}{'switches':>10}{'run (ms)':>10}")
+    for policy in round_robins + [scheduled]:
+        results = [simulate(policy, args.hours, args.profiles, fleets, seed,
+                            min_mobility=args.min_mobility)
+                   for seed in range(args.seeds)]
+        count = len(results)
+        rates[policy] = sum(r.dispatches_per_hour for r in results) / count
+        print(f"{policy.name:<28}"
+              f"{rates[policy]:>14.2f}"
+              f"{sum(r.zombie_dispatches for r in results) / count:>10.1f}"
+              f"{sum(r.farm_dispatches for r in results) / count:>8.1f}"
+              f"{sum(r.zombie_misses for r in results) / count:>8.1f}"
+              f"{sum(r.switches for r in results) / count:>10.1f}"
+              f"{1000 * sum(r.elapsed for r in results) / count:>10.1f}")
+
+    best = max(round_robins, key=rates.get)
+    if rates[scheduled] < rates[best]:
+        sys.exit(f"The profile scheduler fell behind the {best.name}: "
+                 f"{rates[scheduled]:.2f} against {rates[best]:.2f} "
+                 "dispatches/h")
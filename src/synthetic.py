@@ -0,0 +1,782 @@
+"""
+A synthetic game to run the bot headlessly. The game screens are rendered
+from the bundled screenshots and templates at the size the templates were
+captured at, and change on the clicks and keys the bot sends like the
+emulator does:
+
+ - SyntheticGame keeps the game state and renders the emulator screen
+ - SyntheticCapture is the capture backend of the GameLauncher
+ - SyntheticInput is the input backend of the mouse and the keyboard
+
+The launch of the game, the profile switches, the zombie attacks and the
+fuel are modelled. Farming and the elite zombies are not, their screens
+show nothing the bot can act on. The game keeps its time on the clock
+shared by the game activities, so with a VirtualClock the bot runs hours
+of game time without waiting.
+"""
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from src.capture import CaptureBackend
+from src.clock import Clock, get_clock
+from src.helper import Coordinates
+
+cwd = Path(__file__).cwd()
+
+# the size of the game screen most of the templates were captured at
+SCREEN_WIDTH, SCREEN_HEIGHT = 695, 1157
+
+# the game screens
+ANDROID_HOME = "android-home"
+LOADING = "loading"
+REWARDS = "rewards"
+REWARDS_CLAIMED = "rewards-claimed"
+HOME_INSIDE = "home-inside"
+HOME_OUTSIDE = "home-outside"
+EXIT_DIALOG = "exit-dialog"
+RADAR = "radar"
+ZOMBIE_POPUP = "zombie-popup"
+SET_OUT = "set-out"
+ALLIANCE = "alliance"
+MY_INFO = "my-info"
+SETTINGS = "settings"
+SWITCH_ACCOUNT = "switch-account"
+ACCOUNTS_MINI = "accounts-mini"
+ACCOUNTS_FULL = "accounts-full"
+ACCOUNT_CONTINUE = "account-continue"
+CHARACTERS = "characters"
+CONFIRM = "confirm"
+
+ZOMBIE_TAB = 6
+
+# the layout of the game screen, in game screen coordinates
+VIEW_BUTTON = Coordinates(0, 1042, 139, 1157)
+ALLIANCE_BUTTON = Coordinates(472, 1042, 583, 1157)
+MY_INFO_BUTTON = Coordinates(583, 1042, 695, 1157)
+SETTINGS_TAB = Coordinates(519, 1042, 695, 1157)
+VIEW_ICON = Coordinates(20, 1062, 135, 1134)
+RADAR_BUTTON = Coordinates(580, 930, 660, 1017)
+FUEL_PLATE = Coordinates(0, 0, 180, 92)
+MOBILITY_ICON = Coordinates(10, 20, 45, 62)
+RADAR_PANEL = Coordinates(0, 891, 695, 1157)
+RADAR_TABS = Coordinates(0, 891, 690, 1010)
+LEVEL_TEXT = Coordinates(285, 1004, 345, 1036)
+DECREASE_BUTTON = Coordinates(120, 1060, 167, 1110)
+INCREASE_BUTTON = Coordinates(430, 1060, 477, 1110)
+GO_BUTTON = Coordinates(540, 1080, 660, 1127)
+MAX_LEVEL_PLATE = Coordinates(295, 1116, 400, 1152)
+ZOMBIE_POPUP_PANEL = Coordinates(120, 690, 575, 880)
+ATTACK_BUTTON = Coordinates(269, 760, 426, 810)
+FLEETS_BAR = Coordinates(190, 150, 505, 200)
+SET_OUT_PANEL = Coordinates(0, 1000, 695, 1157)
+SET_OUT_BUTTON = Coordinates(480, 1080, 652, 1135)
+SET_OUT_TIME = Coordinates(513, 1045, 594, 1080)
+LAUNCH_BUTTON = Coordinates(190, 460, 505, 670)
+CLAIM_BUTTON = Coordinates(250, 900, 445, 960)
+EXIT_PANEL = Coordinates(60, 430, 635, 760)
+SWITCH_BUTTON = Coordinates(150, 780, 545, 850)
+LOGIN_BUTTON = Coordinates(200, 680, 495, 750)
+MORE_ACCOUNTS = Coordinates(0, 949, 695, 1032)
+ACCOUNT_ROWS = Coordinates(40, 120, 655, 900)
+ACCOUNT_ROW_HEIGHT = 110
+CONTINUE_BUTTON = Coordinates(60, 1040, 635, 1110)
+CHARACTER_ROWS = Coordinates(60, 400, 635, 720)
+CHARACTER_ROW_HEIGHT = 80
+CONFIRM_PANEL = Coordinates(60, 480, 635, 700)
+CANCEL_BUTTON = Coordinates(100, 600, 320, 670)
+CONFIRM_BUTTON = Coordinates(375, 600, 595, 670)
+
+FONT = cv.FONT_HERSHEY_SIMPLEX
+WHITE = (255, 255, 255)
+PANEL = (80, 80, 80)
+DARK = (30, 30, 30)
+LIGHT = (240, 240, 240)
+INK = (40, 40, 40)
+
+
+class Point(NamedTuple):
+    """A mouse position, like pyautogui.Point"""
+    x: int
+    y: int
+
+
+def _inside(box: Coordinates, x: int, y: int) -> bool:
+    """Checks if a point lies inside a box"""
+    return box.start_x <= x < box.end_x and box.start_y <= y < box.end_y
+
+
+def _fill(image: np.ndarray, box: Coordinates, color: tuple):
+    """Fills a box of the image with a color"""
+    image[box.start_y:box.end_y, box.start_x:box.end_x] = color
+
+
+def _paste(image: np.ndarray, template: np.ndarray, x: int, y: int):
+    """Pastes a template at the top left position"""
+    t_h, t_w = template.shape[:2]
+    image[y:y + t_h, x:x + t_w] = template
+
+
+def _text(image: np.ndarray, text: str, box: Coordinates,
+          scale: float = 1.0, color: tuple = WHITE, thickness: int = 2):
+    """Writes a text centered in a box"""
+    (t_w, t_h), _ = cv.getTextSize(text, FONT, scale, thickness)
+    x = box.start_x + (box.end_x - box.start_x - t_w) // 2
+    y = box.start_y + (box.end_y - box.start_y + t_h) // 2
+    cv.putText(image, text, (x, y), FONT, scale, color, thickness,
+               cv.LINE_AA)
+
+
+def _button(image: np.ndarray, box: Coordinates, label: str,
+            fill: tuple = (150, 95, 40), scale: float = 1.0,
+            color: tuple = WHITE):
+    """Draws a button with a centered label"""
+    _fill(image, box, fill)
+    _text(image, label, box, scale, color)
+
+
+@dataclass
+class SyntheticAccount:
+    """The game state of a player profile"""
+    name: str
+    email: str
+    nickname: str
+    fuel: float
+    fuel_read_at: float = 0.0
+    zombie_level: int = 1
+    max_level: int = 25
+    # the time every fleet sent out is back
+    fleet_returns: Dict[int, float] = field(default_factory=dict)
+
+
+class SyntheticGame:
+    """
+    The emulator screen of the game, from the android home screen to the
+    profile switches and the zombie attacks.
+
+    Screens are kept on a stack, like the game views the back key leaves.
+    A rendered screen is reused until the game state changes.
+
+    :param profiles: The player profiles of the game accounts, only their
+        name, email and nickname are used. The first one is loaded.
+    :param clock: The clock of the game. Defaults to the clock shared by
+        the game activities.
+    :param seed: The seed of the travel times and the zombie positions
+    :param travel_time: The shortest and longest set out time in secs
+    :param fuel: The fuel every profile starts with
+    :param max_fuel: The most fuel regained
+    :param fuel_per_hour: The fuel regained per hour
+    :param max_level: The highest zombie level unlocked
+    :param miss_chance: The chance the radar finds no zombie
+    :param launch_time: The secs the game takes to launch
+    :param switch_time: The secs a profile takes to load
+    """
+    # secs the zombie arrow shows after the go button
+    arrow_duration = 6.0
+    # secs a zombie attack takes, as Zombies assumes
+    attack_duration = 2
+
+    def __init__(self, profiles, clock: Clock = None, seed: int = 0,
+                 travel_time: Tuple[int, int] = (20, 90),
+                 fuel: float = 60, max_fuel: float = 100,
+                 fuel_per_hour: float = 10, max_level: int = 25,
+                 miss_chance: float = 0.0, launch_time: float = 20,
+                 switch_time: float = 8):
+        self.clock = clock or get_clock()
+        self.random = random.Random(seed)
+        self.travel_time = travel_time
+        self.max_fuel = max_fuel
+        self.fuel_per_hour = fuel_per_hour
+        self.miss_chance = miss_chance
+        self.launch_time = launch_time
+        self.switch_time = switch_time
+        self.accounts = [SyntheticAccount(
+            name=profile.name, email=profile.email.lower().strip(),
+            nickname=profile.nickname, fuel=fuel, max_level=max_level,
+            fuel_read_at=self.clock.now()) for profile in profiles]
+        self.account = self.accounts[0]
+        self._stack: List[str] = [ANDROID_HOME]
+        self._launched = False
+        # the screen shown once the loading screen is done
+        self._loading: Optional[Tuple[float, List[str]]] = None
+        self._radar_tab = 1
+        self._fleet_id = 1
+        self._set_out_time = 0
+        # the zombie arrow position and when it shows
+        self._arrow: Optional[Tuple[int, int, float]] = None
+        # the account chosen in the full account list
+        self._chosen: Optional[SyntheticAccount] = None
+        self._version = 0
+        self._frame_key = None
+        self._frame: Optional[np.ndarray] = None
+        self.stats = {"clicks": 0, "keys": 0, "renders": 0,
+                      "dispatches": 0, "rejected": 0, "switches": 0}
+        self._images = self._load_images()
+
+    @staticmethod
+    def _load_images() -> Dict[str, np.ndarray]:
+        """Loads the screenshots and the templates the screens show"""
+        game_path = cwd.joinpath("data", "game")
+
+        def template(folder: str, name: str = "template_1.png"):
+            return cv.imread(str(game_path.joinpath(folder, name)),
+                             cv.IMREAD_COLOR)
+
+        city = cv.imread(str(game_path.joinpath(
+            "game_inside_city_screen.png")), cv.IMREAD_COLOR)
+        outside = cv.addWeighted(city, 0.5, np.full_like(city, (70, 95, 45)),
+                                 0.5, 0)
+        # the bottom menu is the same inside and outside the city
+        outside[VIEW_BUTTON.start_y:] = city[VIEW_BUTTON.start_y:]
+        loading = cv.resize(cv.imread(str(game_path.joinpath(
+            "game_loading_screen.png")), cv.IMREAD_COLOR),
+            (SCREEN_WIDTH, SCREEN_HEIGHT), interpolation=cv.INTER_AREA)
+        return {
+            "city": city,
+            "outside": outside,
+            "loading": loading,
+            "app-icon": template("app_icon"),
+            "city-icon": template("city_icon", "template_8.png"),
+            "outside-icon": template("outside_icon", "template_8.png"),
+            "radar": template("radar"),
+            "mobility": template("mobility", "template_3.png"),
+            "decrease": template("zombie_decrease", "template_3.png"),
+            "increase": template("zombie_increase", "template_3.png"),
+            "go": template("go_button"),
+            "arrow": template("zombie_arrow"),
+            "attack": template("zombie_attack", "template_2.png"),
+            "fleets": template("fleets", "template_7.png"),
+            "setout": template("setout", "template_3.png"),
+            "farms": [template("farming", f"template_{index}.png")
+                      for index in range(1, 6)],
+        }
+
+    @property
+    def screen(self) -> str:
+        """Returns the screen the game shows"""
+        self._update()
+        if self._loading:
+            return LOADING
+        return self._stack[-1]
+
+    def fuel(self, account: SyntheticAccount = None) -> int:
+        """Returns the fuel of a profile, the loaded one by default"""
+        account = account or self.account
+        regained = self.fuel_per_hour * \
+            (self.clock.now() - account.fuel_read_at) / 3600
+        return int(min(max(account.fuel, self.max_fuel),
+                       account.fuel + regained))
+
+    def _changed(self):
+        """Marks the rendered screen as outdated"""
+        self._version += 1
+
+    def _update(self):
+        """Shows the next screen once the loading screen is done"""
+        if self._loading and self.clock.now() >= self._loading[0]:
+            self._stack = self._loading[1]
+            self._loading = None
+            self._changed()
+
+    def _load(self, duration: float, stack: List[str]):
+        """Shows the loading screen, then the given screens"""
+        self._loading = (self.clock.now() + duration, stack)
+        self._arrow = None
+        self._changed()
+
+    def _push(self, screen: str):
+        self._stack.append(screen)
+        self._changed()
+
+    def _replace(self, screen: str):
+        self._stack[-1] = screen
+        self._changed()
+
+    def _pop(self):
+        if len(self._stack) > 1:
+            self._stack.pop()
+        self._arrow = None
+        self._changed()
+
+    def _arrow_visible(self) -> bool:
+        return self._arrow is not None and \
+            self.clock.now() - self._arrow[2] <= self.arrow_duration
+
+    def _zombie_box(self) -> Coordinates:
+        """Returns where the zombie the arrow points at is clicked"""
+        x, y, _ = self._arrow
+        a_h, a_w = self._images["arrow"].shape[:2]
+        return Coordinates(x - 30, y + a_h + 60, x + a_w + 80,
+                           y + a_h + 180)
+
+    def home(self):
+        """Goes to the android home screen"""
+        self.stats["keys"] += 1
+        self._loading = None
+        self._stack = [ANDROID_HOME] + \
+            (self._stack if self._launched else [])
+        self._changed()
+
+    def back(self):
+        """Goes back one view"""
+        self.stats["keys"] += 1
+        screen = self.screen
+        if screen == LOADING or screen == ANDROID_HOME:
+            return
+        if screen in (HOME_INSIDE, HOME_OUTSIDE):
+            self._push(EXIT_DIALOG)
+            return
+        self._pop()
+
+    def click(self, x: int, y: int):
+        """Clicks on a point of the game screen"""
+        self.stats["clicks"] += 1
+        screen = self.screen
+        handler = getattr(self, "_click_" + screen.replace("-", "_"), None)
+        if handler:
+            handler(x, y)
+
+    def _click_android_home(self, x: int, y: int):
+        if not _inside(LAUNCH_BUTTON, x, y):
+            return
+        if self._launched:
+            self._pop()
+            return
+        self._launched = True
+        self._stack = [HOME_INSIDE]
+        self._load(self.launch_time, [HOME_INSIDE, REWARDS])
+
+    def _click_rewards(self, x: int, y: int):
+        if _inside(CLAIM_BUTTON, x, y):
+            self._replace(REWARDS_CLAIMED)
+
+    def _click_rewards_claimed(self, x: int, y: int):
+        self._pop()
+
+    def _click_menu(self, x: int, y: int) -> bool:
+        """Handles the bottom menu buttons shared by the home screens"""
+        if _inside(ALLIANCE_BUTTON, x, y):
+            self._push(ALLIANCE)
+        elif _inside(MY_INFO_BUTTON, x, y):
+            self._push(MY_INFO)
+        else:
+            return False
+        return True
+
+    def _click_home_inside(self, x: int, y: int):
+        if _inside(VIEW_BUTTON, x, y):
+            self._replace(HOME_OUTSIDE)
+        else:
+            self._click_menu(x, y)
+
+    def _click_home_outside(self, x: int, y: int):
+        if _inside(VIEW_BUTTON, x, y):
+            self._replace(HOME_INSIDE)
+        elif _inside(RADAR_BUTTON, x, y):
+            self._push(RADAR)
+        else:
+            self._click_menu(x, y)
+
+    def _click_exit_dialog(self, x: int, y: int):
+        if not _inside(EXIT_PANEL, x, y):
+            self._pop()
+
+    def _click_radar(self, x: int, y: int):
+        account = self.account
+        if _inside(RADAR_TABS, x, y):
+            self._radar_tab = x // (RADAR_TABS.end_x // 6) + 1
+            self._arrow = None
+            self._changed()
+        elif y < RADAR_PANEL.start_y:
+            if self._arrow_visible() and \
+                    _inside(self._zombie_box(), x, y):
+                self._replace(ZOMBIE_POPUP)
+            else:
+                self._pop()
+        elif self._radar_tab != ZOMBIE_TAB:
+            return
+        elif _inside(DECREASE_BUTTON, x, y):
+            account.zombie_level = max(1, account.zombie_level - 1)
+            self._changed()
+        elif _inside(INCREASE_BUTTON, x, y):
+            account.zombie_level = min(account.max_level,
+                                       account.zombie_level + 1)
+            self._changed()
+        elif _inside(GO_BUTTON, x, y):
+            self._arrow = None
+            if self.random.random() >= self.miss_chance:
+                self._arrow = (self.random.randint(260, 420),
+                               self.random.randint(330, 480),
+                               self.clock.now())
+            self._changed()
+
+    def _click_zombie_popup(self, x: int, y: int):
+        if _inside(ATTACK_BUTTON, x, y):
+            self._set_out_time = self.random.randint(*self.travel_time)
+            self._replace(SET_OUT)
+
+    def _click_set_out(self, x: int, y: int):
+        if _inside(FLEETS_BAR, x, y):
+            self._fleet_id = min(7, (x - FLEETS_BAR.start_x) // 45 + 1)
+        elif _inside(SET_OUT_BUTTON, x, y):
+            self._dispatch()
+            self._pop()
+
+    def _dispatch(self):
+        """Sends the selected fleet out to the zombie"""
+        account, now = self.account, self.clock.now()
+        fuel = self.fuel()
+        if account.fleet_returns.get(self._fleet_id, now) > now or \
+                fuel < 10:
+            self.stats["rejected"] += 1
+            return
+        account.fuel, account.fuel_read_at = fuel - 10, now
+        account.fleet_returns[self._fleet_id] = \
+            now + self._set_out_time * 2 + self.attack_duration
+        self.stats["dispatches"] += 1
+
+    def _click_my_info(self, x: int, y: int):
+        if _inside(SETTINGS_TAB, x, y):
+            self._push(SETTINGS)
+
+    def _click_settings(self, x: int, y: int):
+        if _inside(SWITCH_BUTTON, x, y):
+            self._push(SWITCH_ACCOUNT)
+
+    def _click_switch_account(self, x: int, y: int):
+        if _inside(LOGIN_BUTTON, x, y):
+            self._push(ACCOUNTS_MINI)
+
+    def _click_accounts_mini(self, x: int, y: int):
+        if _inside(MORE_ACCOUNTS, x, y):
+            self._push(ACCOUNTS_FULL)
+
+    def _click_accounts_full(self, x: int, y: int):
+        if not _inside(ACCOUNT_ROWS, x, y):
+            return
+        index = (y - ACCOUNT_ROWS.start_y) // ACCOUNT_ROW_HEIGHT
+        if index < len(self.accounts):
+            self._chosen = self.accounts[index]
+            self._push(ACCOUNT_CONTINUE)
+
+    def _click_account_continue(self, x: int, y: int):
+        if _inside(CONTINUE_BUTTON, x, y):
+            self._push(CHARACTERS)
+
+    def _click_characters(self, x: int, y: int):
+        # every account holds one character
+        if _inside(CHARACTER_ROWS, x, y) and \
+                y < CHARACTER_ROWS.start_y + CHARACTER_ROW_HEIGHT and \
+                self._chosen is not self.account:
+            self._push(CONFIRM)
+
+    def _click_confirm(self, x: int, y: int):
+        if _inside(CANCEL_BUTTON, x, y):
+            self._pop()
+        elif _inside(CONFIRM_BUTTON, x, y):
+            self.account = self._chosen
+            self.stats["switches"] += 1
+            self._stack = [HOME_INSIDE]
+            self._load(self.switch_time, [HOME_INSIDE, REWARDS])
+
+    def render(self) -> np.ndarray:
+        """Returns the game screen, reused until the game state changes"""
+        screen = self.screen
+        now = self.clock.now()
+        key = (self._version, self.fuel(), self._arrow_visible(),
+               # the loading screen pulses twice a second
+               round(now * 5) if screen == LOADING else None)
+        if key != self._frame_key:
+            self._frame = self._render(screen, now)
+            self._frame_key = key
+            self.stats["renders"] += 1
+        return self._frame
+
+    def _render(self, screen: str, now: float) -> np.ndarray:
+        images = self._images
+        if screen == LOADING:
+            # a triangle wave, so the screen never looks settled
+            phase = abs((now % 1.0) - 0.5) * 2
+            return cv.convertScaleAbs(images["loading"], alpha=1.0,
+                                      beta=-60 * phase)
+        if screen == ANDROID_HOME:
+            return self._render_android_home()
+        if screen in (HOME_INSIDE, REWARDS, REWARDS_CLAIMED, EXIT_DIALOG,
+                      ALLIANCE, MY_INFO):
+            image = self._render_home(self._stack[0] == HOME_OUTSIDE)
+        elif screen in (RADAR, ZOMBIE_POPUP, SET_OUT, HOME_OUTSIDE):
+            image = self._render_home(True)
+        else:
+            # the account screens are light, like the android ones
+            image = np.full((SCREEN_HEIGHT, SCREEN_WIDTH, 3),
+                            DARK if screen == SWITCH_ACCOUNT else LIGHT,
+                            dtype=np.uint8)
+        getattr(self, "_render_" + screen.replace("-", "_"),
+                lambda _: None)(image)
+        return image
+
+    def _render_android_home(self) -> np.ndarray:
+        image = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+        image[:] = np.linspace(90, 20, SCREEN_HEIGHT, dtype=np.uint8)[
+            :, None, None] * np.array([1, 0.6, 0.3])
+        icon = self._images["app-icon"]
+        _paste(image, icon, (SCREEN_WIDTH - icon.shape[1]) // 2,
+               LAUNCH_BUTTON.start_y + 20)
+        _text(image, "Age of Origins", Coordinates(
+            LAUNCH_BUTTON.start_x, LAUNCH_BUTTON.end_y - 60,
+            LAUNCH_BUTTON.end_x, LAUNCH_BUTTON.end_y))
+        return image
+
+    def _render_home(self, outside: bool) -> np.ndarray:
+        images = self._images
+        if not outside:
+            image = images["city"].copy()
+            _paste(image, images["city-icon"], VIEW_ICON.start_x,
+                   VIEW_ICON.start_y)
+            return image
+        image = images["outside"].copy()
+        _paste(image, images["outside-icon"], VIEW_ICON.start_x,
+               VIEW_ICON.start_y)
+        _paste(image, images["radar"], RADAR_BUTTON.start_x,
+               RADAR_BUTTON.start_y)
+        # the fuel next to the mobility icon
+        _fill(image, FUEL_PLATE, DARK)
+        _paste(image, images["mobility"], MOBILITY_ICON.start_x,
+               MOBILITY_ICON.start_y)
+        cv.putText(image, str(self.fuel()), (MOBILITY_ICON.end_x + 12, 50),
+                   FONT, 0.8, WHITE, 2, cv.LINE_AA)
+        return image
+
+    @staticmethod
+    def _dim(image: np.ndarray):
+        image[:] = image // 2
+
+    def _render_rewards(self, image: np.ndarray):
+        self._dim(image)
+        panel = Coordinates(80, 400, 615, 1000)
+        _fill(image, panel, PANEL)
+        _text(image, "Daily Rewards", Coordinates(80, 430, 615, 500), 1.2)
+        _button(image, CLAIM_BUTTON, "Claim", (40, 140, 60))
+
+    def _render_rewards_claimed(self, image: np.ndarray):
+        self._dim(image)
+        _fill(image, Coordinates(80, 500, 615, 640), PANEL)
+        _text(image, "Rewards collected", Coordinates(80, 500, 615, 640))
+
+    def _render_exit_dialog(self, image: np.ndarray):
+        self._dim(image)
+        _fill(image, EXIT_PANEL, PANEL)
+        _text(image, "Exit", Coordinates(60, 470, 635, 540), 1.6,
+              thickness=3)
+        _text(image, "Leave the game?", Coordinates(60, 560, 635, 620),
+              0.9, (200, 200, 200))
+
+    def _render_radar(self, image: np.ndarray):
+        images = self._images
+        _fill(image, RADAR_PANEL, PANEL)
+        width = RADAR_TABS.end_x // 6
+        for index, farm in enumerate(images["farms"]):
+            _paste(image, cv.resize(farm, (70, 70)), index * width + 22,
+                   RADAR_TABS.start_y + 10)
+        cv.circle(image, (5 * width + width // 2, RADAR_TABS.start_y + 45),
+                  34, (40, 40, 150), -1)
+        if self._radar_tab != ZOMBIE_TAB:
+            return
+        account = self.account
+        _text(image, str(account.zombie_level), LEVEL_TEXT, 1.0)
+        _paste(image, images["decrease"], DECREASE_BUTTON.start_x,
+               DECREASE_BUTTON.start_y)
+        _paste(image, images["increase"], INCREASE_BUTTON.start_x,
+               INCREASE_BUTTON.start_y)
+        _paste(image, images["go"], GO_BUTTON.start_x, GO_BUTTON.start_y)
+        _fill(image, MAX_LEVEL_PLATE, (190, 190, 190))
+        _text(image, str(account.max_level), MAX_LEVEL_PLATE, 0.9,
+              (20, 20, 20))
+        if self._arrow_visible():
+            x, y, _ = self._arrow
+            _paste(image, images["arrow"], x, y)
+            zombie = self._zombie_box()
+            cv.ellipse(image, ((zombie.start_x + zombie.end_x) // 2,
+                               (zombie.start_y + zombie.end_y) // 2),
+                       (40, 55), 0, 0, 360, (30, 40, 110), -1)
+
+    def _render_zombie_popup(self, image: np.ndarray):
+        _fill(image, ZOMBIE_POPUP_PANEL, PANEL)
+        _text(image, f"Zombie Lv.{self.account.zombie_level}",
+              Coordinates(120, 700, 575, 750))
+        _paste(image, self._images["attack"], ATTACK_BUTTON.start_x,
+               ATTACK_BUTTON.start_y)
+
+    def _render_set_out(self, image: np.ndarray):
+        self._dim(image)
+        _fill(image, Coordinates(150, 130, 545, 220), PANEL)
+        _paste(image, self._images["fleets"], FLEETS_BAR.start_x,
+               FLEETS_BAR.start_y)
+        _fill(image, SET_OUT_PANEL, PANEL)
+        minutes, seconds = divmod(self._set_out_time, 60)
+        _text(image, f"{minutes:02d}:{seconds:02d}", SET_OUT_TIME, 0.65,
+              (200, 200, 200))
+        _paste(image, self._images["setout"], SET_OUT_BUTTON.start_x,
+               SET_OUT_BUTTON.start_y)
+
+    def _render_alliance(self, image: np.ndarray):
+        self._dim(image)
+        _fill(image, Coordinates(0, 60, 695, 1042), PANEL)
+        _text(image, "Alliance", Coordinates(0, 80, 695, 150), 1.2)
+        _text(image, "Members", Coordinates(0, 500, 695, 560))
+
+    def _render_my_info(self, image: np.ndarray):
+        _fill(image, Coordinates(0, 60, 695, 1157), PANEL)
+        _text(image, self.account.nickname, Coordinates(0, 80, 695, 150),
+              1.2)
+        for index, label in enumerate(("Profile", "Rank", "Items",
+                                       "Settings")):
+            _button(image, Coordinates(index * 173 + 4, 1046,
+                                       index * 173 + 169, 1153),
+                    label, (60, 60, 60), 0.8)
+
+    def _render_settings(self, image: np.ndarray):
+        _text(image, "Settings", Coordinates(0, 80, 695, 150), 1.2, INK)
+        _button(image, SWITCH_BUTTON, "Switch Account", (215, 215, 215),
+                color=INK)
+
+    def _render_switch_account(self, image: np.ndarray):
+        _text(image, "Switch Account", Coordinates(0, 80, 695, 150), 1.2)
+        _button(image, LOGIN_BUTTON, "Login", (40, 140, 60))
+
+    def _render_accounts_mini(self, image: np.ndarray):
+        self._render_switch_account(image)
+        _fill(image, Coordinates(0, 860, 695, 1157), (235, 235, 235))
+        _text(image, self.account.email, Coordinates(0, 880, 695, 940),
+              0.8, INK)
+        _text(image, "More accounts", MORE_ACCOUNTS, 0.8, (150, 95, 40))
+
+    def _render_accounts_full(self, image: np.ndarray):
+        _text(image, "Choose an account", Coordinates(0, 40, 695, 100),
+              1.0, INK)
+        for index, account in enumerate(self.accounts):
+            top = ACCOUNT_ROWS.start_y + index * ACCOUNT_ROW_HEIGHT
+            if top + ACCOUNT_ROW_HEIGHT > ACCOUNT_ROWS.end_y:
+                break
+            _text(image, account.nickname, Coordinates(
+                ACCOUNT_ROWS.start_x, top + 10, ACCOUNT_ROWS.end_x,
+                top + 55), 1.0, INK)
+            _text(image, account.email, Coordinates(
+                ACCOUNT_ROWS.start_x, top + 55, ACCOUNT_ROWS.end_x,
+                top + 95), 0.7, (90, 90, 90))
+
+    def _render_account_continue(self, image: np.ndarray):
+        _text(image, self._chosen.email, Coordinates(0, 400, 695, 460),
+              0.8, INK)
+        _button(image, CONTINUE_BUTTON,
+                f"Continue as {self._chosen.nickname}", (215, 215, 215),
+                color=(150, 70, 20))
+
+    def _render_characters(self, image: np.ndarray):
+        _text(image, "Characters", Coordinates(0, 200, 695, 270), 1.2,
+              INK)
+        _button(image, Coordinates(
+            CHARACTER_ROWS.start_x, CHARACTER_ROWS.start_y,
+            CHARACTER_ROWS.end_x,
+            CHARACTER_ROWS.start_y + CHARACTER_ROW_HEIGHT),
+            self._chosen.name, (215, 215, 215), color=INK)
+
+    def _render_confirm(self, image: np.ndarray):
+        self._render_characters(image)
+        self._dim(image)
+        _fill(image, CONFIRM_PANEL, PANEL)
+        _text(image, f"Switch to {self._chosen.name}?",
+              Coordinates(60, 500, 635, 570), 0.9)
+        _button(image, CANCEL_BUTTON, "Cancel", (60, 60, 160))
+        _button(image, CONFIRM_BUTTON, "Confirm", (40, 140, 60))
+
+
+class SyntheticCapture(CaptureBackend):
+    """
+    Captures the synthetic game screen, as the emulator window at an
+    origin of a black monitor.
+
+    :param SyntheticGame game: The game
+    :param origin: The monitor position of the top left of the game screen
+    :param monitor: The monitor width and height
+    """
+
+    def __init__(self, game: SyntheticGame, origin: Tuple[int, int],
+                 monitor: Tuple[int, int] = (1920, 1200)):
+        self.game = game
+        self.origin = origin
+        self.monitor = monitor
+        self.grabs = 0
+
+    @property
+    def window(self) -> Coordinates:
+        """Returns the monitor coordinates of the game screen"""
+        x, y = self.origin
+        return Coordinates(x, y, x + SCREEN_WIDTH, y + SCREEN_HEIGHT)
+
+    def grab(self, region: Optional[Coordinates] = None) -> np.ndarray:
+        self.grabs += 1
+        region = region or Coordinates(0, 0, *self.monitor)
+        image = np.zeros((region.end_y - region.start_y,
+                          region.end_x - region.start_x, 3), dtype=np.uint8)
+        window = self.window
+        start_x, start_y = max(region.start_x, window.start_x), \
+            max(region.start_y, window.start_y)
+        end_x, end_y = min(region.end_x, window.end_x), \
+            min(region.end_y, window.end_y)
+        if start_x < end_x and start_y < end_y:
+            image[start_y - region.start_y:end_y - region.start_y,
+                  start_x - region.start_x:end_x - region.start_x] = \
+                self.game.render()[start_y - window.start_y:
+                                   end_y - window.start_y,
+                                   start_x - window.start_x:
+                                   end_x - window.start_x]
+        return image
+
+
+class SyntheticInput:
+    """
+    The input backend of the synthetic game. Provides the pyautogui
+    functions the mouse and keyboard controllers use, and sends the clicks
+    and keys to the game.
+
+    :param SyntheticGame game: The game
+    :param origin: The monitor position of the top left of the game screen
+    """
+
+    def __init__(self, game: SyntheticGame, origin: Tuple[int, int]):
+        self.game = game
+        self.origin = origin
+        self._x, self._y = 0, 0
+
+    def moveTo(self, x: int, y: int, *args, **kwargs):
+        self._x, self._y = int(x), int(y)
+
+    def move(self, dx: int, dy: int, *args, **kwargs):
+        self._x, self._y = self._x + int(dx), self._y + int(dy)
+
+    def position(self) -> Point:
+        return Point(self._x, self._y)
+
+    def click(self, clicks: int = 1, *args, **kwargs):
+        for _ in range(clicks):
+            self.game.click(self._x - self.origin[0],
+                            self._y - self.origin[1])
+
+    def drag(self, x: int, y: int, *args, **kwargs):
+        self.move(x, y)
+
+    def hotkey(self, *keys: str, **kwargs):
+        if keys == ('ctrl', 'shift', '1'):
+            self.game.home()
+
+    def press(self, key: str, *args, **kwargs):
+        if key == 'esc':
+            self.game.back()
+
+    def write(self, message: str, *args, **kwargs):
+        pass
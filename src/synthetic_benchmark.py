@@ -0,0 +1,147 @@
+"""
+Runs the bot end to end against the synthetic game, headlessly and on a
+VirtualClock, and reports where the wall time goes. The game is launched
+from the android home screen, then run_all_profiles runs its profile
+cycles with the reload wait between them, like main.py does. Pass
+--scheduler to let the ProfileScheduler pick the visits instead.
+
+The real template matching and OCR engines are used, so the wall time per
+profile visit tracks the perception and decision latency of the bot from
+commit to commit. The OCR engine needs tesseract, pass --tessdata for the
+in-process engine when the tessdata directory is not the Windows default.
+Pass --record to also record the run into a session file, which
+session_replay.py replays offline.
+Run from the `src` directory like the other demo scripts:
+
+    python synthetic_benchmark.py --profiles 3 --cycles 2
+"""
+import argparse
+import dataclasses
+import tempfile
+import time
+from pathlib import Path
+
+from src.clock import VirtualClock, set_clock
+from src.game_launcher import GameLauncher
+from src.glyphs import GlyphRecognizer, set_recognizer
+from src.listener import MouseController, KeyboardController, \
+    set_input_backend
+from src.main import run_all_profiles
+from src.ocr import TesserocrEngine, get_engine, set_engine
+from src.profile import GameProfile, PlayerProfile
+from src.radar import Radar
+from src.scheduler import ProfileScheduler
+from src.session import SessionRecorder
+from src.synthetic import SyntheticGame, SyntheticCapture, SyntheticInput
+from src.timings import StageTimer
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--profiles", type=int, default=3)
+parser.add_argument("--cycles", type=int, default=2,
+                    help="the run_all_profiles calls")
+parser.add_argument("--fleets", type=str, default="1,2",
+                    help="the zombie fleets of every profile")
+parser.add_argument("--level", type=int, default=12,
+                    help="the zombie level of every profile")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--reload-time", type=float, default=3600,
+                    help="the wait between the profile cycles in secs")
+parser.add_argument("--scheduler", action="store_true",
+                    help="run the cycles with the ProfileScheduler")
+parser.add_argument("--miss-chance", type=float, default=0.0)
+parser.add_argument("--tessdata", type=str, default=None)
+parser.add_argument("--record", type=str, default=None,
+                    help="the session file to record the run into")
+parser.add_argument("--verbose", action="store_true")
+args = parser.parse_args()
+
+profiles = [PlayerProfile(
+    name=f"profile{index}", email=f"hunter{index}@example.com",
+    nickname=f"Hunter{index}", farming_type=1, farming_level=1,
+    zombie_level=args.level,
+    zombie_fleets=[int(fleet) for fleet in args.fleets.split(",")],
+    attack_zombies=1, enable_farming=0)
+    for index in range(1, args.profiles + 1)]
+
+timer = StageTimer()
+clock = VirtualClock()
+set_clock(clock)
+game = SyntheticGame(profiles, seed=args.seed, miss_chance=args.miss_chance)
+origin = (600, 20)
+game_capture = SyntheticCapture(game, origin)
+capture = game_capture
+input_backend = SyntheticInput(game, origin)
+recorder = None
+if args.record:
+    recorder = SessionRecorder(args.record)
+    # the replay needs the game window and the profiles
+    recorder.note("app_coordinates", game_capture.window)
+    recorder.note("reload_time",
+                  None if args.scheduler else args.reload_time)
+    recorder.note("profiles", [dataclasses.asdict(profile)
+                               for profile in profiles])
+    capture = recorder.capture(capture)
+    input_backend = recorder.record_input(input_backend)
+set_input_backend(input_backend)
+set_engine(timer.engine(TesserocrEngine(args.tessdata) if args.tessdata
+                        else get_engine()))
+# nothing learned by earlier runs is reused
+set_recognizer(GlyphRecognizer())
+cache_dir = Path(tempfile.mkdtemp(prefix="synthetic-"))
+GameLauncher.cache_file = cache_dir.joinpath("game_cache.txt")
+GameLauncher.calibration_file = cache_dir.joinpath("game_calibration.txt")
+GameLauncher.screen_states_file = cache_dir.joinpath("screen_states.npz")
+GameLauncher.coordinates_file = cache_dir.joinpath("ui_coordinates.json")
+Radar.reset()
+GameProfile.reset()
+
+launcher = GameLauncher(MouseController(), KeyboardController(),
+                        cache=True, enable_debug=args.verbose,
+                        capture_factory=lambda: capture)
+for method in ("find_target", "classify_screen", "wait_until_stable"):
+    timer.wrap(launcher, method)
+
+started = time.perf_counter()
+launcher.start_game(game_capture.window)
+launched = time.perf_counter() - started
+launched_at = clock.now()
+print(f"game launched in {launched:.2f} s, {launched_at:.0f} s of game "
+      f"time")
+
+scheduler = ProfileScheduler(profiles) if args.scheduler else None
+errors = []
+cycles_started = time.perf_counter()
+for cycle in range(args.cycles):
+    if cycle and not scheduler:
+        clock.sleep(args.reload_time)
+    flag_bot, cycle_errors = run_all_profiles(
+        launcher, GameProfile(launcher), profiles, scheduler)
+    errors += [(name, error[1]) for name, error in cycle_errors.items()]
+    if flag_bot:
+        break
+visits = (cycle + 1) * len(profiles)
+elapsed = time.perf_counter() - started
+game_hours = (clock.now() - launched_at) / 3600
+
+print(f"\n{'profile visits':<24}{visits:>12}")
+print(f"{'errors':<24}{len(errors):>12}")
+for name, message in errors:
+    print(f"  {name}: {message}")
+print(f"{'game hours':<24}{game_hours:>12.2f}")
+print(f"{'dispatches':<24}{game.stats['dispatches']:>12}")
+print(f"{'dispatches/h':<24}"
+      f"{game.stats['dispatches'] / max(game_hours, 1e-6):>12.2f}")
+print(f"{'rejected dispatches':<24}{game.stats['rejected']:>12}")
+print(f"{'profile switches':<24}{game.stats['switches']:>12}")
+print(f"{'clicks':<24}{game.stats['clicks']:>12}")
+print(f"{'screen captures':<24}{game_capture.grabs:>12}")
+print(f"{'wall time (s)':<24}{elapsed:>12.2f}")
+print(f"{'wall time/visit (s)':<24}"
+      f"{(time.perf_counter() - cycles_started) / visits:>12.2f}")
+if recorder:
+    recorder.close()
+    print(f"{'recorded frames':<24}{recorder.stats['frames']:>12}")
+    print(f"{'unique frames':<24}{recorder.stats['unique_frames']:>12}")
+    print(f"{'session size (kB)':<24}"
+          f"{recorder.stats['bytes'] / 1024:>12.1f}")
+timer.report()
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of the template loading cost paid by every find_target call.
+
+Compares reading the template folders from disk (the old behaviour of
+GameLauncher.target_templates) against the in-memory TemplateRegistry.
+Run from the `src` directory like the other demo scripts.
+"""
+import time
+from pathlib import Path
+
+import cv2 as cv
+
+from src.templates import TemplateRegistry
+
+cwd = Path(__file__).cwd()
+rounds = 20
+
+template_dirs = [cwd.joinpath("data", "app")] + sorted(
+    path for path in cwd.joinpath("data", "game").iterdir() if path.is_dir())
+
+
+def load_from_disk(directory: Path):
+    """Loads the templates the way target_templates used to"""
+    return [cv.imread(str(image_path), cv.IMREAD_COLOR)
+            for image_path in directory.glob('template_*.png')]
+
+
+def timed(func, *args) -> float:
+    """Returns the average time of a call in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(*args)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+registry = TemplateRegistry()
+start = time.perf_counter()
+registry.preload(str(path) for path in template_dirs)
+print(f"Preloading {len(template_dirs)} folders took "
+      f"{(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+print(f"{'target':<24}{'disk (ms)':>12}{'registry (ms)':>16}"
+      f"{'saved (ms)':>14}")
+total_disk, total_memory = 0.0, 0.0
+for path in template_dirs:
+    disk_time = timed(load_from_disk, path)
+    memory_time = timed(registry.get, str(path))
+    total_disk += disk_time
+    total_memory += memory_time
+    print(f"{path.name:<24}{disk_time:>12.3f}{memory_time:>16.4f}"
+          f"{disk_time - memory_time:>14.3f}")
+
+print(f"\nAverage saved per find_target call: "
+      f"{(total_disk - total_memory) / len(template_dirs):.3f} ms")
+
+registry.reload_on_mtime = True
+mtime_time = sum(timed(registry.get, str(path)) for path in template_dirs)
+print(f"Average registry lookup with reload_on_mtime: "
+      f"{mtime_time / len(template_dirs):.4f} ms")
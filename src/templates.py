@@ -0,0 +1,177 @@
+"""In-memory registry of the decoded template images"""
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from src.helper import GameHelper, singleton
+
+
+class TemplateSet(list):
+    """
+    A list of decoded templates loaded from a single template folder.
+
+    :param str directory: The folder the templates were loaded from
+    :param float mtime: The latest modification time seen in the folder
+    :param float scale: The factor the templates were rescaled by
+    """
+
+    def __init__(self, directory: str, templates: List[np.ndarray],
+                 mtime: float, scale: float = 1.0):
+        super().__init__(templates)
+        self.directory = directory
+        self.mtime = mtime
+        self.scale = scale
+        self._descriptors: Dict[Tuple[int, bool], np.ndarray] = {}
+        # the downsampled templates of the pyramid matcher, keyed by the
+        # id of the template and the pyramid level
+        self.pyramids: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @property
+    def calibrated(self) -> bool:
+        """Checks if the templates were rescaled to the emulator size"""
+        return self.scale != 1.0
+
+    def descriptor(self, template: np.ndarray,
+                   rgb_channel: bool) -> np.ndarray:
+        """
+        Returns the HOG descriptor of one of the templates, calculated on
+        first use only.
+
+        :param template: A template of the set
+        :param rgb_channel: Describe the colour channels
+        """
+        key = (id(template), rgb_channel)
+        descriptor = self._descriptors.get(key)
+        if descriptor is None:
+            descriptor = GameHelper.calculate_hog(template, rgb_channel)
+            descriptor.setflags(write=False)
+            self._descriptors[key] = descriptor
+        return descriptor
+
+
+@singleton
+class TemplateRegistry:
+    """
+    A process wide cache of the template images. Every template folder is
+    decoded once and the same read-only arrays are handed out afterwards.
+
+    :param bool reload_on_mtime: Reload a folder when any of its templates
+        changed on disk since it was loaded.
+    """
+    IMG_COLOR = cv.IMREAD_COLOR
+
+    def __init__(self, reload_on_mtime: bool = False):
+        self.reload_on_mtime = reload_on_mtime
+        self._templates: Dict[str, TemplateSet] = {}
+        self._scaled: Dict[Tuple[str, float], TemplateSet] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _template_files(directory: str) -> List[Path]:
+        """Returns all the template files found in the directory"""
+        templates_path = Path(directory)
+        if not templates_path.is_dir():
+            raise Exception("Only directory are allowed")
+        return sorted(templates_path.glob('template_*.png'))
+
+    @staticmethod
+    def _latest_mtime(directory: str, files: List[Path]) -> float:
+        """Returns the most recent modification time of a template folder"""
+        return max([Path(directory).stat().st_mtime] +
+                   [file.stat().st_mtime for file in files])
+
+    def _load(self, directory: str) -> TemplateSet:
+        """Reads and decodes all the templates in the directory"""
+        files = self._template_files(directory)
+        template_images = []
+        for image_path in files:
+            image = cv.imread(str(image_path), self.IMG_COLOR)
+            # the arrays are shared by every caller
+            image.setflags(write=False)
+            template_images.append(image)
+        if not template_images:
+            raise Exception("No template image found.")
+        return TemplateSet(directory, template_images,
+                           self._latest_mtime(directory, files))
+
+    def _is_stale(self, template_set: TemplateSet) -> bool:
+        """Checks if the templates on disk are newer than the loaded ones"""
+        files = self._template_files(template_set.directory)
+        if len(files) != len(template_set):
+            return True
+        return self._latest_mtime(template_set.directory, files) > \
+            template_set.mtime
+
+    def get(self, directory: str) -> TemplateSet:
+        """
+        Returns the decoded templates of a folder, loading them on first
+        use.
+
+        :param directory: The template folder
+        :return: The shared list of templates
+        """
+        directory = str(directory)
+        template_set = self._templates.get(directory)
+        if template_set is not None and not (
+                self.reload_on_mtime and self._is_stale(template_set)):
+            return template_set
+        with self._lock:
+            template_set = self._load(directory)
+            self._templates[directory] = template_set
+        return template_set
+
+    def get_scaled(self, directory: str, scale: float) -> TemplateSet:
+        """
+        Returns a copy of the folder templates rescaled by the given factor.
+        The rescaled copies are kept until the folder itself is reloaded.
+
+        :param directory: The template folder
+        :param scale: The factor to resize the templates by
+        :return: The shared list of rescaled templates
+        """
+        template_set = self.get(directory)
+        if scale == 1.0:
+            return template_set
+        scale_key = (template_set.directory, round(scale, 4))
+        scaled_set = self._scaled.get(scale_key)
+        if scaled_set is not None and scaled_set.mtime == template_set.mtime:
+            return scaled_set
+        interpolation = cv.INTER_AREA if scale < 1.0 else cv.INTER_LINEAR
+        scaled_images = []
+        for template in template_set:
+            t_h, t_w = template.shape[:2]
+            image = cv.resize(template,
+                              (max(1, round(t_w * scale)),
+                               max(1, round(t_h * scale))),
+                              interpolation=interpolation)
+            image.setflags(write=False)
+            scaled_images.append(image)
+        scaled_set = TemplateSet(template_set.directory, scaled_images,
+                                 template_set.mtime, scale)
+        self._scaled[scale_key] = scaled_set
+        return scaled_set
+
+    def preload(self, directories: Iterable[str]):
+        """Decodes all the given template folders upfront"""
+        for directory in directories:
+            self.get(directory)
+
+    def invalidate(self, directory: Optional[str] = None):
+        """
+        Drops the loaded templates so the next lookup reads them from disk
+        again.
+
+        :param directory: The folder to drop. Drops everything when omitted.
+        """
+        with self._lock:
+            if directory is None:
+                self._templates.clear()
+                self._scaled.clear()
+            else:
+                self._templates.pop(str(directory), None)
+                for scale_key in [scale_key for scale_key in self._scaled
+                                  if scale_key[0] == str(directory)]:
+                    del self._scaled[scale_key]
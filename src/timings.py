@@ -0,0 +1,68 @@
+"""Times the stages of the bot for the benchmark and replay scripts"""
+import time
+from collections import defaultdict
+
+from src.ocr import OcrEngine
+
+
+class TimedEngine(OcrEngine):
+    """Counts the calls of an OCR engine and the time they take"""
+
+    def __init__(self, engine: OcrEngine, timer: "StageTimer"):
+        self.engine = engine
+        self.timer = timer
+
+    def image_to_string(self, image, config: str = '') -> str:
+        with self.timer.time("ocr"):
+            return self.engine.image_to_string(image, config)
+
+    def image_to_data(self, image, config: str = ''):
+        with self.timer.time("ocr"):
+            return self.engine.image_to_data(image, config)
+
+
+class _Block:
+    """Adds the time of a block to the totals of a stage"""
+
+    def __init__(self, stats: dict, key: str):
+        self.stats, self.key = stats, key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *_):
+        self.stats[self.key][0] += 1
+        self.stats[self.key][1] += time.perf_counter() - self.started
+
+
+class StageTimer:
+    """Keeps the number of calls and the total wall time of every stage"""
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: [0, 0.0])
+
+    def time(self, key: str) -> _Block:
+        """Returns a context manager timing a block as a stage"""
+        return _Block(self.stats, key)
+
+    def wrap(self, obj, name: str):
+        """Times every call of a method of an object"""
+        method = getattr(obj, name)
+
+        def wrapper(*args, **kwargs):
+            with self.time(name):
+                return method(*args, **kwargs)
+
+        setattr(obj, name, wrapper)
+
+    def engine(self, engine: OcrEngine) -> TimedEngine:
+        """Returns the OCR engine, timing its calls as the ocr stage"""
+        return TimedEngine(engine, self)
+
+    def report(self):
+        """Prints the calls, total and mean time of every stage"""
+        print(f"\n{'stage':<24}{'calls':>12}{'total (s)':>12}"
+              f"{'mean (ms)':>12}")
+        for key, (calls, total) in sorted(self.stats.items()):
+            print(f"{key:<24}{calls:>12}{total:>12.2f}"
+                  f"{1000 * total / max(calls, 1):>12.1f}")
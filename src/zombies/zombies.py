@@ -1,18 +1,19 @@
 """Responsible for killing zombies in the Game event"""
-import threading
 import time
 from typing import Optional, List
 
 import cv2
 import numpy as np
 
+from src.clock import get_clock
 from src.constants import OUTSIDE_VIEW, BOTTOM_IMAGE, TOP_IMAGE, ZOMBIE_MENU
 from src.exceptions import ZombieException, RadarException
 from src.game_launcher import GameLauncher
 from src.helper import GameHelper, Coordinates, retry, click_on_target
-from src.ocr import get_text_from_image
+from src.ocr import get_text_from_image, get_digits_from_image
 from src.profile import GameProfile
 from src.radar import Radar
+from src.scheduler import FleetScheduler
 
 
 class Zombies:
@@ -59,7 +60,7 @@ class Zombies:
         self._attack_btn_cords: Optional[Coordinates] = None
         self._set_out_btn_cords: Optional[Coordinates] = None
         self.radar = Radar(self.launcher)
-        self.fleets_data = {}
+        self.fleet_scheduler = FleetScheduler()
 
     @property
     def fuel(self):
@@ -123,13 +124,12 @@ class Zombies:
                      new_x:end_x,
                      ]
         processed_image = self.process_fuel_image(fuel_image)
-        for ocr_settings in [6, 8]:
-            custom_config = r'-c tessedit_char_whitelist=0123456789 ' \
-                            fr'--oem 3 --psm {ocr_settings} '
-            # extract the fuel value
-            fuel_value = get_text_from_image(processed_image, custom_config)
-            if fuel_value:
-                break
+        custom_configs = [r'-c tessedit_char_whitelist=0123456789 '
+                          fr'--oem 3 --psm {ocr_settings} '
+                          for ocr_settings in [6, 8]]
+        # extract the fuel value
+        fuel_value = get_digits_from_image(processed_image, custom_configs,
+                                           site='fuel')
         self.launcher.log_message(f"Current fuel - {fuel_value}")
         if fuel_value:
             return int(float(fuel_value.strip()))
@@ -152,7 +152,8 @@ class Zombies:
         black_max = (65, 65, 65)
         image_processed = cv2.inRange(zombie_level_img, black_min, black_max)
         custom_config = r'-c tessedit_char_blacklist=-/\| --oem 3 --psm 6'
-        zombie_level = get_text_from_image(image_processed, custom_config)
+        zombie_level = get_digits_from_image(image_processed, custom_config,
+                                             site='zombie_max')
 
         if zombie_level:
             digits = "".join([char for char in zombie_level.strip()
@@ -180,7 +181,7 @@ class Zombies:
             self.launcher.app_coordinates)
         self.launcher.mouse.move(center)
         self.launcher.mouse.click()
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
 
     def zombie_go(self):
         """
@@ -199,6 +200,31 @@ class Zombies:
         """
         self.launcher.set_view(OUTSIDE_VIEW)
 
+    def _get_zombie_area(self, source: np.ndarray = None) -> \
+            tuple[np.ndarray, Coordinates]:
+        """
+        Returns the area of the game screen where the zombie arrow shows.
+
+        :param source: A game screen frame. Captures the screen if omitted.
+        """
+        zombie_area_image, area_cords_relative = \
+            self.launcher.get_screen_section(50, TOP_IMAGE, source)
+        zombie_area_image, area_cords_relative = \
+            self.launcher.get_screen_section(45, BOTTOM_IMAGE,
+                                             zombie_area_image,
+                                             area_cords_relative)
+        # the screen frame is shared with the frame cache
+        return zombie_area_image.copy(), area_cords_relative
+
+    @staticmethod
+    def _get_arrow_area(zombie_area_image: np.ndarray) -> np.ndarray:
+        """Blanks out everything but the middle of the zombie area"""
+        zeros = np.zeros_like(zombie_area_image)
+        t_h, t_w, _ = zombie_area_image.shape
+        zeros[:, int(0.3 * t_w):int(0.7 * t_w)] = \
+            zombie_area_image[:, int(0.3 * t_w):int(0.7 * t_w)]
+        return zeros
+
     @retry(exception=ZombieException,
            message="No zombie arrow found",
            attempts=4)
@@ -214,49 +240,38 @@ class Zombies:
         self.launcher.mouse.set_position(button.start_x, button.start_y)
         center = GameHelper.get_center(button)
         self.launcher.mouse.move(*center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
         self.launcher.mouse.click()
-        time.sleep(2)
-        # take 3 different snapshots of the zombie and run through them all
-        snapshot_data = []
-        zombie_area_image = None
-        for i in range(3):
-            zombie_area_image, area_cords_relative = \
-                self.launcher.get_screen_section(50, TOP_IMAGE)
-            zombie_area_image, area_cords_relative = \
-                self.launcher.get_screen_section(45, BOTTOM_IMAGE,
-                                                 zombie_area_image,
-                                                 area_cords_relative)
-            zombie_data = (zombie_area_image, area_cords_relative)
-            snapshot_data.append(zombie_data)
-            time.sleep(0.5)
-        zeros = np.zeros_like(zombie_area_image)
-        t_h, t_w, _ = zombie_area_image.shape
-        # now iterate through and find the best match
-        for zombie_image, area_cords in snapshot_data:
-            target_area = zombie_image[:,
-                          int(0.3 * t_w):int(0.7 * t_w)
-                          ]
-            zeros[:, int(0.3 * t_w):int(0.7 * t_w)] = target_area
-            self.launcher.log_message(
-                '-------- Finding the zombie arrow --------')
-            cords = self.launcher.find_target(
-                zeros,
-                self.launcher.target_templates('zombie-arrow'),
-                threshold=0.1
-            )
-            if cords:
-                break
+        clicked_at = time.monotonic()
+        get_clock().sleep(2)
+        stream = self.launcher.capture_stream
+        if stream:
+            # scan all the frames streamed since the click instead
+            snapshot_data = [self._get_zombie_area(frame) for _, frame in
+                             stream.frames_since(clicked_at)]
         else:
-            cv2.imwrite('../zombie-arrow-error.png', zeros)
-            raise ZombieException("No zombie arrow found")
+            # take 3 different snapshots of the zombie and run through them
+            snapshot_data = []
+            for i in range(3):
+                snapshot_data.append(self._get_zombie_area())
+                get_clock().sleep(0.5)
 
-        arrow = zeros[
-                cords.start_y:cords.end_y,
-                cords.start_x:cords.end_x
-                ]
-        # cv2.imwrite('zombie-arrow-image1.png', zeros)
-        # cv2.imwrite('zombie-arrow-image2.png', arrow)
+        self.launcher.log_message(
+            '-------- Finding the zombie arrow --------')
+        arrow_templates = self.launcher.target_templates('zombie-arrow')
+        found = self.launcher.scan_images(
+            snapshot_data,
+            lambda zombie_data: self.launcher.find_target(
+                self._get_arrow_area(zombie_data[0]),
+                arrow_templates,
+                threshold=0.1
+            ))
+        if not found:
+            if snapshot_data:
+                cv2.imwrite('../zombie-arrow-error.png',
+                            self._get_arrow_area(snapshot_data[-1][0]))
+            raise ZombieException("No zombie arrow found")
+        (_, area_cords), cords = found
 
         cords_relative = GameHelper. \
             get_relative_coordinates(area_cords, cords)
@@ -267,9 +282,27 @@ class Zombies:
                                          cords_relative.end_y + y_increase)
         self.launcher.mouse.move(1, 1)
         self.launcher.mouse.click()
-        time.sleep(0.8)
+        get_clock().sleep(0.8)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
+
+    def _find_attack_btn(self) -> Optional[Coordinates]:
+        """Searches the zombie attack button in the middle of the screen"""
+        zombie_area_image, zombie_area_cords_relative = \
+            self.launcher.get_screen_section(45, BOTTOM_IMAGE)
+        zombie_area_image, zombie_area_cords_relative = \
+            self.launcher.get_screen_section(50, TOP_IMAGE,
+                                             zombie_area_image,
+                                             zombie_area_cords_relative)
+        cords = self.launcher.find_target(
+            zombie_area_image,
+            self.launcher.target_templates('zombie-attack'),
+            threshold=0.2
+        )
+        if not cords:
+            return None
+        return GameHelper.get_relative_coordinates(
+            zombie_area_cords_relative, cords)
 
     @retry(exception=ZombieException,
            message="No zombie attack button found",
@@ -285,32 +318,19 @@ class Zombies:
         self.launcher.log_message(
             '---------- Finding attack button --------------')
         if not self._attack_btn_cords:
-            zombie_area_image, zombie_area_cords_relative = \
-                self.launcher.get_screen_section(45, BOTTOM_IMAGE)
-            zombie_area_image, zombie_area_cords_relative = \
-                self.launcher.get_screen_section(50, TOP_IMAGE,
-                                                 zombie_area_image,
-                                                 zombie_area_cords_relative)
-            cords = self.launcher.find_target(
-                zombie_area_image,
-                self.launcher.target_templates('zombie-attack'),
-                threshold=0.2
-            )
-            if not cords:
+            self._attack_btn_cords = self.launcher.find_element(
+                'zombie-attack', 'zombie-attack', self._find_attack_btn,
+                threshold=0.2)
+            if not self._attack_btn_cords:
                 raise ZombieException("No zombie attack button found")
 
-            cords_relative = GameHelper. \
-                get_relative_coordinates(
-                zombie_area_cords_relative, cords)
-            self._attack_btn_cords = cords_relative
-
         self.launcher.mouse.set_position(self._attack_btn_cords.start_x,
                                          self._attack_btn_cords.start_y)
         center = GameHelper.get_center(self._attack_btn_cords)
         self.launcher.mouse.move(center)
-        time.sleep(0.5)
+        get_clock().sleep(0.5)
         self.launcher.mouse.click()
-        time.sleep(1)
+        get_clock().sleep(1)
         # check out for potential conflict here
         # if conflict - cancel my fleet action.
         fleet_conflict = self.radar.check_fleet_conflict(0)
@@ -356,41 +376,21 @@ class Zombies:
             current_fuel = self.fuel
         return current_fuel >= target
 
-    def _initialize_fleet_data(self, fleets: list):
-        """
-        Initialize the fleet data structure
-        :param size:
-        :return:
-        """
-        for fleet_id in fleets:
-            self.fleets_data[fleet_id] = None
-
-    def _fleet_wait(self, fleet_id: int):
-        """
-        The Fleet thread used for waiting for the fleet to finish.
-        :param fleet_id: The fleet id to wait for to finish
-        :return:
-        """
-        # get the waiting time for the fleet
-        waiting_time = self.fleets_data.get(fleet_id)
-        if not waiting_time:
-            return None
-        # sleep for the waiting duration
-        time.sleep(waiting_time)
-        # reset the fleet data
-        self.fleets_data[fleet_id] = None
-
     def kill_zombies(self, level: int,
                      min_mobility: int = 10,
-                     fleets: List[int] = None):
+                     fleets: List[int] = None,
+                     wait_for_fleets: bool = True):
         """
-        Function responsible for killing zombies in the map
+        Function responsible for killing zombies in the map. Every fleet
+        is sent out again as soon as it is back from its last attack.
 
         :param fleets: The fleets to use for deployment. If non, use default
             fleet 1
         :param level: The zombie level to target
         :param min_mobility: The min mobility to stop killing zombie
-        :return:
+        :param wait_for_fleets: Waits for the fleets still out once the
+            mobility is below the minimum
+        :return: The fuel left
         """
         self.zombie_city()
         min_mobility = min_mobility if min_mobility > 10 else 10
@@ -400,59 +400,47 @@ class Zombies:
         self.launcher.log_message(
             f"------ Killing zombies at level {level} using {fleet_count} "
             "Fleets--------")
-        self._initialize_fleet_data(fleets)
-
-        global_stop = False
-        min_time = 5
-        fleet_threads = {}
+        # fleets still out from an earlier run keep their return time
+        for fleet_id in self.fleet_scheduler.returns():
+            if fleet_id not in fleets:
+                self.fleet_scheduler.remove(fleet_id)
+        for fleet_id in fleets:
+            if fleet_id not in self.fleet_scheduler:
+                self.fleet_scheduler.schedule(fleet_id)
 
         current_fuel = self.fuel
         # Track the number of times we couldn't find a zombie
         no_zombie_count = 0
-        while not global_stop:
-            for fleet_id, fleet_time in self.fleets_data.items():
-                if fleet_time:
-                    continue
-                if self._check_mobility_limit(min_mobility, current_fuel):
-                    try:
-                        waiting_time = self._kill_zombie(level, fleet_id)
-                        # reduce the current fuel by 10
-                        current_fuel = current_fuel - 10
-                        no_zombie_count = 0
-                    except (RadarException, ZombieException) as error:
-                        if str(error) in ["No zombie attack button found",
-                                          "Fleets area not found",
-                                          "Can not extract set out time",
-                                          "No zombie arrow found"]:
-                            # wait for 10 secs and try again. Also use
-                            # exponential backoff as well
-                            no_zombie_count = no_zombie_count + 1
-                            waiting_time = 10 * no_zombie_count
-                        else:
-                            raise error
-                    min_time = waiting_time if \
-                        waiting_time < min_time else min_time
-
-                    self.fleets_data[fleet_id] = waiting_time
-                    # activate the fleet_thread_waiting
-                    fleet_thread = threading.Thread(
-                        target=self._fleet_wait, args=(fleet_id,),
-                        name=f"FleetWaitThread_{fleet_id}",
-                        daemon=True)
-                    # save thread profile
-                    fleet_threads[fleet_id] = fleet_thread
-                    fleet_thread.start()
+        while self._check_mobility_limit(min_mobility, current_fuel):
+            # sleep until the next fleet is back
+            fleet_id = self.fleet_scheduler.wait()
+            try:
+                waiting_time = self._kill_zombie(level, fleet_id)
+                # reduce the current fuel by 10
+                current_fuel = current_fuel - 10
+                no_zombie_count = 0
+            except (RadarException, ZombieException) as error:
+                if str(error) in ["No zombie attack button found",
+                                  "Fleets area not found",
+                                  "Can not extract set out time",
+                                  "No zombie arrow found"]:
+                    # wait for 10 secs and try again. Also use
+                    # exponential backoff as well
+                    no_zombie_count = no_zombie_count + 1
+                    waiting_time = 10 * no_zombie_count
                 else:
-                    global_stop = True
-                    break
-            time.sleep(min_time)
+                    raise error
+            self.fleet_scheduler.schedule(fleet_id, waiting_time)
 
-        # make sure all threads have closed
-        for fleet_thread in fleet_threads.values():
-            fleet_thread.join()
+        self._fuel = current_fuel
+        if wait_for_fleets:
+            # make sure all the fleets are back
+            while self.fleet_scheduler.wait() is not None:
+                pass
 
         self.launcher.log_message(
             '------ Fuel is below minimum level -------')
+        return current_fuel
 
     def kill_elite_zombie(self):
         """Kills any available elite zombie"""
@@ -476,7 +464,7 @@ class Zombies:
             self.launcher.mouse
         )
 
-        time.sleep(3)
+        get_clock().sleep(3)
 
         # get the battle view button
         battle_area_image, area_cords_relative = \
@@ -532,11 +520,11 @@ class Zombies:
             area_cords_relative,
             self.launcher.mouse, True)
 
-        time.sleep(1.5)
+        get_clock().sleep(1.5)
 
         # deploy fleet. Use default fleet
         _ = self.radar.send_fleet(override_time=True)
-        time.sleep(2)
+        get_clock().sleep(2)
 
         # find the skip button
         if not self._skip_location:
@@ -550,14 +538,14 @@ class Zombies:
         if not self._skip_location:
             self.launcher.log_message("Skip button not found. Will wait "
                                       "for 50 secs")
-            time.sleep(50)
+            get_clock().sleep(50)
         else:
             click_on_target(
                 self._skip_location,
                 self._skip_cords_relative,
                 self.launcher.mouse, True)
 
-            time.sleep(4)
+            get_clock().sleep(4)
 
             # click on the confirm
             confirm_area_image, area_cords_relative = \
@@ -576,7 +564,7 @@ class Zombies:
                                 area_cords_relative,
                                 self.launcher.mouse)
 
-            time.sleep(7)
+            get_clock().sleep(7)
 
         if not self._okay_btn:
             # now find the okay button and click on it
@@ -592,4 +580,4 @@ class Zombies:
             click_on_target(self._okay_btn, self._okay_cords_relative,
                             self.launcher.mouse, True)
         # wait 3 secs
-        time.sleep(3)
+        get_clock().sleep(3)